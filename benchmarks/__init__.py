@@ -0,0 +1 @@
+""" Benchmarks of riscvsim, see `python -m benchmarks --help` """
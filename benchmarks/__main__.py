@@ -0,0 +1,137 @@
+""" Run the benchmark kernels and compare them against a baseline
+
+    python -m benchmarks [--translate] [--repeat N] [--scale X]
+                         [--kernel NAME ...] [--save FILE]
+                         [--baseline FILE [--threshold RATIO]]
+
+The exit status is 1 if any kernel is slower than the baseline by more
+than the threshold, in instructions per second or in decode time.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from riscvsim import InstructionFactory
+
+from .kernels import BASE, kernels
+
+DECODE_ROUNDS = 10
+DECODE_COPIES = 100
+
+
+def peak_rss():
+    """Return the peak resident set size of the process in KiB, or None."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def measure(kernel, size, repeat, translate):
+    """Run `kernel` `repeat` times and return its best result."""
+    best = None
+    for _ in range(repeat):
+        sim, end = kernel.prepare(size)
+        start = time.perf_counter()
+        steps = sim.run(until_pc=end, translate=translate)
+        elapsed = time.perf_counter() - start
+        if not kernel.verify(sim, size):
+            raise RuntimeError(f"The kernel '{kernel.name}' gave a wrong "
+                               f"result.")
+        best = elapsed if best is None else min(best, elapsed)
+
+    # the best of several rounds, each over many copies of the kernel code
+    code = sim.memory.read_bytes(BASE, end - BASE) * DECODE_COPIES
+    decode = None
+    for _ in range(DECODE_ROUNDS):
+        start = time.perf_counter()
+        InstructionFactory.decode_many(code)
+        elapsed = (time.perf_counter() - start) / (len(code) // 4)
+        decode = elapsed if decode is None else min(decode, elapsed)
+    return {
+        "instructions": steps,
+        "seconds": best,
+        "ips": steps / best,
+        "decode_ns": decode * 1e9,
+        "peak_rss_kib": peak_rss(),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Return a message for every regression of `results` over `baseline`."""
+    regressions = []
+    for name, result in results["kernels"].items():
+        base = baseline["kernels"].get(name)
+        if base is None:
+            continue
+        if result["ips"] < base["ips"] * (1 - threshold):
+            regressions.append(
+                f"{name}: {result['ips']:.0f} inst/s, "
+                f"baseline {base['ips']:.0f} inst/s")
+        if result["decode_ns"] > base["decode_ns"] * (1 + threshold):
+            regressions.append(
+                f"{name}: decode {result['decode_ns']:.0f} ns/inst, "
+                f"baseline {base['decode_ns']:.0f} ns/inst")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("--kernel", nargs="+", choices=sorted(kernels),
+                        default=list(kernels))
+    parser.add_argument("--translate", action="store_true",
+                        help="run with the basic-block translator")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="keep the best of this many runs")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="multiply the problem size of every kernel")
+    parser.add_argument("--save", metavar="FILE",
+                        help="write the results as a JSON baseline")
+    parser.add_argument("--baseline", metavar="FILE",
+                        help="compare against a JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="tolerated slowdown ratio, default 0.1")
+    args = parser.parse_args(argv)
+
+    results = {"translate": args.translate, "scale": args.scale,
+               "kernels": {}}
+    print(f"{'kernel':<12} {'instructions':>12} {'inst/s':>12} "
+          f"{'decode ns':>10} {'peak RSS KiB':>13}")
+    for name in args.kernel:
+        kernel = kernels[name]()
+        size = max(1, int(kernel.size * args.scale))
+        result = measure(kernel, size, args.repeat, args.translate)
+        results["kernels"][name] = result
+        print(f"{name:<12} {result['instructions']:>12} "
+              f"{result['ips']:>12.0f} {result['decode_ns']:>10.0f} "
+              f"{result['peak_rss_kib'] or '-':>13}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if (baseline.get("translate") != args.translate
+                or baseline.get("scale") != args.scale):
+            print("warning: the baseline was run with different options",
+                  file=sys.stderr)
+        regressions = compare(results, baseline, args.threshold)
+        for message in regressions:
+            print(f"regression: {message}")
+        if regressions:
+            return 1
+        print(f"no regression over {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+""" Benchmark kernels
+
+Every kernel is an RV64I program ending at the label `end`, together
+with how to set up its input for a given size and how to verify its
+result, so a fast but wrong simulator never passes as an improvement.
+"""
+
+import random
+import zlib
+
+from riscvsim import Simulator
+
+BASE = 0x1000
+DATA = 0x100000
+
+
+class Kernel:
+    name = None
+    text = None
+    size = None     # default problem size
+
+    def setup(self, sim, size):
+        raise NotImplementedError
+
+    def verify(self, sim, size):
+        raise NotImplementedError
+
+    def prepare(self, size=None):
+        """Return a `Simulator` ready to run and the address of `end`."""
+        sim = Simulator(pc=BASE)
+        labels = sim.assemble(self.text)
+        self.setup(sim, self.size if size is None else size)
+        return sim, labels["end"]
+
+
+class Memcpy(Kernel):
+    # copy x12 doublewords from x10 to x11
+    name = "memcpy"
+    size = 4096
+    text = r"""
+        loop:
+            beq x12, x0, end
+            ld x5, 0(x10)
+            sd x5, 0(x11)
+            addi x10, x10, 8
+            addi x11, x11, 8
+            addi x12, x12, -1
+            jal x0, loop
+        end:
+    """
+
+    def setup(self, sim, size):
+        self.data = random.Random(size).randbytes(size * 8)
+        sim.memory.write_bytes(DATA, self.data)
+        sim.x10 = DATA
+        sim.x11 = DATA + size * 8
+        sim.x12 = size
+
+    def verify(self, sim, size):
+        return sim.memory.read_bytes(DATA + size * 8, size * 8) == self.data
+
+
+class BubbleSort(Kernel):
+    # sort x11 signed doublewords at x10
+    name = "bubble_sort"
+    size = 120
+    text = r"""
+            addi x12, x11, -1
+        outer:
+            bge x0, x12, end
+            addi x13, x10, 0
+            addi x14, x12, 0
+        inner:
+            ld x5, 0(x13)
+            ld x6, 8(x13)
+            bge x6, x5, ordered
+            sd x6, 0(x13)
+            sd x5, 8(x13)
+        ordered:
+            addi x13, x13, 8
+            addi x14, x14, -1
+            blt x0, x14, inner
+            addi x12, x12, -1
+            jal x0, outer
+        end:
+    """
+
+    def setup(self, sim, size):
+        rng = random.Random(size)
+        self.values = [rng.randrange(-1 << 63, 1 << 63) for _ in range(size)]
+        sim.memory.write_bytes(DATA, b"".join(
+            _.to_bytes(8, "little", signed=True) for _ in self.values))
+        sim.x10 = DATA
+        sim.x11 = size
+
+    def verify(self, sim, size):
+        values = [sim.memory.read(DATA + i * 8, 8, signed=True)
+                  for i in range(size)]
+        return values == sorted(self.values)
+
+
+class Fibonacci(Kernel):
+    # x11 = fib(x10) mod 2**64
+    name = "fibonacci"
+    size = 20000
+    text = r"""
+            addi x11, x0, 0
+            addi x12, x0, 1
+        loop:
+            beq x10, x0, end
+            add x13, x11, x12
+            addi x11, x12, 0
+            addi x12, x13, 0
+            addi x10, x10, -1
+            jal x0, loop
+        end:
+    """
+
+    def setup(self, sim, size):
+        sim.x10 = size
+
+    def verify(self, sim, size):
+        a, b = 0, 1
+        for _ in range(size):
+            a, b = b, (a + b) & ((1 << 64) - 1)
+        return sim.x11 == a
+
+
+class Crc32(Kernel):
+    # x12 = CRC-32 of x11 bytes at x10, bit by bit
+    name = "crc32"
+    size = 1024
+    text = r"""
+            addi x12, x0, -1
+            srli x12, x12, 32
+            lui x13, 0xedb88
+            addi x13, x13, 0x320
+            slli x13, x13, 32
+            srli x13, x13, 32
+        byte:
+            beq x11, x0, done
+            lbu x5, 0(x10)
+            xor x12, x12, x5
+            addi x6, x0, 8
+        bit:
+            andi x7, x12, 1
+            srli x12, x12, 1
+            beq x7, x0, next
+            xor x12, x12, x13
+        next:
+            addi x6, x6, -1
+            bne x6, x0, bit
+            addi x10, x10, 1
+            addi x11, x11, -1
+            jal x0, byte
+        done:
+            xori x12, x12, -1
+            slli x12, x12, 32
+            srli x12, x12, 32
+        end:
+    """
+
+    def setup(self, sim, size):
+        self.data = random.Random(size).randbytes(size)
+        sim.memory.write_bytes(DATA, self.data)
+        sim.x10 = DATA
+        sim.x11 = size
+
+    def verify(self, sim, size):
+        return sim.x12 == zlib.crc32(self.data)
+
+
+kernels = {_.name: _ for _ in (Memcpy, BubbleSort, Fibonacci, Crc32)}
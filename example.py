@@ -42,7 +42,7 @@ print(sim)          # Simulator Info
                     # x30                    0 0x0000000000000000
                     # x31                    0 0x0000000000000000
                     # Memory:
-                    # 0x00001000  17 08 26 19   .. .. .. ..
+                    # 0x00001000  17 08 26 19   00 00 00 00
 
 inst = InstructionFactory.get("add x7, x5, x6")
 print(inst)         # <Instruction 0x006283b3 {'rd': 7, 'rs1': 5, 'rs2': 6}>
@@ -93,4 +93,4 @@ print(sim)          # Simulator Info
                     # x30                    0 0x0000000000000000
                     # x31                    0 0x0000000000000000
                     # Memory:
-                    # 0x00001000  17 08 26 19   .. .. .. ..
+                    # 0x00001000  17 08 26 19   00 00 00 00
@@ -3,4 +3,21 @@ from .simulator import Register
 from .simulator import Registers
 from .simulator import Memory
 from .simulator import Simulator
+from .mapped import MappedMemory
+from .profile import Profile
+from .trace import TraceWriter
+from .trace import read_trace
+from .trace import replay
+from .cache import Cache
+from .cache import CacheHierarchy
+from .predictor import StaticPredictor
+from .predictor import BimodalPredictor
+from .predictor import GsharePredictor
+from .predictor import TagePredictor
+from .predictor import BranchPredictors
+from .pipeline import Pipeline
+from .machine import Machine
+from .syscalls import ProgramExit
+from .syscalls import Syscalls
 
+from .batch import run_batch
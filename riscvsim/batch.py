@@ -0,0 +1,142 @@
+""" Batch execution
+
+Run one program against many initial states on a process pool. The
+program image is sent to every worker once, when the worker starts, and
+each run only ships its initial state in and a `BatchResult` back.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+from .simulator import Simulator
+
+
+class BatchResult:
+    """The outcome of one run of `run_batch`.
+
+    Attributes
+    ----------
+    index : int
+        The position of the initial state in `initial_states`.
+    steps : int
+        The number of executed instructions.
+    reason : str
+        Why the run stopped: "until_pc", "max_steps", "exit" for the exit
+        system call, see `Simulator.exit_code`, or the exception as
+        "<type>: <message>".
+    pc : int
+    registers : tuple of int
+        The final unsigned values of x0-x31.
+    memory_digest : str
+        `Memory.digest()` of the final memory.
+    """
+
+    __slots__ = ("index", "steps", "reason", "pc", "registers",
+                 "memory_digest")
+
+    def __init__(self, index, steps, reason, pc, registers, memory_digest):
+        self.index = index
+        self.steps = steps
+        self.reason = reason
+        self.pc = pc
+        self.registers = registers
+        self.memory_digest = memory_digest
+
+    def __repr__(self):
+        return (f"<{__class__.__name__} #{self.index} {self.reason} "
+                f"steps={self.steps} pc={self.pc:#x}>")
+
+    def __reduce__(self):
+        return (__class__, (self.index, self.steps, self.reason, self.pc,
+                            self.registers, self.memory_digest))
+
+
+def apply_state(simulator, state):
+    """Apply an initial state to `simulator`.
+
+    `state` maps register names and "pc" to values like the keywords of
+    `Simulator`, plus an optional "memory" dict of address to bytes.
+    """
+    for key, value in state.items():
+        if key == "memory":
+            for addr, data in value.items():
+                simulator.memory.write_bytes(addr, data)
+        else:
+            simulator[key] = value
+
+
+def run_state(simulator, index, state, *, max_steps, until_pc, translate):
+    # `instret` also counts the instructions of a run which raises
+    instret = simulator.instret
+    try:
+        # a malformed state only fails its own run
+        apply_state(simulator, state)
+        simulator.run(max_steps=max_steps, until_pc=until_pc,
+                      translate=translate)
+        if simulator.exit_code is not None:
+            reason = "exit"
+        elif simulator.pc == until_pc:
+            reason = "until_pc"
+        else:
+            reason = "max_steps"
+    except Exception as e:
+        reason = f"{type(e).__name__}: {e}"
+    steps = simulator.instret - instret
+    return BatchResult(index, steps, reason, simulator.pc,
+                       tuple(simulator.registers.values),
+                       simulator.memory.digest())
+
+
+# the per-process state of a worker, see `init_worker`
+worker = {}
+
+
+def init_worker(image, options):
+    pc, registers, addr_max, pages = image
+    simulator = Simulator(pc=pc)
+    simulator.registers.values[:] = registers
+    simulator.memory.addr_max = addr_max
+    simulator.memory.pages = {k: bytearray(v) for k, v in pages.items()}
+    worker["snapshot"] = simulator.snapshot()
+    worker["simulator"] = simulator
+    worker["options"] = options
+
+
+def run_worker(item):
+    index, state = item
+    simulator = worker["simulator"]
+    simulator.restore(worker["snapshot"])
+    return run_state(simulator, index, state, **worker["options"])
+
+
+def run_batch(program, initial_states, workers=None, *,
+              max_steps=None, until_pc=None, translate=True, chunksize=16):
+    """Run `program` once per initial state across a process pool.
+
+    Parameters
+    ----------
+    program : Simulator
+        Its memory, registers and pc are the starting point of every run.
+    initial_states : iterable of dict
+        Applied on top of `program` for each run, see `apply_state`.
+    workers : int, optional
+        The number of processes, default `os.cpu_count()`.
+    max_steps, until_pc, translate
+        Passed to `Simulator.run`. At least one of `max_steps` and
+        `until_pc` should be given, otherwise a run only stops on error.
+    chunksize : int, default 16
+        The number of runs sent to a worker at once.
+
+    Yields
+    ------
+    BatchResult
+        In the order of `initial_states`, as soon as they are ready.
+    """
+    memory = program.memory
+    image = (program.pc, tuple(program.registers.values), memory.addr_max,
+             memory.image())
+    options = dict(max_steps=max_steps, until_pc=until_pc,
+                   translate=translate)
+    with ProcessPoolExecutor(workers, initializer=init_worker,
+                             initargs=(image, options)) as executor:
+        yield from executor.map(run_worker, enumerate(initial_states),
+                                chunksize=chunksize)
@@ -0,0 +1,187 @@
+""" Cache hierarchy model
+
+Set `Simulator.caches` to a `CacheHierarchy` to send every instruction
+fetch to L1I and every load and store to L1D, both backed by a shared
+L2. Only the statistics are modeled: data still comes from `Memory`,
+so the model never changes what a program computes. While caches are
+set, `Simulator.run` goes instruction by instruction.
+
+A `Cache` keeps its lines in flat arrays indexed by `set * ways + way`:
+the line number as tag (-1 when invalid), a stamp for the replacement
+policy and a dirty flag, so a lookup is one `array.index` over the ways
+of a set.
+"""
+
+import random
+from array import array
+
+from .config import MASK
+from .instructions import LOAD, STORE, memory_accesses
+
+POLICIES = ("lru", "fifo", "random")
+
+
+def log2(name, value):
+    if value <= 0 or value & (value - 1):
+        raise ValueError(f"The '{name}' should be a power of 2, "
+                         f"got {value}.")
+    return value.bit_length() - 1
+
+
+class Cache:
+    """A set-associative write-back, write-allocate cache.
+
+    Parameters
+    ----------
+    size : int
+        Capacity in bytes.
+    ways : int
+        Associativity, 1 is direct-mapped.
+    line_size : int
+    policy : {"lru", "fifo", "random"}
+        How the line to evict is chosen.
+    next_level : Cache, optional
+        Where misses and write-backs go.
+    name : str
+    seed : int
+        Of the "random" policy.
+
+    Attributes
+    ----------
+    hits, misses, evictions, writebacks : int
+    """
+
+    def __init__(self, size, ways, line_size=64, policy="lru", *,
+                 next_level=None, name="cache", seed=0):
+        if policy not in POLICIES:
+            raise ValueError(f"The 'policy' should be one of {POLICIES}, "
+                             f"got {policy!r}.")
+        self.line_shift = log2("line_size", line_size)
+        sets = size // (ways * line_size)
+        log2("size // (ways * line_size)", sets)
+        self.size = size
+        self.ways = ways
+        self.line_size = line_size
+        self.policy = policy
+        self.next_level = next_level
+        self.name = name
+        self.set_mask = sets - 1
+        self.tags = array("q", [-1]) * (sets * ways)
+        self.stamps = array("Q", [0]) * (sets * ways)
+        self.dirty = bytearray(sets * ways)
+        self.random = random.Random(seed)
+        self.clock = 0
+        self.hits = self.misses = self.evictions = self.writebacks = 0
+
+    def __repr__(self):
+        return (f"<{__class__.__name__} {self.name} {self.size}B "
+                f"{self.ways}-way {self.line_size}B lines {self.policy}>")
+
+    def access(self, addr, size=1, write=False):
+        """Access `size` bytes from `addr`, return whether all lines hit."""
+        first = addr >> self.line_shift
+        last = (addr + size - 1) >> self.line_shift
+        if first == last:
+            return self.access_line(first, write)
+        hit = True
+        for line in range(first, last + 1):
+            hit &= self.access_line(line, write)
+        return hit
+
+    def access_line(self, line, write=False):
+        tags = self.tags
+        ways = self.ways
+        base = (line & self.set_mask) * ways
+        self.clock += 1
+        try:
+            i = tags.index(line, base, base + ways)
+        except ValueError:
+            pass
+        else:
+            self.hits += 1
+            if self.policy == "lru":
+                self.stamps[i] = self.clock
+            if write:
+                self.dirty[i] = 1
+            return True
+
+        self.misses += 1
+        next_level = self.next_level
+        if next_level is not None:
+            next_level.access(line << self.line_shift, self.line_size)
+        if self.policy == "random":
+            try:
+                i = tags.index(-1, base, base + ways)
+            except ValueError:
+                i = base + self.random.randrange(ways)
+        else:
+            # invalid lines have the oldest stamp, 0
+            stamps = self.stamps
+            i = min(range(base, base + ways), key=stamps.__getitem__)
+        if tags[i] != -1:
+            self.evictions += 1
+            if self.dirty[i]:
+                self.writebacks += 1
+                if next_level is not None:
+                    next_level.access(tags[i] << self.line_shift,
+                                      self.line_size, True)
+        tags[i] = line
+        self.stamps[i] = self.clock
+        self.dirty[i] = write
+        return False
+
+    def clear(self):
+        """Invalidate every line and reset the statistics."""
+        self.tags[:] = array("q", [-1]) * len(self.tags)
+        self.stamps[:] = array("Q", [0]) * len(self.stamps)
+        self.dirty[:] = bytes(len(self.dirty))
+        self.clock = 0
+        self.hits = self.misses = self.evictions = self.writebacks = 0
+
+    def as_dict(self):
+        accesses = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "writebacks": self.writebacks,
+            "miss_rate": self.misses / accesses if accesses else 0.0,
+        }
+
+
+class CacheHierarchy:
+    """L1I and L1D caches sharing an L2.
+
+    The defaults are 16 KiB 2-way L1I, 16 KiB 4-way L1D and 256 KiB
+    8-way L2, all with 64-byte lines and LRU. Pass `Cache` objects to
+    change any of them; `next_level` of the L1 caches is set to `l2`.
+    """
+
+    def __init__(self, l1i=None, l1d=None, l2=None):
+        self.l2 = l2 or Cache(256 * 1024, 8, name="L2")
+        self.l1i = l1i or Cache(16 * 1024, 2, name="L1I")
+        self.l1d = l1d or Cache(16 * 1024, 4, name="L1D")
+        self.l1i.next_level = self.l2
+        self.l1d.next_level = self.l2
+
+    def observe(self, simulator, instruction):
+        """Send the accesses of `instruction`, about to run, to the caches."""
+        self.l1i.access(simulator.pc, instruction.length)
+        access = memory_accesses.get(type(instruction))
+        if access is not None:
+            kind, size = access
+            values = simulator.registers.values
+            if kind == LOAD:
+                addr = (values[instruction.rs] + instruction.imm) & MASK
+            else:
+                addr = (values[instruction.rs1] + instruction.imm) & MASK
+            self.l1d.access(addr, size, kind == STORE)
+
+    def clear(self):
+        for cache in (self.l1i, self.l1d, self.l2):
+            cache.clear()
+
+    def as_dict(self):
+        """Return the statistics of every level by name."""
+        return {cache.name: cache.as_dict()
+                for cache in (self.l1i, self.l1d, self.l2)}
@@ -0,0 +1,202 @@
+""" Compressed (RVC) instructions
+
+`expand` turns a 16-bit parcel of the RV64C extension into the base
+instruction it stands for, e.g. `c.addi a0, 1` into `addi a0, a0, 1`.
+The result is an instance of a subclass of the base class, e.g.
+`CompressedAddiInstruction` of `AddiInstruction`, which only differs by
+`length = 2`, so the pc advances by 2 and `jal`/`jalr` link `pc + 2`,
+and by `word`, which is the parcel. `encode()` still gives the 32-bit
+expanded encoding.
+
+`InstructionFactory.decode` sends every word whose low 2 bits are not
+`0b11` here, so expansions are interned by its LRU cache and
+`Simulator.fetch` caches them per address like any other instruction.
+Floating-point loads and stores and `c.ebreak` are not supported.
+"""
+
+from . import instructions as i
+
+
+def compressed_repr(self):
+    return f"<{type(self).__name__} {self.word:0=#6x} {self.fields()}>"
+
+
+def compressed_reduce(self):
+    return expand, (self.word,)
+
+
+def decode_parcel(cls, parcel):
+    return expand(parcel)
+
+
+def make_compressed_class(cls):
+    return type(f"Compressed{cls.__name__}", (cls,), {
+        "__slots__": (),
+        "__doc__": f"A 16-bit encoding of `{cls.__name__}`.",
+        "length": 2,
+        "decode": classmethod(decode_parcel),
+        "__repr__": compressed_repr,
+        "__reduce__": compressed_reduce,
+    })
+
+
+compressed_classes = {cls: make_compressed_class(cls) for cls in (
+    i.AddiInstruction,
+    i.AddiwInstruction,
+    i.LuiInstruction,
+    i.SlliInstruction,
+    i.SrliInstruction,
+    i.SraiInstruction,
+    i.AndiInstruction,
+    i.AddInstruction,
+    i.SubInstruction,
+    i.XorInstruction,
+    i.OrInstruction,
+    i.AndInstruction,
+    i.AddwInstruction,
+    i.SubwInstruction,
+    i.LwInstruction,
+    i.LdInstruction,
+    i.SwInstruction,
+    i.SdInstruction,
+    i.BeqInstruction,
+    i.BneInstruction,
+    i.JalInstruction,
+    i.JalrInstruction,
+)}
+
+for cls, compressed in compressed_classes.items():
+    if cls in i.memory_accesses:
+        i.memory_accesses[compressed] = i.memory_accesses[cls]
+
+
+def bits(parcel, high, low):
+    return (parcel >> low) & ((1 << (high - low + 1)) - 1)
+
+
+def scatter(parcel, layout):
+    """Gather an immediate from `(high, low, shift)` fields of `parcel`."""
+    return sum(bits(parcel, high, low) << shift
+               for high, low, shift in layout)
+
+
+def reserved(parcel):
+    return ValueError(f"The parcel `{parcel:0=#6x}` is not a supported "
+                      f"compressed instruction.")
+
+
+# the immediate layouts, in bytes; `(high, low, shift)` moves parcel bits
+# high..low to bit `shift` of the immediate
+ADDI4SPN = ((12, 11, 4), (10, 7, 6), (6, 6, 2), (5, 5, 3))
+LW = ((12, 10, 3), (6, 6, 2), (5, 5, 6))
+LD = ((12, 10, 3), (6, 5, 6))
+ADDI16SP = ((12, 12, 9), (6, 6, 4), (5, 5, 6), (4, 3, 7), (2, 2, 5))
+J = ((12, 12, 11), (11, 11, 4), (10, 9, 8), (8, 8, 10), (7, 7, 6),
+     (6, 6, 7), (5, 3, 1), (2, 2, 5))
+B = ((12, 12, 8), (11, 10, 3), (6, 5, 6), (4, 3, 1), (2, 2, 5))
+LWSP = ((12, 12, 5), (6, 4, 2), (3, 2, 6))
+LDSP = ((12, 12, 5), (6, 5, 3), (4, 2, 6))
+SWSP = ((12, 9, 2), (8, 7, 6))
+SDSP = ((12, 10, 3), (9, 7, 6))
+
+
+def expand(parcel):
+    """Return the instruction encoded by a 16-bit compressed `parcel`."""
+    cls, fields = expand_fields(parcel)
+    instruction = compressed_classes[cls](**fields)
+    object.__setattr__(instruction, "word", parcel)
+    return instruction
+
+
+def expand_fields(parcel):
+    if parcel >> 16 or parcel & 0b11 == 0b11:
+        raise ValueError(f"The 'parcel' should be 16 bits with low bits "
+                         f"other than 0b11, got {parcel:#x}.")
+    quadrant = parcel & 0b11
+    funct3 = parcel >> 13
+    # full and 3-bit (x8-x15) register fields
+    rd = bits(parcel, 11, 7)
+    rs2 = bits(parcel, 6, 2)
+    rd_ = 8 + bits(parcel, 4, 2)
+    rs1_ = 8 + bits(parcel, 9, 7)
+    imm6 = i.sign_extend(bits(parcel, 12, 12) << 5 | bits(parcel, 6, 2), 6)
+    shamt = bits(parcel, 12, 12) << 5 | bits(parcel, 6, 2)
+
+    if quadrant == 0b00:
+        if funct3 == 0b000:
+            imm = scatter(parcel, ADDI4SPN)
+            if imm == 0:
+                raise reserved(parcel)
+            return i.AddiInstruction, dict(rd=rd_, rs=2, imm=imm)
+        if funct3 == 0b010:
+            return i.LwInstruction, dict(rd=rd_, rs=rs1_,
+                                         imm=scatter(parcel, LW))
+        if funct3 == 0b011:
+            return i.LdInstruction, dict(rd=rd_, rs=rs1_,
+                                         imm=scatter(parcel, LD))
+        if funct3 == 0b110:
+            return i.SwInstruction, dict(rs1=rs1_, rs2=rd_,
+                                         imm=scatter(parcel, LW))
+        if funct3 == 0b111:
+            return i.SdInstruction, dict(rs1=rs1_, rs2=rd_,
+                                         imm=scatter(parcel, LD))
+
+    elif quadrant == 0b01:
+        if funct3 == 0b000:
+            return i.AddiInstruction, dict(rd=rd, rs=rd, imm=imm6)
+        if funct3 == 0b001 and rd:
+            return i.AddiwInstruction, dict(rd=rd, rs=rd, imm=imm6)
+        if funct3 == 0b010:
+            return i.AddiInstruction, dict(rd=rd, rs=0, imm=imm6)
+        if funct3 == 0b011 and rd == 2:
+            imm = i.sign_extend(scatter(parcel, ADDI16SP), 10)
+            if imm:
+                return i.AddiInstruction, dict(rd=2, rs=2, imm=imm)
+        elif funct3 == 0b011 and imm6:
+            return i.LuiInstruction, dict(rd=rd, imm=imm6 & 0xfffff)
+        if funct3 == 0b100:
+            op = bits(parcel, 11, 10)
+            if op == 0b00:
+                return i.SrliInstruction, dict(rd=rs1_, rs=rs1_, imm=shamt)
+            if op == 0b01:
+                return i.SraiInstruction, dict(rd=rs1_, rs=rs1_, imm=shamt)
+            if op == 0b10:
+                return i.AndiInstruction, dict(rd=rs1_, rs=rs1_, imm=imm6)
+            cls = ((i.SubInstruction, i.XorInstruction, i.OrInstruction,
+                    i.AndInstruction, i.SubwInstruction, i.AddwInstruction,
+                    None, None)[bits(parcel, 12, 12) << 2
+                                | bits(parcel, 6, 5)])
+            if cls is not None:
+                return cls, dict(rd=rs1_, rs1=rs1_, rs2=rd_)
+        if funct3 == 0b101:
+            offset = i.sign_extend(scatter(parcel, J), 12)
+            return i.JalInstruction, dict(rd=0, imm=offset // 2)
+        if funct3 in (0b110, 0b111):
+            offset = i.sign_extend(scatter(parcel, B), 9)
+            cls = i.BeqInstruction if funct3 == 0b110 else i.BneInstruction
+            return cls, dict(rs1=rs1_, rs2=0, imm=offset // 2)
+
+    else:
+        if funct3 == 0b000:
+            return i.SlliInstruction, dict(rd=rd, rs=rd, imm=shamt)
+        if funct3 == 0b010 and rd:
+            return i.LwInstruction, dict(rd=rd, rs=2,
+                                         imm=scatter(parcel, LWSP))
+        if funct3 == 0b011 and rd:
+            return i.LdInstruction, dict(rd=rd, rs=2,
+                                         imm=scatter(parcel, LDSP))
+        if funct3 == 0b100:
+            link = bits(parcel, 12, 12)
+            if rs2:
+                return i.AddInstruction, dict(rd=rd, rs1=rd if link else 0,
+                                              rs2=rs2)
+            if rd:
+                return i.JalrInstruction, dict(rd=link, rs=rd, imm=0)
+        if funct3 == 0b110:
+            return i.SwInstruction, dict(rs1=2, rs2=rs2,
+                                         imm=scatter(parcel, SWSP))
+        if funct3 == 0b111:
+            return i.SdInstruction, dict(rs1=2, rs2=rs2,
+                                         imm=scatter(parcel, SDSP))
+
+    raise reserved(parcel)
@@ -1,4 +1,13 @@
 SIZE = 8    # unit: 1 byte
+MASK = (1 << (SIZE * 8)) - 1
+SIGN_BIT = 1 << (SIZE * 8 - 1)
+
+REGISTERS_NUM = 32
+
+PAGE_SHIFT = 12
+PAGE_SIZE = 1 << PAGE_SHIFT    # unit: 1 byte
+
+BLOCK_LENGTH_MAX = 64    # unit: 1 instruction
 
 REGISTERS_DIR = {
                 # USE                               SAVER
@@ -19,7 +28,7 @@ REGISTERS_DIR = {
     "t2":   7,  #
     "x7":   7,
     "s0":   8,  # Saved register/Frame pointer      Callee
-    "sp":   8,
+    "fp":   8,
     "x8":   8,
     "s1":   9,  # Saved register                    Callee
     "x9":   9,
@@ -0,0 +1,136 @@
+""" ELF64 loader
+
+Just enough of the ELF format to run statically linked little-endian
+RISC-V executables: the program headers to map `PT_LOAD` segments and
+the section headers to read the symbol table.
+"""
+
+import mmap
+import struct
+
+ELF_HEADER = struct.Struct("<16sHHIQQQIHHHHHH")
+PROGRAM_HEADER = struct.Struct("<IIQQQQQQ")
+SECTION_HEADER = struct.Struct("<IIQQQQIIQQ")
+SYMBOL = struct.Struct("<IBBHQQ")
+
+ELFCLASS64 = 2
+ELFDATA2LSB = 1
+EM_RISCV = 0xf3
+PT_LOAD = 1
+SHT_SYMTAB = 2
+
+
+class Segment:
+
+    __slots__ = ("vaddr", "offset", "filesz", "memsz", "flags")
+
+    def __init__(self, vaddr, offset, filesz, memsz, flags):
+        self.vaddr = vaddr
+        self.offset = offset
+        self.filesz = filesz
+        self.memsz = memsz
+        self.flags = flags
+
+    def __repr__(self):
+        return (f"<{__class__.__name__} {self.vaddr:#x} "
+                f"filesz={self.filesz:#x} memsz={self.memsz:#x}>")
+
+
+class Symbol:
+
+    __slots__ = ("name", "value", "size", "type", "bind", "shndx")
+
+    def __init__(self, name, value, size, type, bind, shndx):
+        self.name = name
+        self.value = value
+        self.size = size
+        self.type = type
+        self.bind = bind
+        self.shndx = shndx
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {self.name} {self.value:#x}>"
+
+
+class ElfFile:
+    """A parsed ELF64 RISC-V executable.
+
+    Attributes
+    ----------
+    entry : int
+    segments : list of Segment
+        The `PT_LOAD` segments.
+    symbols : dict
+        `Symbol` by name, empty if the file is stripped.
+    data : bytes-like
+        The whole file, until `close`.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        if len(data) < ELF_HEADER.size:
+            raise ValueError("The file is too short to be ELF.")
+        (ident, _, machine, _, self.entry, phoff, shoff, _,
+         _, phentsize, phnum, shentsize, shnum, _) = ELF_HEADER.unpack_from(data)
+        if ident[:4] != b"\x7fELF":
+            raise ValueError("The file is not ELF.")
+        if ident[4] != ELFCLASS64 or ident[5] != ELFDATA2LSB:
+            raise ValueError("The file should be 64-bit little-endian ELF.")
+        if machine != EM_RISCV:
+            raise ValueError(f"The machine should be RISC-V ({EM_RISCV:#x}), "
+                             f"got {machine:#x}.")
+
+        self.segments = []
+        for i in range(phnum):
+            (type_, flags, offset, vaddr, _, filesz, memsz,
+             _) = PROGRAM_HEADER.unpack_from(data, phoff + i * phentsize)
+            if type_ == PT_LOAD:
+                self.segments.append(
+                    Segment(vaddr, offset, filesz, memsz, flags))
+
+        sections = [SECTION_HEADER.unpack_from(data, shoff + i * shentsize)
+                    for i in range(shnum)]
+        self.symbols = {}
+        for _, type_, _, _, offset, size, link, _, _, entsize in sections:
+            if type_ != SHT_SYMTAB:
+                continue
+            strtab = sections[link][4]
+            for j in range(size // entsize):
+                (name, info, _, shndx, value,
+                 size_) = SYMBOL.unpack_from(data, offset + j * entsize)
+                start = strtab + name
+                end = data.find(b"\0", start)
+                if end < 0:
+                    end = len(data)
+                # mangled names may be long and need not be UTF-8
+                name = bytes(data[start:end]).decode(errors="replace")
+                if name:
+                    self.symbols[name] = Symbol(name, value, size_, info & 0xf,
+                                                info >> 4, shndx)
+
+    @classmethod
+    def open(cls, path):
+        """Parse the file at `path`, mapping it instead of reading it."""
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return cls(data)
+        except BaseException:
+            data.close()
+            raise
+
+    def close(self):
+        """Release the file mapping, keeping the parsed headers."""
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.data = None
+
+    def load(self, memory):
+        """Copy the segments into `memory` and zero-fill their `.bss`."""
+        with memoryview(self.data) as view:
+            for segment in self.segments:
+                with view[segment.offset:segment.offset+segment.filesz] as d:
+                    memory.write_bytes(segment.vaddr, d)
+                if segment.memsz > segment.filesz:
+                    memory.clear(segment.vaddr + segment.filesz,
+                                 segment.memsz - segment.filesz)
@@ -1,4 +1,9 @@
+import functools
+import re
+
 from . import instructions
+from .compressed import expand
+from .config import REGISTERS_DIR
 
 
 instruction_classes = {
@@ -10,6 +15,24 @@ instruction_classes = {
     "sra":  instructions.SraInstruction,
     "or":   instructions.OrInstruction,
     "and":  instructions.AndInstruction,
+    "addw": instructions.AddwInstruction,
+    "subw": instructions.SubwInstruction,
+    "sllw": instructions.SllwInstruction,
+    "srlw": instructions.SrlwInstruction,
+    "sraw": instructions.SrawInstruction,
+    "mul":  instructions.MulInstruction,
+    "mulh": instructions.MulhInstruction,
+    "mulhsu": instructions.MulhsuInstruction,
+    "mulhu": instructions.MulhuInstruction,
+    "div":  instructions.DivInstruction,
+    "divu": instructions.DivuInstruction,
+    "rem":  instructions.RemInstruction,
+    "remu": instructions.RemuInstruction,
+    "mulw": instructions.MulwInstruction,
+    "divw": instructions.DivwInstruction,
+    "divuw": instructions.DivuwInstruction,
+    "remw": instructions.RemwInstruction,
+    "remuw": instructions.RemuwInstruction,
     "lb":   instructions.LbInstruction,
     "lh":   instructions.LhInstruction,
     "lw":   instructions.LwInstruction,
@@ -24,6 +47,10 @@ instruction_classes = {
     "srai": instructions.SraiInstruction,
     "ori":  instructions.OriInstruction,
     "andi": instructions.AndiInstruction,
+    "addiw": instructions.AddiwInstruction,
+    "slliw": instructions.SlliwInstruction,
+    "srliw": instructions.SrliwInstruction,
+    "sraiw": instructions.SraiwInstruction,
     "jalr": instructions.JalrInstruction,
     "sb":   instructions.SbInstruction,
     "sh":   instructions.ShInstruction,
@@ -36,90 +63,291 @@ instruction_classes = {
     "bltu": instructions.BltuInstruction,
     "bgeu": instructions.BgeuInstruction,
     "lui":  instructions.LuiInstruction,
+    "auipc": instructions.AuipcInstruction,
     "jal":  instructions.JalInstruction,
+    "ecall": instructions.EcallInstruction,
 }
 
 
+def decode_key(word):
+    """Pack opcode, funct3 and funct7 of `word` into a `decode_table` index."""
+    return ((word & 0b1111111)
+           | (word >> 5) & (0b111 << 7)
+           | (word >> 15) & (0b1111111 << 10)
+    )
+
+
+def build_decode_table(classes):
+    """Map every `decode_key` to the instruction class it decodes to.
+
+    Fields a class does not define (e.g. `funct7` of I-type instructions)
+    are don't-care bits, so the class is filled in for all their values.
+    """
+    table = [None] * (1 << 17)
+    for instruction_class in classes:
+        funct3s = ([instruction_class.funct3]
+                   if hasattr(instruction_class, "funct3") else range(1 << 3))
+        if hasattr(instruction_class, "funct7"):
+            funct7s = [instruction_class.funct7]
+        elif hasattr(instruction_class, "funct6"):
+            funct7s = [instruction_class.funct6 << 1,
+                       instruction_class.funct6 << 1 | 1]
+        else:
+            funct7s = range(1 << 7)
+        for funct3 in funct3s:
+            for funct7 in funct7s:
+                key = instruction_class.opcode | funct3 << 7 | funct7 << 10
+                if table[key] is not None:
+                    raise ValueError(
+                        f"The encoding of '{instruction_class.__name__}' "
+                        f"overlaps '{table[key].__name__}'.")
+                table[key] = instruction_class
+    return table
+
+
+decode_table = build_decode_table(instruction_classes.values())
+
+
+# one operand: a register, an immediate or a label
+OPERAND = r"\s*([^\s,()]+)\s*"
+
+# the operands of every syntax, as a regex and the field of each group;
+# "offset" is a branch target, a label or an immediate in units of 2 bytes
+syntaxes = {
+    "rd, rs1, rs2": (re.compile(f"{OPERAND},{OPERAND},{OPERAND}"),
+                     ("rd", "rs1", "rs2")),
+    "rd, rs, imm":  (re.compile(f"{OPERAND},{OPERAND},{OPERAND}"),
+                     ("rd", "rs", "imm")),
+    "rd, imm(rs)":  (re.compile(rf"{OPERAND},{OPERAND}\({OPERAND}\)"),
+                     ("rd", "imm", "rs")),
+    "rs2, imm(rs1)": (re.compile(rf"{OPERAND},{OPERAND}\({OPERAND}\)"),
+                      ("rs2", "imm", "rs1")),
+    "rs1, rs2, offset": (re.compile(f"{OPERAND},{OPERAND},{OPERAND}"),
+                         ("rs1", "rs2", "offset")),
+    "rd, imm":      (re.compile(f"{OPERAND},{OPERAND}"), ("rd", "imm")),
+    "rd, offset":   (re.compile(f"{OPERAND},{OPERAND}"), ("rd", "offset")),
+    "":             (re.compile(""), ()),
+}
+
+mnemonic_syntaxes = {
+    **dict.fromkeys(("add", "sub", "sll", "srl", "sra", "xor", "or", "and",
+                     "addw", "subw", "sllw", "srlw", "sraw"),
+                    "rd, rs1, rs2"),
+    **dict.fromkeys(("mul", "mulh", "mulhsu", "mulhu", "div", "divu", "rem",
+                     "remu", "mulw", "divw", "divuw", "remw", "remuw"),
+                    "rd, rs1, rs2"),
+    **dict.fromkeys(("addi", "slli", "srli", "srai", "xori", "ori", "andi",
+                     "addiw", "slliw", "srliw", "sraiw"),
+                    "rd, rs, imm"),
+    **dict.fromkeys(("lb", "lh", "lw", "ld", "lbu", "lhu", "lwu", "jalr"),
+                    "rd, imm(rs)"),
+    **dict.fromkeys(("sb", "sh", "sw", "sd"),
+                    "rs2, imm(rs1)"),
+    **dict.fromkeys(("beq", "bne", "blt", "bge", "bltu", "bgeu"),
+                    "rs1, rs2, offset"),
+    "lui": "rd, imm",
+    "auipc": "rd, imm",
+    "jal": "rd, offset",
+    "ecall": "",
+}
+
+
+def check_imm(instruction_class, imm, code):
+    low, high = instruction_class.imm_range
+    if not low <= imm <= high:
+        raise ValueError(f"The immediate of `{code}` should be "
+                         f"{low} <= imm <= {high}, got {imm}.")
+
+
 class InstructionFactory:
 
     @classmethod
     def get(cls, x):
-        tokens = __class__.__extract_tokens(x)
-        instruction = __class__.__translate(tokens)
-        return instruction
+        """Decode a machine-code word or assemble one line of text.
 
-    @classmethod
-    def __extract_tokens(cls, x):
+        Assembled instructions are kept in an LRU cache by text, see
+        `cache_info`, so the same text gives the same object which
+        should not be modified.
+        """
         if isinstance(x, int):
-            raise NotImplementedError
-        elif isinstance(x, str):
-            tokens = x.lower() \
-                .replace(",", " ") \
-                .replace("(", " ") \
-                .replace(")", " ") \
-                .split()
-        else:
+            return __class__.decode(x)
+        if not isinstance(x, str):
             raise TypeError(f"The x should be 'int' or 'str', "
                             f"got {type(x)}")
-        return tokens
+        return __class__.__get_text(x)
 
     @classmethod
-    def __translate(cls, tokens):
-        inst = tokens[0]
-        ridx = __class__.__register_index
-
-        match inst:
-            case (
-                    "add" | "sub"
-                    | "sll" | "srl" | "sra"
-                    | "xor" | "or" | "and"):
-                rd = ridx(tokens[1])
-                rs1 = ridx(tokens[2])
-                rs2 = ridx(tokens[3])
-                return instruction_classes[inst](rd=rd, rs1=rs1, rs2=rs2)
-            case (
-                    "lb" | "lh" | "lw" | "ld"
-                    | "lbu" | "lhu" | "lwu"
-                    | "jalr"):
-                rd = ridx(tokens[1])
-                imm = int(tokens[2])
-                rs = ridx(tokens[3])
-                return instruction_classes[inst](rd=rd, imm=imm, rs=rs)
-            case (
-                    "addi"
-                    | "slli" | "srli" | "srai"
-                    | "xori" | "ori" | "andi"):
-                rd = ridx(tokens[1])
-                rs = ridx(tokens[2])
-                imm = int(tokens[3])
-                return instruction_classes[inst](rd=rd, imm=imm, rs=rs)
-            case (
-                    "sb" | "sh" | "sw" | "sd"):
-                rs2 = ridx(tokens[1])
-                imm = int(tokens[2])
-                rs1 = ridx(tokens[3])
-                return instruction_classes[inst](rs2=rs2, imm=imm, rs1=rs1)
-            case (
-                    "beq" | "bne" | "blt" | "bge"
-                    | "bltu" | "bgeu"):
-                rs1 = ridx(tokens[1])
-                rs2 = ridx(tokens[2])
-                imm = int(tokens[3])
-                return instruction_classes[inst](rs1=rs1, rs2=rs2, imm=imm)
-            case (
-                    "lui" | "jal"):
-                rd = ridx(tokens[1])
-                imm = int(tokens[2])
-                return instruction_classes[inst](rd=rd, imm=imm)
-            case _:
-                raise ValueError(f"The instruction `{inst}` is not supported.")
+    def cache_info(cls):
+        """Return the hits, misses and size of the cache of `get`."""
+        return __class__.__get_text.cache_info()
 
     @classmethod
-    def __register_index(cls, s):
-        if s.startswith("x"):
-            return int(s[1:])
-        elif s in registers:
-            return registers.index(s)
-        else:
-            raise TypeError(f"The format of `{s}` is incorrect. Should be "
-                            f"register format like `x12` or `sp`")
+    def cache_clear(cls):
+        __class__.__get_text.cache_clear()
+
+    @classmethod
+    @functools.lru_cache(maxsize=1 << 16)
+    def decode(cls, word):
+        """Decode a 32-bit machine-code word into an instruction.
+
+        A word whose low 2 bits are not `0b11` is a 16-bit compressed
+        parcel, see `riscvsim.compressed`. Instructions are immutable,
+        so they are interned: decoding the same word again returns the
+        same object from an LRU cache.
+        """
+        if word & 0b11 != 0b11:
+            return expand(word)
+        instruction_class = decode_table[decode_key(word)]
+        if instruction_class is None or word >> 32:
+            raise ValueError(f"The word `{word:0=#10x}` is not a supported "
+                             f"instruction.")
+        return instruction_class.decode(word)
+
+    @classmethod
+    def decode_many(cls, buffer):
+        """Decode a buffer of little-endian instructions, e.g. a text segment.
+
+        Every instruction takes 4 bytes, or 2 for a compressed parcel,
+        told apart by the low 2 bits as in `decode`.
+
+        Parameters
+        ----------
+        buffer : bytes-like
+            It should end with a whole instruction.
+
+        Returns
+        -------
+        list of Instruction
+        """
+        data = bytes(buffer)
+        decode = __class__.decode
+        instructions = []
+        offset = 0
+        while offset < len(data):
+            length = 2 if data[offset] & 0b11 != 0b11 else 4
+            if offset + length > len(data):
+                raise ValueError(f"The 'buffer' should end with a whole "
+                                 f"instruction, got {len(data) - offset} "
+                                 f"bytes at {offset:#x}.")
+            instructions.append(decode(int.from_bytes(
+                data[offset:offset+length], "little")))
+            offset += length
+        return instructions
+
+    @classmethod
+    def get_text(cls, text, base=0):
+        """Assemble a multi-line program, see `assemble`."""
+        instructions, _ = __class__.assemble(text, base)
+        return instructions
+
+    @classmethod
+    def assemble(cls, text, base=0):
+        """Assemble a multi-line program with labels and comments.
+
+        One instruction per line; `;` or `#` starts a comment and
+        `name:` defines a label at the address of the next instruction.
+        Branches and `jal` may use a label instead of an offset. Lines
+        are parsed through a cache, so assembling a program again after
+        a small edit only tokenizes the changed lines.
+
+        Parameters
+        ----------
+        text : str
+        base : int, default 0
+            The address of the first instruction.
+
+        Returns
+        -------
+        instructions : list of Instruction
+        labels : dict
+            The address of each label.
+        """
+        # pass 1: addresses of labels
+        lines = []
+        labels = {}
+        addr = base
+        for line in text.splitlines():
+            line_labels, code, parsed = __class__.__parse_line(line)
+            for label in line_labels:
+                if label in labels:
+                    raise ValueError(f"The label `{label}` is defined twice.")
+                labels[label] = addr
+            if code:
+                lines.append((code, parsed))
+                addr += 4
+
+        # pass 2: instructions
+        instructions = []
+        for i, (code, (instruction_class, fields, offset)) in enumerate(lines):
+            if offset in labels:
+                imm = (labels[offset] - base - 4*i) // 2
+                low, high = instruction_class.imm_range
+                if not low <= imm <= high:
+                    raise ValueError(
+                        f"The label `{offset}` is out of the range of "
+                        f"`{code}`: {2*imm:+#x} bytes away, should be "
+                        f"{2*low:+#x} to {2*high:+#x}.")
+                instructions.append(instruction_class(**dict(fields),
+                                                      imm=imm))
+            else:
+                instructions.append(__class__.__get_text(code))
+        return instructions, labels
+
+    @classmethod
+    @functools.lru_cache(maxsize=1 << 16)
+    def __parse_line(cls, line):
+        code = line.split(";", 1)[0].split("#", 1)[0].lower()
+        labels = []
+        while ":" in code:
+            label, code = code.split(":", 1)
+            label = label.strip()
+            if not re.fullmatch(r"[a-z_.$][a-z0-9_.$]*", label):
+                raise ValueError(f"The label `{label}` is incorrect.")
+            labels.append(label)
+        code = code.strip()
+        return tuple(labels), code, code and __class__.__parse(code)
+
+    @classmethod
+    @functools.lru_cache(maxsize=1 << 16)
+    def __get_text(cls, text):
+        instruction_class, fields, offset = __class__.__parse(text.lower())
+        if offset is None:
+            return instruction_class(**dict(fields))
+        try:
+            imm = int(offset, 0)
+        except ValueError:
+            raise ValueError(f"The label `{offset}` is not defined.") from None
+        check_imm(instruction_class, imm, text)
+        return instruction_class(**dict(fields), imm=imm)
+
+    @classmethod
+    def __parse(cls, code):
+        # -> (class, fields as a tuple of items, branch target or None)
+        mnemonic, operands = (code.split(None, 1) + ["", ""])[:2]
+        try:
+            syntax = mnemonic_syntaxes[mnemonic]
+        except KeyError:
+            raise ValueError(f"The instruction `{mnemonic}` is not "
+                             f"supported.") from None
+        pattern, names = syntaxes[syntax]
+        match = pattern.fullmatch(operands)
+        if match is None:
+            raise ValueError(f"The operands of `{mnemonic}` should be "
+                             f"`{syntax}`, got `{operands}`.")
+        fields = []
+        offset = None
+        instruction_class = instruction_classes[mnemonic]
+        for name, value in zip(names, match.groups()):
+            if name == "imm":
+                imm = int(value, 0)
+                check_imm(instruction_class, imm, code)
+                fields.append(("imm", imm))
+            elif name == "offset":
+                offset = value
+            elif value in REGISTERS_DIR:
+                fields.append((name, REGISTERS_DIR[value]))
+            else:
+                raise TypeError(f"The format of `{value}` is incorrect. "
+                                f"Should be register format like `x12` or "
+                                f"`sp`")
+        return instruction_class, tuple(fields), offset
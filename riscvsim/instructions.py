@@ -1,26 +1,168 @@
-from .config import SIZE
+from .config import MASK
+from .syscalls import ProgramExit
+
+
+def sign_extend(value, bits):
+    value &= (1 << bits) - 1
+    if value & (1 << (bits - 1)):
+        value -= 1 << bits
+    return value
+
+
+# RISC-V division never traps: dividing by zero gives all ones (the
+# quotient) or the dividend (the remainder), and the one signed overflow,
+# the most negative value divided by -1, gives the dividend and 0.
+
+def divide(a, b, bits=64):
+    """Return `div` of the low `bits` of `a` and `b`, as a signed int."""
+    a = sign_extend(a, bits)
+    b = sign_extend(b, bits)
+    if b == 0:
+        return -1
+    if b == -1:
+        return sign_extend(-a, bits)
+    q = abs(a) // abs(b)
+    return -q if (a < 0) != (b < 0) else q
+
+
+def divide_unsigned(a, b, bits=64):
+    """Return `divu` of the low `bits` of `a` and `b`."""
+    mask = (1 << bits) - 1
+    a &= mask
+    b &= mask
+    return a // b if b else mask
+
+
+def remainder(a, b, bits=64):
+    """Return `rem` of the low `bits` of `a` and `b`, as a signed int."""
+    a = sign_extend(a, bits)
+    b = sign_extend(b, bits)
+    if b == 0:
+        return a
+    r = abs(a) % abs(b)
+    return -r if a < 0 else r
+
+
+def remainder_unsigned(a, b, bits=64):
+    """Return `remu` of the low `bits` of `a` and `b`."""
+    mask = (1 << bits) - 1
+    a &= mask
+    b &= mask
+    return a % b if b else a
+
+
+# Fields are checked when an instruction is made, so that its `word`,
+# which is all `__eq__`, `__hash__` and pickling look at, identifies it.
+
+def check_field(name, value, low, high):
+    if not low <= value <= high:
+        raise ValueError(f"The '{name}' should be {low} <= {name} <= "
+                         f"{high}, got {value}.")
+
+
+def check_registers(**registers):
+    for name, value in registers.items():
+        check_field(name, value, 0, 31)
+
+
+# Names used by the source returned from `Instruction.translate`, see
+# `riscvsim.translator` for the function they end up in.
+
+def local(index):
+    return f"x{index}" if index else "0"
+
+
+def local_signed(index):
+    return f"((x{index} ^ S) - S)" if index else "0"
+
+
+def target(index):
+    return f"x{index}" if index else "_"
+
+
+def word_signed(expression):
+    # the low 32 bits of `expression` sign-extended, as a signed int
+    return f"((({expression}) & 0xffffffff ^ 0x80000000) - 0x80000000)"
 
 
 class Instruction:
+    """An immutable decoded instruction.
+
+    The fields are slots of the format classes (`InstructionR`, ...)
+    and `word` is the 32-bit encoding computed once by `encode`, so
+    `int(instruction)` is free. Instructions compare and hash by type
+    and encoding, which lets equal ones be interned and shared, see
+    `InstructionFactory.decode`.
+    """
+    __slots__ = ("word",)
+
+    # whether `translate` sets the next `pc`, i.e. ends a basic block
+    ends_block = False
+    # bytes of the encoding, 2 for compressed instructions
+    length = 4
 
     def __init__(self, *args, **kwargs):
         raise NotImplementedError
 
+    def __setattr__(self, name, value):
+        raise AttributeError(f"The '{type(self).__name__}' is immutable.")
+
+    __delattr__ = __setattr__
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.word == other.word
+
+    def __hash__(self):
+        return hash(self.word)
+
+    def __reduce__(self):
+        return type(self).decode, (self.word,)
+
+    def fields(self):
+        """Return the operand fields by name, e.g. `{'rd': 7, ...}`."""
+        return {name: getattr(self, name)
+                for cls in reversed(type(self).__mro__)
+                for name in cls.__dict__.get("__slots__", ())
+                if name != "word"}
+
     def run_by(self, simulator):
         raise NotImplementedError
 
+    def translate(self, pc):
+        """Return Python source lines doing `run_by` on translated locals.
+
+        Parameters
+        ----------
+        pc : int
+            The address of the instruction, so it can be folded into
+            the generated code.
+        """
+        raise NotImplementedError
+
     def __index__(self):
+        return self.word
+
+    def encode(self):
+        """Return the 32-bit encoding of the fields."""
+        raise NotImplementedError
+
+    @classmethod
+    def decode(cls, word):
         raise NotImplementedError
 
 
 class InstructionR(Instruction):
+    __slots__ = ("rd", "rs1", "rs2")
 
     def __init__(self, *, rd, rs1, rs2):
-        self.rd = rd
-        self.rs1 = rs1
-        self.rs2 = rs2
-
-    def __index__(self):
+        check_registers(rd=rd, rs1=rs1, rs2=rs2)
+        init = object.__setattr__
+        init(self, "rd", rd)
+        init(self, "rs1", rs1)
+        init(self, "rs2", rs2)
+        init(self, "word", self.encode())
+
+    def encode(self):
         res = ((self.funct7 << 25)
               | (self.rs2 << 20)
               | (self.rs1 << 15)
@@ -30,15 +172,27 @@ class InstructionR(Instruction):
         )
         return res
 
+    @classmethod
+    def decode(cls, word):
+        return cls(rd=(word >> 7) & 0b11111,
+                   rs1=(word >> 15) & 0b11111,
+                   rs2=(word >> 20) & 0b11111)
+
 
 class InstructionI(Instruction):
+    __slots__ = ("rd", "imm", "rs")
+    imm_range = (-(1 << 11), (1 << 11) - 1)
 
     def __init__(self, *, rd, imm, rs):
-        self.rd = rd
-        self.imm = imm
-        self.rs = rs
-
-    def __index__(self):
+        check_registers(rd=rd, rs=rs)
+        check_field("imm", imm, *self.imm_range)
+        init = object.__setattr__
+        init(self, "rd", rd)
+        init(self, "imm", imm)
+        init(self, "rs", rs)
+        init(self, "word", self.encode())
+
+    def encode(self):
         return (((self.imm & 0b111111111111) << 20)
                | (self.rs << 15)
                | (self.funct3 << 12)
@@ -46,15 +200,67 @@ class InstructionI(Instruction):
                | (self.opcode << 0)
         )
 
+    @classmethod
+    def decode(cls, word):
+        return cls(rd=(word >> 7) & 0b11111,
+                   imm=sign_extend(word >> 20, 12),
+                   rs=(word >> 15) & 0b11111)
+
+
+class InstructionIShift(InstructionI):
+    # I-type with `funct6` in imm[11:6] and the shift amount in imm[5:0]
+    __slots__ = ()
+    imm_range = (0, 63)
+
+    def encode(self):
+        return (((self.funct6 << 6 | self.imm & 0b111111) << 20)
+               | (self.rs << 15)
+               | (self.funct3 << 12)
+               | (self.rd << 7)
+               | (self.opcode << 0)
+        )
+
+    @classmethod
+    def decode(cls, word):
+        return cls(rd=(word >> 7) & 0b11111,
+                   imm=(word >> 20) & 0b111111,
+                   rs=(word >> 15) & 0b11111)
+
+
+class InstructionIShiftW(InstructionI):
+    # I-type with `funct7` in imm[11:5] and the shift amount in imm[4:0]
+    __slots__ = ()
+    imm_range = (0, 31)
+
+    def encode(self):
+        return (((self.funct7 << 5 | self.imm & 0b11111) << 20)
+               | (self.rs << 15)
+               | (self.funct3 << 12)
+               | (self.rd << 7)
+               | (self.opcode << 0)
+        )
+
+    @classmethod
+    def decode(cls, word):
+        return cls(rd=(word >> 7) & 0b11111,
+                   imm=(word >> 20) & 0b11111,
+                   rs=(word >> 15) & 0b11111)
+
 
 class InstructionS(Instruction):
+    __slots__ = ("rs1", "rs2", "imm")
+    imm_range = (-(1 << 11), (1 << 11) - 1)
 
     def __init__(self, *, rs1, rs2, imm):
-        self.rs1 = rs1
-        self.rs2 = rs2
-        self.imm = imm
-
-    def __index__(self):
+        check_registers(rs1=rs1, rs2=rs2)
+        check_field("imm", imm, *self.imm_range)
+        init = object.__setattr__
+        init(self, "rs1", rs1)
+        init(self, "rs2", rs2)
+        init(self, "imm", imm)
+        init(self, "word", self.encode())
+
+    def encode(self):
         return (((self.imm & 0b111111100000) >> 5 << 25)
               | (self.rs2 << 20)
               | (self.rs1 << 15)
@@ -63,15 +269,30 @@ class InstructionS(Instruction):
               | (self.opcode << 0)
         )
 
+    @classmethod
+    def decode(cls, word):
+        imm = ((word >> 25) << 5) | ((word >> 7) & 0b11111)
+        return cls(rs1=(word >> 15) & 0b11111,
+                   rs2=(word >> 20) & 0b11111,
+                   imm=sign_extend(imm, 12))
+
 
 class InstructionSB(Instruction):
+    __slots__ = ("rs1", "rs2", "imm")
+    ends_block = True
+    # in units of 2 bytes, i.e. +-4 KiB
+    imm_range = (-(1 << 11), (1 << 11) - 1)
 
     def __init__(self, *, rs1, rs2, imm):
-        self.rs1 = rs1
-        self.rs2 = rs2
-        self.imm = imm
-
-    def __index__(self):
+        check_registers(rs1=rs1, rs2=rs2)
+        check_field("imm", imm, *self.imm_range)
+        init = object.__setattr__
+        init(self, "rs1", rs1)
+        init(self, "rs2", rs2)
+        init(self, "imm", imm)
+        init(self, "word", self.encode())
+
+    def encode(self):
         return (((self.imm & 0b100000000000) >> 11 << 31)
               | ((self.imm & 0b001111110000) >> 4 << 25)
               | (self.rs2 << 20)
@@ -82,27 +303,58 @@ class InstructionSB(Instruction):
               | (self.opcode << 0)
         )
 
+    @classmethod
+    def decode(cls, word):
+        imm = (((word >> 31) & 0b1) << 11
+              | ((word >> 7) & 0b1) << 10
+              | ((word >> 25) & 0b111111) << 4
+              | ((word >> 8) & 0b1111) << 0
+        )
+        return cls(rs1=(word >> 15) & 0b11111,
+                   rs2=(word >> 20) & 0b11111,
+                   imm=sign_extend(imm, 12))
+
 
 class InstructionU(Instruction):
+    __slots__ = ("rd", "imm")
+    # the upper 20 bits, written signed or unsigned
+    imm_range = (-(1 << 19), (1 << 20) - 1)
 
     def __init__(self, *, rd, imm):
-        self.rd = rd
-        self.imm = imm
-
-    def __index__(self):
-        return ((self.imm << 12)
+        check_registers(rd=rd)
+        check_field("imm", imm, *self.imm_range)
+        init = object.__setattr__
+        init(self, "rd", rd)
+        # as decoded, so that e.g. -1 and 0xfffff give equal instructions
+        init(self, "imm", imm & 0xfffff)
+        init(self, "word", self.encode())
+
+    def encode(self):
+        return (((self.imm & 0b11111111111111111111) << 12)
               | (self.rd << 7)
               | (self.opcode << 0)
         )
 
+    @classmethod
+    def decode(cls, word):
+        return cls(rd=(word >> 7) & 0b11111,
+                   imm=(word >> 12) & 0b11111111111111111111)
+
 
 class InstructionUJ(Instruction):
+    __slots__ = ("rd", "imm")
+    # in units of 2 bytes, i.e. +-1 MiB
+    imm_range = (-(1 << 19), (1 << 19) - 1)
 
     def __init__(self, *, rd, imm):
-        self.rd = rd
-        self.imm = imm
-
-    def __index__(self):
+        check_registers(rd=rd)
+        check_field("imm", imm, *self.imm_range)
+        init = object.__setattr__
+        init(self, "rd", rd)
+        init(self, "imm", imm)
+        init(self, "word", self.encode())
+
+    def encode(self):
         return (((self.imm & 0b10000000000000000000) >> 19 << 31)
               | ((self.imm & 0b00000000001111111111) >> 0 << 21)
               | ((self.imm & 0b00000000010000000000) >> 10 << 20)
@@ -111,545 +363,1301 @@ class InstructionUJ(Instruction):
               | (self.opcode << 0)
         )
 
+    @classmethod
+    def decode(cls, word):
+        imm = (((word >> 31) & 0b1) << 19
+              | ((word >> 21) & 0b1111111111) << 0
+              | ((word >> 20) & 0b1) << 10
+              | ((word >> 12) & 0b11111111) << 11
+        )
+        return cls(rd=(word >> 7) & 0b11111,
+                   imm=sign_extend(imm, 20))
+
 
 class AddInstruction(InstructionR):
+    __slots__ = ()
     opcode = 0b0110011
     funct3 = 0b000
     funct7 = 0b0000000
 
     def run_by(self, simulator):
-        v_rs1 = simulator.registers[self.rs1].get(SIZE, signed=False)
-        v_rs2 = simulator.registers[self.rs2].get(SIZE, signed=False)
-        simulator.registers[self.rd].set(SIZE, v_rs1 + v_rs2)
+        registers = simulator.registers
+        v_rs1 = registers.read_u(self.rs1)
+        v_rs2 = registers.read_u(self.rs2)
+        registers.write(self.rd, v_rs1 + v_rs2)
         pc = simulator.pc
-        simulator.pc = pc + 4
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = ({local(self.rs1)} + {local(self.rs2)}) & M"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class SubInstruction(InstructionR):
+    __slots__ = ()
     opcode = 0b0110011
     funct3 = 0b000
     funct7 = 0b0100000
 
     def run_by(self, simulator):
-        v_rs1 = simulator.registers[self.rs1].get(SIZE, signed=False)
-        v_rs2 = simulator.registers[self.rs2].get(SIZE, signed=False)
-        simulator.registers[self.rd].set(SIZE, v_rs1 - v_rs2)
+        registers = simulator.registers
+        v_rs1 = registers.read_u(self.rs1)
+        v_rs2 = registers.read_u(self.rs2)
+        registers.write(self.rd, v_rs1 - v_rs2)
         pc = simulator.pc
-        simulator.pc = pc + 4
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = ({local(self.rs1)} - {local(self.rs2)}) & M"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class SllInstruction(InstructionR):
+    __slots__ = ()
     opcode = 0b0110011
     funct3 = 0b001
     funct7 = 0b0000000
 
     def run_by(self, simulator):
-        v_rs1 = simulator.registers[self.rs1].get(SIZE, signed=False)
-        v_rs2 = simulator.registers[self.rs2].get(SIZE, signed=False)
-        simulator.registers[self.rd].set(SIZE, v_rs1 << v_rs2)
+        registers = simulator.registers
+        v_rs1 = registers.read_u(self.rs1)
+        v_rs2 = registers.read_u(self.rs2)
+        registers.write(self.rd, v_rs1 << (v_rs2 & 0b111111))
         pc = simulator.pc
-        simulator.pc = pc + 4
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = ({local(self.rs1)} << ({local(self.rs2)} & 0b111111)) & M"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class SrlInstruction(InstructionR):
+    __slots__ = ()
     opcode = 0b0110011
     funct3 = 0b101
     funct7 = 0b0000000
 
     def run_by(self, simulator):
-        v_rs1 = simulator.registers[self.rs1].get(SIZE, signed=False)
-        v_rs2 = simulator.registers[self.rs2].get(SIZE, signed=False)
-        simulator.registers[self.rd].set(SIZE, v_rs1 >> v_rs2)
+        registers = simulator.registers
+        v_rs1 = registers.read_u(self.rs1)
+        v_rs2 = registers.read_u(self.rs2)
+        registers.write(self.rd, v_rs1 >> (v_rs2 & 0b111111))
         pc = simulator.pc
-        simulator.pc = pc + 4
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = {local(self.rs1)} >> ({local(self.rs2)} & 0b111111)"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class SraInstruction(InstructionR):
+    __slots__ = ()
     opcode = 0b0110011
-    fucnt3 = 0b101
-    funct7 = 0b0000000
+    funct3 = 0b101
+    funct7 = 0b0100000
 
     def run_by(self, simulator):
-        v_rs1 = simulator.registers[self.rs1].get(SIZE, signed=True)
-        v_rs2 = simulator.registers[self.rs2].get(SIZE, signed=True)
-        simulator.registers[self.rd].set(SIZE, v_rs1 >> v_rs2)
+        registers = simulator.registers
+        v_rs1 = registers.read_s(self.rs1)
+        v_rs2 = registers.read_u(self.rs2)
+        registers.write(self.rd, v_rs1 >> (v_rs2 & 0b111111))
         pc = simulator.pc
-        simulator.pc = pc + 4
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = ({local_signed(self.rs1)} >> ({local(self.rs2)} & 0b111111)) & M"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class XorInstruction(InstructionR):
+    __slots__ = ()
     opcode = 0b0110011
     funct3 = 0b100
     funct7 = 0b0000000
 
     def run_by(self, simulator):
-        v_rs1 = simulator.registers[self.rs1].get(SIZE, signed=False)
-        v_rs2 = simulator.registers[self.rs2].get(SIZE, signed=False)
-        simulator.registers[self.rd].set(SIZE, v_rs1 ^ v_rs2)
+        registers = simulator.registers
+        v_rs1 = registers.read_u(self.rs1)
+        v_rs2 = registers.read_u(self.rs2)
+        registers.write(self.rd, v_rs1 ^ v_rs2)
         pc = simulator.pc
-        simulator.pc = pc + 4
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = {local(self.rs1)} ^ {local(self.rs2)}"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class OrInstruction(InstructionR):
+    __slots__ = ()
     opcode = 0b0110011
     funct3 = 0b110
     funct7 = 0b0000000
 
     def run_by(self, simulator):
-        v_rs1 = simulator.registers[self.rs1].get(SIZE, signed=False)
-        v_rs2 = simulator.registers[self.rs2].get(SIZE, signed=False)
-        simulator.registers[self.rd].set(SIZE, v_rs1 | v_rs2)
+        registers = simulator.registers
+        v_rs1 = registers.read_u(self.rs1)
+        v_rs2 = registers.read_u(self.rs2)
+        registers.write(self.rd, v_rs1 | v_rs2)
         pc = simulator.pc
-        simulator.pc = pc + 4
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = {local(self.rs1)} | {local(self.rs2)}"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class AndInstruction(InstructionR):
+    __slots__ = ()
     opcode = 0b0110011
     funct3 = 0b111
     funct7 = 0b0000000
 
     def run_by(self, simulator):
-        v_rs1 = simulator.registers[self.rs1].get(SIZE, signed=False)
-        v_rs2 = simulator.registers[self.rs2].get(SIZE, signed=False)
-        simulator.registers[self.rd].set(SIZE, v_rs1 & v_rs2)
+        registers = simulator.registers
+        v_rs1 = registers.read_u(self.rs1)
+        v_rs2 = registers.read_u(self.rs2)
+        registers.write(self.rd, v_rs1 & v_rs2)
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = {local(self.rs1)} & {local(self.rs2)}"]
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
+
+
+class AddwInstruction(InstructionR):
+    __slots__ = ()
+    opcode = 0b0111011
+    funct3 = 0b000
+    funct7 = 0b0000000
+
+    def run_by(self, simulator):
+        registers = simulator.registers
+        v_rs1 = registers.read_u(self.rs1)
+        v_rs2 = registers.read_u(self.rs2)
+        registers.write(self.rd, sign_extend(v_rs1 + v_rs2, 32))
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        v = word_signed(f"{local(self.rs1)} + {local(self.rs2)}")
+        return [f"{target(self.rd)} = {v} & M"]
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
+
+
+class SubwInstruction(InstructionR):
+    __slots__ = ()
+    opcode = 0b0111011
+    funct3 = 0b000
+    funct7 = 0b0100000
+
+    def run_by(self, simulator):
+        registers = simulator.registers
+        v_rs1 = registers.read_u(self.rs1)
+        v_rs2 = registers.read_u(self.rs2)
+        registers.write(self.rd, sign_extend(v_rs1 - v_rs2, 32))
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        v = word_signed(f"{local(self.rs1)} - {local(self.rs2)}")
+        return [f"{target(self.rd)} = {v} & M"]
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
+
+
+class SllwInstruction(InstructionR):
+    __slots__ = ()
+    opcode = 0b0111011
+    funct3 = 0b001
+    funct7 = 0b0000000
+
+    def run_by(self, simulator):
+        registers = simulator.registers
+        v_rs1 = registers.read_u(self.rs1)
+        v_rs2 = registers.read_u(self.rs2)
+        registers.write(self.rd, sign_extend(v_rs1 << (v_rs2 & 0b11111), 32))
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        v = word_signed(f"{local(self.rs1)} << ({local(self.rs2)} & 0b11111)")
+        return [f"{target(self.rd)} = {v} & M"]
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
+
+
+class SrlwInstruction(InstructionR):
+    __slots__ = ()
+    opcode = 0b0111011
+    funct3 = 0b101
+    funct7 = 0b0000000
+
+    def run_by(self, simulator):
+        registers = simulator.registers
+        v_rs1 = registers.read_u(self.rs1)
+        v_rs2 = registers.read_u(self.rs2)
+        registers.write(self.rd, sign_extend((v_rs1 & 0xffffffff) >> (v_rs2 & 0b11111), 32))
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        v = word_signed(
+            f"({local(self.rs1)} & 0xffffffff) >> ({local(self.rs2)} & 0b11111)")
+        return [f"{target(self.rd)} = {v} & M"]
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
+
+
+class SrawInstruction(InstructionR):
+    __slots__ = ()
+    opcode = 0b0111011
+    funct3 = 0b101
+    funct7 = 0b0100000
+
+    def run_by(self, simulator):
+        registers = simulator.registers
+        v_rs1 = registers.read_u(self.rs1)
+        v_rs2 = registers.read_u(self.rs2)
+        registers.write(self.rd, sign_extend(v_rs1, 32) >> (v_rs2 & 0b11111))
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        v = word_signed(local(self.rs1))
+        return [f"{target(self.rd)} = ({v} >> ({local(self.rs2)} & 0b11111)) & M"]
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
+
+
+class MulInstruction(InstructionR):
+    __slots__ = ()
+    opcode = 0b0110011
+    funct3 = 0b000
+    funct7 = 0b0000001
+
+    def run_by(self, simulator):
+        registers = simulator.registers
+        v_rs1 = registers.read_u(self.rs1)
+        v_rs2 = registers.read_u(self.rs2)
+        registers.write(self.rd, v_rs1 * v_rs2)
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = ({local(self.rs1)} * {local(self.rs2)}) & M"]
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
+
+
+class MulhInstruction(InstructionR):
+    __slots__ = ()
+    opcode = 0b0110011
+    funct3 = 0b001
+    funct7 = 0b0000001
+
+    def run_by(self, simulator):
+        registers = simulator.registers
+        v_rs1 = registers.read_s(self.rs1)
+        v_rs2 = registers.read_s(self.rs2)
+        registers.write(self.rd, v_rs1 * v_rs2 >> 64)
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = ({local_signed(self.rs1)} * {local_signed(self.rs2)} >> 64) & M"]
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
+
+
+class MulhsuInstruction(InstructionR):
+    __slots__ = ()
+    opcode = 0b0110011
+    funct3 = 0b010
+    funct7 = 0b0000001
+
+    def run_by(self, simulator):
+        registers = simulator.registers
+        v_rs1 = registers.read_s(self.rs1)
+        v_rs2 = registers.read_u(self.rs2)
+        registers.write(self.rd, v_rs1 * v_rs2 >> 64)
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = ({local_signed(self.rs1)} * {local(self.rs2)} >> 64) & M"]
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
+
+
+class MulhuInstruction(InstructionR):
+    __slots__ = ()
+    opcode = 0b0110011
+    funct3 = 0b011
+    funct7 = 0b0000001
+
+    def run_by(self, simulator):
+        registers = simulator.registers
+        v_rs1 = registers.read_u(self.rs1)
+        v_rs2 = registers.read_u(self.rs2)
+        registers.write(self.rd, v_rs1 * v_rs2 >> 64)
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = {local(self.rs1)} * {local(self.rs2)} >> 64"]
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
+
+
+class DivInstruction(InstructionR):
+    __slots__ = ()
+    opcode = 0b0110011
+    funct3 = 0b100
+    funct7 = 0b0000001
+
+    def run_by(self, simulator):
+        registers = simulator.registers
+        v_rs1 = registers.read_u(self.rs1)
+        v_rs2 = registers.read_u(self.rs2)
+        registers.write(self.rd, divide(v_rs1, v_rs2))
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = divide({local(self.rs1)}, {local(self.rs2)}) & M"]
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
+
+
+class DivuInstruction(InstructionR):
+    __slots__ = ()
+    opcode = 0b0110011
+    funct3 = 0b101
+    funct7 = 0b0000001
+
+    def run_by(self, simulator):
+        registers = simulator.registers
+        v_rs1 = registers.read_u(self.rs1)
+        v_rs2 = registers.read_u(self.rs2)
+        registers.write(self.rd, divide_unsigned(v_rs1, v_rs2))
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = divide_unsigned({local(self.rs1)}, {local(self.rs2)})"]
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
+
+
+class RemInstruction(InstructionR):
+    __slots__ = ()
+    opcode = 0b0110011
+    funct3 = 0b110
+    funct7 = 0b0000001
+
+    def run_by(self, simulator):
+        registers = simulator.registers
+        v_rs1 = registers.read_u(self.rs1)
+        v_rs2 = registers.read_u(self.rs2)
+        registers.write(self.rd, remainder(v_rs1, v_rs2))
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = remainder({local(self.rs1)}, {local(self.rs2)}) & M"]
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
+
+
+class RemuInstruction(InstructionR):
+    __slots__ = ()
+    opcode = 0b0110011
+    funct3 = 0b111
+    funct7 = 0b0000001
+
+    def run_by(self, simulator):
+        registers = simulator.registers
+        v_rs1 = registers.read_u(self.rs1)
+        v_rs2 = registers.read_u(self.rs2)
+        registers.write(self.rd, remainder_unsigned(v_rs1, v_rs2))
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = remainder_unsigned({local(self.rs1)}, {local(self.rs2)})"]
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
+
+
+class MulwInstruction(InstructionR):
+    __slots__ = ()
+    opcode = 0b0111011
+    funct3 = 0b000
+    funct7 = 0b0000001
+
+    def run_by(self, simulator):
+        registers = simulator.registers
+        v_rs1 = registers.read_u(self.rs1)
+        v_rs2 = registers.read_u(self.rs2)
+        registers.write(self.rd, sign_extend(v_rs1 * v_rs2, 32))
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = sign_extend({local(self.rs1)} * {local(self.rs2)}, 32) & M"]
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
+
+
+class DivwInstruction(InstructionR):
+    __slots__ = ()
+    opcode = 0b0111011
+    funct3 = 0b100
+    funct7 = 0b0000001
+
+    def run_by(self, simulator):
+        registers = simulator.registers
+        v_rs1 = registers.read_u(self.rs1)
+        v_rs2 = registers.read_u(self.rs2)
+        registers.write(self.rd, sign_extend(divide(v_rs1, v_rs2, 32), 32))
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = sign_extend(divide({local(self.rs1)}, {local(self.rs2)}, 32), 32) & M"]
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
+
+
+class DivuwInstruction(InstructionR):
+    __slots__ = ()
+    opcode = 0b0111011
+    funct3 = 0b101
+    funct7 = 0b0000001
+
+    def run_by(self, simulator):
+        registers = simulator.registers
+        v_rs1 = registers.read_u(self.rs1)
+        v_rs2 = registers.read_u(self.rs2)
+        registers.write(self.rd, sign_extend(divide_unsigned(v_rs1, v_rs2, 32), 32))
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = sign_extend(divide_unsigned({local(self.rs1)}, {local(self.rs2)}, 32), 32) & M"]
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
+
+
+class RemwInstruction(InstructionR):
+    __slots__ = ()
+    opcode = 0b0111011
+    funct3 = 0b110
+    funct7 = 0b0000001
+
+    def run_by(self, simulator):
+        registers = simulator.registers
+        v_rs1 = registers.read_u(self.rs1)
+        v_rs2 = registers.read_u(self.rs2)
+        registers.write(self.rd, sign_extend(remainder(v_rs1, v_rs2, 32), 32))
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = sign_extend(remainder({local(self.rs1)}, {local(self.rs2)}, 32), 32) & M"]
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
+
+
+class RemuwInstruction(InstructionR):
+    __slots__ = ()
+    opcode = 0b0111011
+    funct3 = 0b111
+    funct7 = 0b0000001
+
+    def run_by(self, simulator):
+        registers = simulator.registers
+        v_rs1 = registers.read_u(self.rs1)
+        v_rs2 = registers.read_u(self.rs2)
+        registers.write(self.rd, sign_extend(remainder_unsigned(v_rs1, v_rs2, 32), 32))
         pc = simulator.pc
-        simulator.pc = pc + 4
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = sign_extend(remainder_unsigned({local(self.rs1)}, {local(self.rs2)}, 32), 32) & M"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class LbInstruction(InstructionI):
+    __slots__ = ()
     opcode = 0b0000011
     funct3 = 0b000
 
     def run_by(self, simulator):
-        base_addr = simulator.registers[self.rs].get(SIZE, signed=False)
-        v = simulator.memory.read(base_addr+self.imm, 1, signed=True)
-        simulator.registers[self.rd].set(1, v)
+        registers = simulator.registers
+        addr = (registers.read_u(self.rs) + self.imm) & MASK
+        v = simulator.memory.read(addr, 1, signed=True)
+        registers.write(self.rd, v)
         pc = simulator.pc
-        simulator.pc = pc + 4
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"pc = {pc}",
+                f"{target(self.rd)} = read(({local(self.rs)} + {self.imm}) & M, "
+                f"1, signed=True) & M"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class LhInstruction(InstructionI):
+    __slots__ = ()
     opcode = 0b0000011
     funct3 = 0b001
 
     def run_by(self, simulator):
-        base_addr = simulator.registers[self.rs].get(SIZE, signed=False)
-        v = simulator.memory.read(base_addr+self.imm, 2, signed=True)
-        simulator.registers[self.rd].set(2, v)
+        registers = simulator.registers
+        addr = (registers.read_u(self.rs) + self.imm) & MASK
+        v = simulator.memory.read(addr, 2, signed=True)
+        registers.write(self.rd, v)
         pc = simulator.pc
-        simulator.pc = pc + 4
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"pc = {pc}",
+                f"{target(self.rd)} = read(({local(self.rs)} + {self.imm}) & M, "
+                f"2, signed=True) & M"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class LwInstruction(InstructionI):
+    __slots__ = ()
     opcode = 0b0000011
     funct3 = 0b010
 
     def run_by(self, simulator):
-        base_addr = simulator.registers[self.rs].get(SIZE, signed=False)
-        v = simulator.memory.read(base_addr+self.imm, 4, signed=True)
-        simulator.registers[self.rd].set(4, v)
+        registers = simulator.registers
+        addr = (registers.read_u(self.rs) + self.imm) & MASK
+        v = simulator.memory.read(addr, 4, signed=True)
+        registers.write(self.rd, v)
         pc = simulator.pc
-        simulator.pc = pc + 4
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"pc = {pc}",
+                f"{target(self.rd)} = read(({local(self.rs)} + {self.imm}) & M, "
+                f"4, signed=True) & M"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class LdInstruction(InstructionI):
+    __slots__ = ()
     opcode = 0b0000011
     funct3 = 0b011
 
     def run_by(self, simulator):
-        base_addr = simulator.registers[self.rs].get(SIZE, signed=False)
-        v = simulator.memory.read(base_addr+self.imm, 8, signed=True)
-        simulator.registers[self.rd].set(8, v)
+        registers = simulator.registers
+        addr = (registers.read_u(self.rs) + self.imm) & MASK
+        v = simulator.memory.read(addr, 8, signed=True)
+        registers.write(self.rd, v)
         pc = simulator.pc
-        simulator.pc = pc + 4
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"pc = {pc}",
+                f"{target(self.rd)} = read(({local(self.rs)} + {self.imm}) & M, "
+                f"8, signed=True) & M"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class LbuInstruction(InstructionI):
+    __slots__ = ()
     opcode = 0b0000011
-    funct3 = 100
+    funct3 = 0b100
 
     def run_by(self, simulator):
-        base_addr = simulator.registers[self.rs].get(SIZE, signed=False)
-        v = simulator.memory.read(base_addr+self.imm, 1, signed=False)
-        simulator.registers[self.rd].set(1, v)
+        registers = simulator.registers
+        addr = (registers.read_u(self.rs) + self.imm) & MASK
+        v = simulator.memory.read(addr, 1, signed=False)
+        registers.write(self.rd, v)
         pc = simulator.pc
-        simulator.pc = pc + 4
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"pc = {pc}",
+                f"{target(self.rd)} = read(({local(self.rs)} + {self.imm}) & M, "
+                f"1, signed=False)"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class LhuInstruction(InstructionI):
+    __slots__ = ()
     opcode = 0b0000011
     funct3 = 0b101
 
     def run_by(self, simulator):
-        base_addr = simulator.registers[self.rs].get(SIZE, signed=False)
-        v = simulator.memory.read(base_addr+self.imm, 2, signed=False)
-        simulator.registers[self.rd].set(2, v)
+        registers = simulator.registers
+        addr = (registers.read_u(self.rs) + self.imm) & MASK
+        v = simulator.memory.read(addr, 2, signed=False)
+        registers.write(self.rd, v)
         pc = simulator.pc
-        simulator.pc = pc + 4
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"pc = {pc}",
+                f"{target(self.rd)} = read(({local(self.rs)} + {self.imm}) & M, "
+                f"2, signed=False)"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class LwuInstruction(InstructionI):
+    __slots__ = ()
     opcode = 0b0000011
     funct3 = 0b110
 
     def run_by(self, simulator):
-        base_addr = simulator.registers[self.rs].get(SIZE, signed=False)
-        v = simulator.memory.read(base_addr+self.imm, 4, signed=False)
-        simulator.registers[self.rd].set(4, v)
+        registers = simulator.registers
+        addr = (registers.read_u(self.rs) + self.imm) & MASK
+        v = simulator.memory.read(addr, 4, signed=False)
+        registers.write(self.rd, v)
         pc = simulator.pc
-        simulator.pc = pc + 4
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"pc = {pc}",
+                f"{target(self.rd)} = read(({local(self.rs)} + {self.imm}) & M, "
+                f"4, signed=False)"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class AddiInstruction(InstructionI):
+    __slots__ = ()
     opcode = 0b0010011
     funct3 = 0b000
 
     def run_by(self, simulator):
-        v = simulator.registers[self.rs].get(SIZE, signed=False) + self.imm
-        simulator.registers[self.rd].set(SIZE, v)
+        registers = simulator.registers
+        v = registers.read_u(self.rs) + self.imm
+        registers.write(self.rd, v)
         pc = simulator.pc
-        simulator.pc = pc + 4
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = ({local(self.rs)} + {self.imm}) & M"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
-class SlliInstruction(InstructionI):
+class SlliInstruction(InstructionIShift):
+    __slots__ = ()
     opcode = 0b0010011
     funct3 = 0b001
     funct6 = 0b000000
 
     def run_by(self, simulator):
-        v = simulator.registers[self.rs].get(SIZE, signed=False) << self.imm
-        simulator.registers[self.rd].set(SIZE, v)
+        registers = simulator.registers
+        v = registers.read_u(self.rs) << self.imm
+        registers.write(self.rd, v)
         pc = simulator.pc
-        simulator.pc = pc + 4
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = ({local(self.rs)} << {self.imm}) & M"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
-class SrliInstruction(InstructionI):
+class SrliInstruction(InstructionIShift):
+    __slots__ = ()
     opcode = 0b0010011
     funct3 = 0b101
     funct6 = 0b000000
 
     def run_by(self, simulator):
-        v = simulator.registers[self.rs].get(SIZE, signed=False) >> self.imm
-        simulator.registers[self.rd].set(SIZE, v)
+        registers = simulator.registers
+        v = registers.read_u(self.rs) >> self.imm
+        registers.write(self.rd, v)
         pc = simulator.pc
-        simulator.pc = pc + 4
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = {local(self.rs)} >> {self.imm}"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
-class SraiInstruction(InstructionI):
+class SraiInstruction(InstructionIShift):
+    __slots__ = ()
     opcode = 0b0010011
     funct3 = 0b101
     funct6 = 0b010000
 
     def run_by(self, simulator):
-        v = simulator.registers[self.rs].get(SIZE, signed=True) >> self.imm
-        simulator.registers[self.rd].set(SIZE, v)
+        registers = simulator.registers
+        v = registers.read_s(self.rs) >> self.imm
+        registers.write(self.rd, v)
         pc = simulator.pc
-        simulator.pc = pc + 4
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = ({local_signed(self.rs)} >> {self.imm}) & M"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class XoriInstruction(InstructionI):
+    __slots__ = ()
     opcode = 0b0010011
-    funct3 = 100
+    funct3 = 0b100
 
     def run_by(self, simulator):
-        v = simulator.registers[self.rs].get(SIZE, signed=False) ^ self.imm
-        simulator.registers[self.rd].set(SIZE, v)
+        registers = simulator.registers
+        v = registers.read_u(self.rs) ^ self.imm
+        registers.write(self.rd, v)
         pc = simulator.pc
-        simulator.pc = pc + 4
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = ({local(self.rs)} ^ {self.imm}) & M"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class OriInstruction(InstructionI):
+    __slots__ = ()
     opcode = 0b0010011
     funct3 = 0b110
 
     def run_by(self, simulator):
-        v = simulator.registers[self.rs].get(SIZE, signed=False) | self.imm
-        simulator.registers[self.rd].set(SIZE, v)
+        registers = simulator.registers
+        v = registers.read_u(self.rs) | self.imm
+        registers.write(self.rd, v)
         pc = simulator.pc
-        simulator.pc = pc + 4
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = ({local(self.rs)} | {self.imm}) & M"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class AndiInstruction(InstructionI):
+    __slots__ = ()
     opcode = 0b0010011
     funct3 = 0b111
 
     def run_by(self, simulator):
-        v = simulator.registers[self.rs].get(SIZE, signed=False) & self.imm
-        simulator.registers[self.rd].set(SIZE, v)
+        registers = simulator.registers
+        v = registers.read_u(self.rs) & self.imm
+        registers.write(self.rd, v)
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"{target(self.rd)} = {local(self.rs)} & {self.imm}"]
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
+
+
+class AddiwInstruction(InstructionI):
+    __slots__ = ()
+    opcode = 0b0011011
+    funct3 = 0b000
+
+    def run_by(self, simulator):
+        registers = simulator.registers
+        v = sign_extend(registers.read_u(self.rs) + self.imm, 32)
+        registers.write(self.rd, v)
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        v = word_signed(f"{local(self.rs)} + {self.imm}")
+        return [f"{target(self.rd)} = {v} & M"]
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
+
+
+class SlliwInstruction(InstructionIShiftW):
+    __slots__ = ()
+    opcode = 0b0011011
+    funct3 = 0b001
+    funct7 = 0b0000000
+
+    def run_by(self, simulator):
+        registers = simulator.registers
+        v = sign_extend(registers.read_u(self.rs) << self.imm, 32)
+        registers.write(self.rd, v)
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        v = word_signed(f"{local(self.rs)} << {self.imm}")
+        return [f"{target(self.rd)} = {v} & M"]
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
+
+
+class SrliwInstruction(InstructionIShiftW):
+    __slots__ = ()
+    opcode = 0b0011011
+    funct3 = 0b101
+    funct7 = 0b0000000
+
+    def run_by(self, simulator):
+        registers = simulator.registers
+        v = sign_extend((registers.read_u(self.rs) & 0xffffffff) >> self.imm, 32)
+        registers.write(self.rd, v)
         pc = simulator.pc
-        simulator.pc = pc + 4
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        v = word_signed(f"({local(self.rs)} & 0xffffffff) >> {self.imm}")
+        return [f"{target(self.rd)} = {v} & M"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
+
+
+class SraiwInstruction(InstructionIShiftW):
+    __slots__ = ()
+    opcode = 0b0011011
+    funct3 = 0b101
+    funct7 = 0b0100000
+
+    def run_by(self, simulator):
+        registers = simulator.registers
+        v = sign_extend(registers.read_u(self.rs), 32) >> self.imm
+        registers.write(self.rd, v)
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        v = word_signed(local(self.rs))
+        return [f"{target(self.rd)} = ({v} >> {self.imm}) & M"]
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class JalrInstruction(InstructionI):
+    __slots__ = ()
     opcode = 0b1100111
     funct3 = 0b000
+    ends_block = True
 
     def run_by(self, simulator):
-        v = simulator.registers[self.rs].get(SIZE, signed=False) + self.imm
+        registers = simulator.registers
+        v = (registers.read_u(self.rs) + self.imm) & MASK & ~1
         pc = simulator.pc
-        simulator.registers[self.rd].set(SIZE, pc + 4)
+        registers.write(self.rd, pc + self.length)
         simulator.pc = v
 
+    def translate(self, pc):
+        return [f"pc = ({local(self.rs)} + {self.imm}) & M & ~1",
+                f"{target(self.rd)} = {pc + self.length}"]
+
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class SbInstruction(InstructionS):
+    __slots__ = ()
     opcode = 0b0100011
     funct3 = 0b000
 
     def run_by(self, simulator):
-        v = simulator.registers[self.rs2].get(1, signed=False)
-        addr = simulator.registers[self.rs1].get(SIZE, signed=False) + self.imm
+        registers = simulator.registers
+        v = registers.read_u(self.rs2)
+        addr = (registers.read_u(self.rs1) + self.imm) & MASK
         simulator.memory.write(addr, 1, v)
-        simulator.registers[self.rd].set(SIZE, pc + 4)
-        simulator.pc = v
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"pc = {pc}",
+                f"write(({local(self.rs1)} + {self.imm}) & M, 1, "
+                f"{local(self.rs2)})"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class ShInstruction(InstructionS):
+    __slots__ = ()
     opcode = 0b0100011
     funct3 = 0b001
 
     def run_by(self, simulator):
-        v = simulator.registers[self.rs2].get(2, signed=False)
-        addr = simulator.registers[self.rs1].get(SIZE, signed=False) + self.imm
+        registers = simulator.registers
+        v = registers.read_u(self.rs2)
+        addr = (registers.read_u(self.rs1) + self.imm) & MASK
         simulator.memory.write(addr, 2, v)
-        simulator.registers[self.rd].set(SIZE, pc + 4)
-        simulator.pc = v
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"pc = {pc}",
+                f"write(({local(self.rs1)} + {self.imm}) & M, 2, "
+                f"{local(self.rs2)})"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class SwInstruction(InstructionS):
+    __slots__ = ()
     opcode = 0b0100011
     funct3 = 0b010
 
     def run_by(self, simulator):
-        v = simulator.registers[self.rs2].get(4, signed=False)
-        addr = simulator.registers[self.rs1].get(SIZE, signed=False) + self.imm
+        registers = simulator.registers
+        v = registers.read_u(self.rs2)
+        addr = (registers.read_u(self.rs1) + self.imm) & MASK
         simulator.memory.write(addr, 4, v)
-        simulator.registers[self.rd].set(SIZE, pc + 4)
-        simulator.pc = v
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"pc = {pc}",
+                f"write(({local(self.rs1)} + {self.imm}) & M, 4, "
+                f"{local(self.rs2)})"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class SdInstruction(InstructionS):
+    __slots__ = ()
     opcode = 0b0100011
-    funct3 = 0b111
+    funct3 = 0b011
 
     def run_by(self, simulator):
-        v = simulator.registers[self.rs2].get(8, signed=False)
-        addr = simulator.registers[self.rs1].get(SIZE, signed=False) + self.imm
+        registers = simulator.registers
+        v = registers.read_u(self.rs2)
+        addr = (registers.read_u(self.rs1) + self.imm) & MASK
         simulator.memory.write(addr, 8, v)
-        simulator.registers[self.rd].set(SIZE, pc + 4)
-        simulator.pc = v
+        pc = simulator.pc
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        return [f"pc = {pc}",
+                f"write(({local(self.rs1)} + {self.imm}) & M, 8, "
+                f"{local(self.rs2)})"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class BeqInstruction(InstructionSB):
-    opcode = 0b1100111
+    __slots__ = ()
+    opcode = 0b1100011
     funct3 = 0b000
 
     def run_by(self, simulator):
-        v1 = simulator.registers[self.rs1].get(SIZE, signed=True)
-        v2 = simulator.registers[self.rs2].get(SIZE, signed=True)
+        registers = simulator.registers
+        v1 = registers.read_s(self.rs1)
+        v2 = registers.read_s(self.rs2)
         pc = simulator.pc
         if v1 == v2:
             pc += self.imm * 2
         else:
-            pc += 4
+            pc += self.length
         simulator.pc = pc
 
+    def translate(self, pc):
+        return [f"pc = {pc + self.imm * 2} "
+                f"if {local_signed(self.rs1)} == {local_signed(self.rs2)} else {pc + self.length}"]
+
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class BneInstruction(InstructionSB):
-    opcode = 0b1100111
+    __slots__ = ()
+    opcode = 0b1100011
     funct3 = 0b001
 
     def run_by(self, simulator):
-        v1 = simulator.registers[self.rs1].get(SIZE, signed=True)
-        v2 = simulator.registers[self.rs2].get(SIZE, signed=True)
+        registers = simulator.registers
+        v1 = registers.read_s(self.rs1)
+        v2 = registers.read_s(self.rs2)
         pc = simulator.pc
         if v1 != v2:
             pc += self.imm * 2
         else:
-            pc += 4
+            pc += self.length
         simulator.pc = pc
 
+    def translate(self, pc):
+        return [f"pc = {pc + self.imm * 2} "
+                f"if {local_signed(self.rs1)} != {local_signed(self.rs2)} else {pc + self.length}"]
+
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class BltInstruction(InstructionSB):
-    opcode = 0b1100111
+    __slots__ = ()
+    opcode = 0b1100011
     funct3 = 0b100
 
     def run_by(self, simulator):
-        v1 = simulator.registers[self.rs1].get(SIZE, signed=True)
-        v2 = simulator.registers[self.rs2].get(SIZE, signed=True)
+        registers = simulator.registers
+        v1 = registers.read_s(self.rs1)
+        v2 = registers.read_s(self.rs2)
         pc = simulator.pc
         if v1 < v2:
             pc += self.imm * 2
         else:
-            pc += 4
+            pc += self.length
         simulator.pc = pc
 
+    def translate(self, pc):
+        return [f"pc = {pc + self.imm * 2} "
+                f"if {local_signed(self.rs1)} < {local_signed(self.rs2)} else {pc + self.length}"]
+
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class BgeInstruction(InstructionSB):
-    opcode = 0b1100111
+    __slots__ = ()
+    opcode = 0b1100011
     funct3 = 0b101
 
     def run_by(self, simulator):
-        v1 = simulator.registers[self.rs1].get(SIZE, signed=True)
-        v2 = simulator.registers[self.rs2].get(SIZE, signed=True)
+        registers = simulator.registers
+        v1 = registers.read_s(self.rs1)
+        v2 = registers.read_s(self.rs2)
         pc = simulator.pc
         if v1 >= v2:
             pc += self.imm * 2
         else:
-            pc += 4
+            pc += self.length
         simulator.pc = pc
 
+    def translate(self, pc):
+        return [f"pc = {pc + self.imm * 2} "
+                f"if {local_signed(self.rs1)} >= {local_signed(self.rs2)} else {pc + self.length}"]
+
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class BltuInstruction(InstructionSB):
-    opcode = 0b1100111
-    funct3 = 110
+    __slots__ = ()
+    opcode = 0b1100011
+    funct3 = 0b110
 
     def run_by(self, simulator):
-        v1 = simulator.registers[self.rs1].get(SIZE, signed=False)
-        v2 = simulator.registers[self.rs2].get(SIZE, signed=False)
+        registers = simulator.registers
+        v1 = registers.read_u(self.rs1)
+        v2 = registers.read_u(self.rs2)
         pc = simulator.pc
         if v1 < v2:
             pc += self.imm * 2
         else:
-            pc += 4
+            pc += self.length
         simulator.pc = pc
 
+    def translate(self, pc):
+        return [f"pc = {pc + self.imm * 2} "
+                f"if {local(self.rs1)} < {local(self.rs2)} else {pc + self.length}"]
+
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class BgeuInstruction(InstructionSB):
-    opcode = 0b1100111
+    __slots__ = ()
+    opcode = 0b1100011
     funct3 = 0b111
 
     def run_by(self, simulator):
-        v1 = simulator.registers[self.rs1].get(SIZE, signed=False)
-        v2 = simulator.registers[self.rs2].get(SIZE, signed=False)
+        registers = simulator.registers
+        v1 = registers.read_u(self.rs1)
+        v2 = registers.read_u(self.rs2)
         pc = simulator.pc
         if v1 >= v2:
             pc += self.imm * 2
         else:
-            pc += 4
+            pc += self.length
         simulator.pc = pc
 
+    def translate(self, pc):
+        return [f"pc = {pc + self.imm * 2} "
+                f"if {local(self.rs1)} >= {local(self.rs2)} else {pc + self.length}"]
+
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class LuiInstruction(InstructionU):
+    __slots__ = ()
     opcode = 0b0110111
 
     def run_by(self, simulator):
-        v = self.imm << 12
-        simulator.registers[self.rd].set(4, v)
+        v = sign_extend(self.imm << 12, 32)
+        simulator.registers.write(self.rd, v)
         pc = simulator.pc
-        simulator.pc = pc + 4
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        v = sign_extend(self.imm << 12, 32) & MASK
+        return [f"{target(self.rd)} = {v}"]
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
+
+
+class AuipcInstruction(InstructionU):
+    __slots__ = ()
+    opcode = 0b0010111
+
+    def run_by(self, simulator):
+        pc = simulator.pc
+        v = pc + sign_extend(self.imm << 12, 32)
+        simulator.registers.write(self.rd, v)
+        simulator.pc = pc + self.length
+
+    def translate(self, pc):
+        v = (pc + sign_extend(self.imm << 12, 32)) & MASK
+        return [f"{target(self.rd)} = {v}"]
 
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
 
 
 class JalInstruction(InstructionUJ):
+    __slots__ = ()
     opcode = 0b1101111
+    ends_block = True
 
     def run_by(self, simulator):
         pc = simulator.pc
         v = pc + self.imm * 2
-        simulator.registers[self.rd].set(SIZE, pc + 4)
+        simulator.registers.write(self.rd, pc + self.length)
         simulator.pc = v
 
+    def translate(self, pc):
+        return [f"{target(self.rd)} = {pc + self.length}",
+                f"pc = {pc + self.imm * 2}"]
+
     def __repr__(self):
-        return f"<{__class__.__name__} {int(self):0=#10x} {vars(self)}>"
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
+
+
+class EcallInstruction(Instruction):
+    # a system call to `Simulator.syscalls`, see `riscvsim.syscalls`;
+    # not translated, so it always runs through `run_by`
+    __slots__ = ()
+    opcode = 0b1110011
+    funct3 = 0b000
+    funct7 = 0b0000000
+
+    def __init__(self):
+        object.__setattr__(self, "word", self.encode())
 
+    def encode(self):
+        return self.opcode
+
+    @classmethod
+    def decode(cls, word):
+        if word != cls.opcode:
+            raise ValueError(f"The word `{word:0=#10x}` is not a supported "
+                             f"instruction.")
+        return cls()
+
+    def run_by(self, simulator):
+        if simulator.syscalls is None:
+            raise RuntimeError(
+                "The 'ecall' needs a handler in 'Simulator.syscalls'.")
+        try:
+            simulator.syscalls.handle(simulator)
+        except ProgramExit as e:
+            # the program stays at the ecall
+            simulator.exit_code = e.code
+            raise
+        simulator.pc = simulator.pc + self.length
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {int(self):0=#10x} {self.fields()}>"
+
+
+# the kind and size in bytes of the memory access of loads and stores
+LOAD = 1
+STORE = 2
+
+memory_accesses = {
+    LbInstruction:  (LOAD, 1),
+    LhInstruction:  (LOAD, 2),
+    LwInstruction:  (LOAD, 4),
+    LdInstruction:  (LOAD, 8),
+    LbuInstruction: (LOAD, 1),
+    LhuInstruction: (LOAD, 2),
+    LwuInstruction: (LOAD, 4),
+    SbInstruction:  (STORE, 1),
+    ShInstruction:  (STORE, 2),
+    SwInstruction:  (STORE, 4),
+    SdInstruction:  (STORE, 8),
+}
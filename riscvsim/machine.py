@@ -0,0 +1,238 @@
+""" Multi-hart machine
+
+A `Machine` owns one `Memory` shared by N harts. Each hart is a
+`Simulator` with its own registers and pc whose `memory` is the shared
+one, so a store of one hart is seen by the next load of any other, and
+decoded instructions and translated blocks are shared too. At reset
+every hart starts at the same pc with its index in a0, as boot loaders
+pass the hart id.
+
+`run` interleaves the harts round-robin, `quantum` instructions at a
+time, on the calling thread. `run_parallel` runs the harts concurrently
+until a synchronization point, each on a copy-on-write copy of the
+memory, and then writes back the bytes each one changed, in hart order.
+It is only equivalent to `run` for harts which share no data until that
+point. A thread pool avoids copying the memory but only overlaps harts
+on a free-threaded Python; a process pool ships the memory image to
+every worker, like `riscvsim.batch.run_batch`.
+
+A hart which made the exit system call, see `riscvsim.syscalls`, stops
+like one at `until_pc`. Under `run_parallel` the harts share their
+`syscalls` handler with threads, and can not have one with processes.
+"""
+
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from . import batch
+from .simulator import Memory, Simulator
+
+EXECUTORS = ("thread", "process")
+
+
+def merge(memory, changes):
+    """Write the bytes which differ in the `(addr, old, new)` changes."""
+    for addr, old, new in changes:
+        start = None
+        for i, (a, b) in enumerate(zip(old, new)):
+            if a != b:
+                if start is None:
+                    start = i
+            elif start is not None:
+                memory.write_bytes(addr + start, new[start:i])
+                start = None
+        if start is not None:
+            memory.write_bytes(addr + start, new[start:])
+
+
+def running(harts, until_pc):
+    """Return the harts neither at `until_pc` nor exited."""
+    return [hart for hart in harts
+            if hart.pc != until_pc and hart.exit_code is None]
+
+
+def run_hart(state):
+    pc, registers = state
+    simulator = batch.worker["simulator"]
+    snapshot = batch.worker["snapshot"]
+    simulator.restore(snapshot)
+    simulator.pc = pc
+    simulator.registers.values[:] = registers
+    steps = simulator.run(**batch.worker["options"])
+    return (simulator.pc, tuple(simulator.registers.values), steps,
+            simulator.memory.diff(snapshot.memory), simulator.exit_code)
+
+
+class Machine:
+    """Harts sharing one memory.
+
+    Parameters
+    ----------
+    harts : int, default 1
+    memory : Memory, optional
+    pc : int, default 0
+        The reset pc of every hart.
+    quantum : int, default 1000
+        Instructions a hart runs before `run` switches to the next one.
+
+    Attributes
+    ----------
+    harts : list of Simulator
+        Their `instret` counts the instructions of each hart.
+    run_ns : int
+        Time spent running harts.
+    scheduler_ns : int
+        Time spent by `run` and `run_parallel` around the harts: picking
+        them, and for `run_parallel` copying and merging memory and
+        starting the pool.
+    """
+
+    def __init__(self, harts=1, memory=None, *, pc=0, quantum=1000):
+        if harts < 1:
+            raise ValueError(f"The 'harts' should be at least 1, "
+                             f"got {harts}.")
+        self.memory = Memory() if memory is None else memory
+        self.harts = []
+        for i in range(harts):
+            hart = Simulator(pc=pc, a0=i)
+            hart.memory = self.memory
+            self.harts.append(hart)
+        self.quantum = quantum
+        self.run_ns = 0
+        self.scheduler_ns = 0
+
+    def __repr__(self):
+        return (f"<{__class__.__name__} {len(self.harts)} harts "
+                f"quantum={self.quantum}>")
+
+    def assemble(self, text, base=0):
+        """Assemble `text` into the shared memory, see `Simulator.assemble`."""
+        return self.harts[0].assemble(text, base)
+
+    def run(self, max_steps=None, until_pc=None, *, quantum=None,
+            translate=False):
+        """Interleave the harts until all of them are at `until_pc`.
+
+        Without `until_pc` nor `max_steps`, until all of them exited.
+
+        Parameters
+        ----------
+        max_steps : int, optional
+            Stop after this many instructions of all harts together.
+        until_pc : int, optional
+            A hart at this address does not run any more.
+        quantum : int, optional
+            Default `self.quantum`.
+        translate : bool, default False
+            Passed to `Simulator.run`.
+
+        Returns
+        -------
+        int
+            The number of executed instructions.
+        """
+        quantum = quantum or self.quantum
+        clock = time.perf_counter_ns
+        start = clock()
+        inside = 0
+        steps = 0
+        harts = running(self.harts, until_pc)
+        try:
+            while harts and (max_steps is None or steps < max_steps):
+                for hart in harts:
+                    n = quantum
+                    if max_steps is not None:
+                        n = min(n, max_steps - steps)
+                        if n == 0:
+                            break
+                    t = clock()
+                    try:
+                        steps += hart.run(n, until_pc, translate=translate)
+                    finally:
+                        inside += clock() - t
+                harts = running(harts, until_pc)
+        finally:
+            self.run_ns += inside
+            self.scheduler_ns += clock() - start - inside
+        return steps
+
+    def run_parallel(self, max_steps=None, until_pc=None, *,
+                     executor="thread", workers=None, translate=False):
+        """Run the harts concurrently to the next synchronization point.
+
+        Every hart runs until `until_pc` or for `max_steps` of its own
+        instructions, as `Simulator.run`, then the memory changes are
+        merged. At least one of them should be given.
+
+        Parameters
+        ----------
+        executor : {"thread", "process"}
+        workers : int, optional
+            The size of the pool, default one per running hart.
+
+        Returns
+        -------
+        int
+            The number of executed instructions.
+        """
+        if executor not in EXECUTORS:
+            raise ValueError(f"The 'executor' should be one of "
+                             f"{EXECUTORS}, got {executor!r}.")
+        clock = time.perf_counter_ns
+        start = clock()
+        harts = running(self.harts, until_pc)
+        if not harts:
+            return 0
+        if executor == "process" and any(hart.syscalls is not None
+                                         for hart in harts):
+            raise ValueError("The 'executor' should be 'thread' for harts "
+                             "with 'syscalls', got 'process'.")
+        workers = workers or len(harts)
+        options = dict(max_steps=max_steps, until_pc=until_pc,
+                       translate=translate)
+        if executor == "thread":
+            copies = [hart.copy() for hart in harts]
+            t = clock()
+            with ThreadPoolExecutor(workers) as pool:
+                steps = list(pool.map(lambda sim: sim.run(**options),
+                                      copies))
+            inside = clock() - t
+            results = [(sim.pc, sim.registers.values, n,
+                        sim.memory.diff(self.memory), sim.exit_code)
+                       for sim, n in zip(copies, steps)]
+        else:
+            memory = self.memory
+            image = (0, (0,) * 32, memory.addr_max,
+                     memory.image())
+            t = clock()
+            with ProcessPoolExecutor(workers, initializer=batch.init_worker,
+                                     initargs=(image, options)) as pool:
+                results = list(pool.map(
+                    run_hart,
+                    [(hart.pc, tuple(hart.registers.values))
+                     for hart in harts]))
+            inside = clock() - t
+
+        # every diff is against the memory before the run
+        total = 0
+        for hart, (pc, registers, n, changes, exit_code) in zip(harts,
+                                                                  results):
+            merge(self.memory, changes)
+            hart.pc = pc
+            hart.exit_code = exit_code
+            hart.registers.values[:] = registers
+            hart.cycle += n
+            hart.instret += n
+            total += n
+        self.run_ns += inside
+        self.scheduler_ns += clock() - start - inside
+        return total
+
+    def as_dict(self):
+        """Return the pc and instructions of every hart and the timings."""
+        return {
+            "harts": [{"pc": hart.pc, "instret": hart.instret}
+                      for hart in self.harts],
+            "run_ns": self.run_ns,
+            "scheduler_ns": self.scheduler_ns,
+        }
@@ -0,0 +1,188 @@
+""" Memory-mapped file backing
+
+`MappedMemory` keeps the whole guest address space in an `mmap` of a
+sparse file instead of a dict of pages, so the OS pages data in lazily
+and a multi-GB image costs nothing until it is touched. The file is the
+RAM image: `flush` saves it, and other processes can map the same file,
+either shared or `private` (copy-on-write, leaving the file untouched),
+e.g. to preload a large dataset once and start many runs from it.
+"""
+
+import mmap
+import os
+
+from .config import PAGE_SHIFT, PAGE_SIZE
+from .simulator import Memory
+
+
+def data_pages(fd, size):
+    """Return the numbers of the pages of the file which are not holes."""
+    numbers = set()
+    try:
+        offset = os.lseek(fd, 0, os.SEEK_DATA)
+        while offset < size:
+            end = min(os.lseek(fd, offset, os.SEEK_HOLE), size)
+            numbers.update(range(offset >> PAGE_SHIFT,
+                                 ((end - 1) >> PAGE_SHIFT) + 1))
+            offset = os.lseek(fd, end, os.SEEK_DATA)
+    except OSError:
+        # ENXIO: no data after offset
+        pass
+    except AttributeError:
+        # no SEEK_DATA on this platform, every page may hold data
+        numbers.update(range((size + PAGE_SIZE - 1) >> PAGE_SHIFT))
+    return numbers
+
+
+class MappedPages:
+    # The `pages` of a `MappedMemory`: every page is a slice of the
+    # mapping, but only the ones which may hold data are iterated over.
+
+    def __init__(self, view, numbers):
+        self.view = view
+        self.numbers = numbers
+
+    def get(self, page_number, default=None):
+        return self.view[page_number << PAGE_SHIFT:
+                         (page_number + 1) << PAGE_SHIFT]
+
+    __getitem__ = get
+
+    def __contains__(self, page_number):
+        return page_number in self.numbers
+
+    def __iter__(self):
+        return iter(self.numbers)
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def items(self):
+        return ((_, self.get(_)) for _ in self.numbers)
+
+
+class MappedMemory(Memory):
+    """`Memory` stored in an `mmap` of the file at `path`.
+
+    Parameters
+    ----------
+    path : str
+        Created if missing and extended to `addr_max + 1` bytes as a
+        sparse file, unless `private`.
+    addr_max : int, optional
+        Default the size of an existing non-empty file minus 1,
+        otherwise 0xffffffff.
+    private : bool, default False
+        Map the file copy-on-write: writes stay in this process and the
+        file is only read, so it must already be large enough.
+
+    Note
+    ----
+    `copy` (and so `Simulator.snapshot`) gives a plain `Memory` holding
+    a copy of every page with data, so it costs O(data) here; to start
+    many runs from one image, map it `private` once per run instead.
+    """
+
+    def __init__(self, path, addr_max=None, *, private=False):
+        fd = os.open(path, os.O_RDONLY if private else os.O_RDWR | os.O_CREAT)
+        try:
+            size = os.fstat(fd).st_size
+            if addr_max is None:
+                addr_max = size - 1 if size else 0xffffffff
+            if size < addr_max + 1:
+                if private:
+                    raise ValueError(f"The file should have at least "
+                                     f"{addr_max + 1:#x} bytes, got {size:#x}.")
+                os.ftruncate(fd, addr_max + 1)
+            self.mmap = mmap.mmap(
+                fd, addr_max + 1,
+                access=mmap.ACCESS_COPY if private else mmap.ACCESS_WRITE)
+            numbers = data_pages(fd, min(size, addr_max + 1))
+        finally:
+            os.close(fd)
+        super().__init__(addr_max=addr_max)
+        self.path = path
+        self.private = private
+        self.view = memoryview(self.mmap)
+        self.pages = MappedPages(self.view, numbers)
+
+    def read(self, addr, bytes_num, *, signed):
+        self.check(addr, bytes_num)
+        return int.from_bytes(self.view[addr:addr+bytes_num],
+                              "little", signed=signed)
+
+    def write(self, addr, bytes_num, value):
+        self.check(addr, bytes_num)
+        self.view[addr:addr+bytes_num] = (
+            value & ((1 << (bytes_num * 8)) - 1)).to_bytes(bytes_num, "little")
+        numbers = self.pages.numbers
+        numbers.add(addr >> PAGE_SHIFT)
+        numbers.add((addr + bytes_num - 1) >> PAGE_SHIFT)
+        if ((addr - 3) >> PAGE_SHIFT in self.icache_pages
+                or addr >> PAGE_SHIFT in self.icache_pages):
+            self.invalidate(addr, bytes_num)
+
+    def read_bytes(self, addr, size):
+        """Read `size` bytes starting from `addr` as `bytes`."""
+        self.check(addr, size)
+        return bytes(self.view[addr:addr+size])
+
+    def write_bytes(self, addr, data):
+        """Write the bytes-like `data` starting from `addr`."""
+        size = len(data)
+        self.check(addr, size)
+        if not size:
+            return
+        self.view[addr:addr+size] = memoryview(data).cast("B")
+        self.pages.numbers.update(range(addr >> PAGE_SHIFT,
+                                        ((addr + size - 1) >> PAGE_SHIFT) + 1))
+        if self.icache_pages:
+            self.invalidate(addr, size)
+
+    def clear(self, addr, size):
+        """Zero `size` bytes from `addr`, skipping the pages without data."""
+        self.check(addr, size)
+        start, end = addr, addr + size
+        for page_number in sorted(self.pages.numbers):
+            first = max(start, page_number << PAGE_SHIFT)
+            last = min(end, (page_number + 1) << PAGE_SHIFT)
+            if first < last:
+                self.view[first:last] = bytes(last - first)
+        if self.icache_pages:
+            self.invalidate(start, size)
+
+    def writable_page(self, page_number):
+        self.pages.numbers.add(page_number)
+        return self.pages[page_number]
+
+    def copy(self):
+        memory = Memory(addr_max=self.addr_max)
+        zero = bytes(PAGE_SIZE)
+        for page_number in self.pages:
+            page = self.pages[page_number]
+            if page != zero:
+                memory.pages[page_number] = bytearray(page)
+        return memory
+
+    def restore(self, memory):
+        """Make the content equal to `memory` by copying its pages."""
+        for page_number in list(self.icache_pages):
+            self.invalidate(page_number << PAGE_SHIFT, PAGE_SIZE)
+        self.icache_pages.clear()
+        zero = bytes(PAGE_SIZE)
+        for page_number in list(self.pages):
+            if page_number not in memory.pages:
+                self.pages[page_number][:] = zero
+        for page_number in memory.pages:
+            self.write_bytes(page_number << PAGE_SHIFT,
+                             memory.pages[page_number])
+
+    def flush(self):
+        """Write the changes back to the file, unless `private`."""
+        if not self.private:
+            self.mmap.flush()
+
+    def close(self):
+        self.pages.view = None
+        self.view.release()
+        self.mmap.close()
@@ -0,0 +1,131 @@
+""" 5-stage in-order pipeline timing model
+
+`Pipeline` estimates the cycles of a classic IF/ID/EX/MEM/WB pipeline
+from the stream of retired instructions, without simulating the stages
+themselves: it only keeps the cycle each instruction enters EX and the
+cycle each register value becomes usable, so it runs in constant memory
+over any number of instructions. Set it as `Simulator.timing`, or feed
+it a recorded trace with `riscvsim.trace.replay`.
+
+Timing rules, counted in stall cycles by cause:
+
+- "data": with forwarding, an ALU result is usable by the next
+  instruction in EX; without it, a value is only read in ID after WB,
+  2 cycles after the producer leaves EX.
+- "load_use": with forwarding, a loaded value reaches EX one cycle
+  after the load's MEM, so a dependent instruction right after a load
+  waits 1 cycle.
+- "branch": conditional branches resolve in EX, a misprediction flushes
+  `branch_penalty` cycles.
+- "jump": `jal` is redirected in ID (1 cycle), `jalr` in EX
+  (`branch_penalty` cycles).
+"""
+
+from .instructions import (
+    InstructionSB,
+    JalInstruction,
+    JalrInstruction,
+    LOAD,
+    memory_accesses,
+)
+from .predictor import StaticPredictor
+
+STAGES = 5
+
+
+class Pipeline:
+    """Cycle-approximate timing of retired instructions.
+
+    Parameters
+    ----------
+    forwarding : bool, default True
+    predictor : optional
+        Predicts conditional branches, see `riscvsim.predictor`;
+        default always not taken.
+    branch_penalty : int, default 2
+        Cycles lost on a mispredicted branch or a `jalr`.
+
+    Attributes
+    ----------
+    instructions : int
+    stalls : dict
+        Stall cycles by cause.
+    """
+
+    def __init__(self, forwarding=True, predictor=None, branch_penalty=2):
+        self.forwarding = forwarding
+        self.predictor = predictor or StaticPredictor(taken=False)
+        self.branch_penalty = branch_penalty
+        self.clear()
+
+    def clear(self):
+        self.instructions = 0
+        self.stalls = {"data": 0, "load_use": 0, "branch": 0, "jump": 0}
+        # the cycle the last instruction was in EX, and its control penalty
+        self.ex = STAGES - 3
+        self.penalty = 0
+        # per register: the first cycle a consumer can be in EX, and
+        # whether the value comes from a load
+        self.ready = [0] * 32
+        self.loaded = [False] * 32
+
+    def retire(self, pc, instruction, next_pc):
+        """Account for `instruction` at `pc`, after which `next_pc` ran."""
+        ex = self.ex + 1 + self.penalty
+        self.penalty = 0
+        ready = self.ready
+        binding = 0
+        for field in ("rs", "rs1", "rs2"):
+            r = getattr(instruction, field, 0)
+            if r and ready[r] > ex and ready[r] > ready[binding]:
+                binding = r
+        if binding:
+            cause = "load_use" if self.loaded[binding] else "data"
+            self.stalls[cause] += ready[binding] - ex
+            ex = ready[binding]
+
+        rd = getattr(instruction, "rd", 0)
+        if rd:
+            load = memory_accesses.get(type(instruction), (0,))[0] == LOAD
+            if not self.forwarding:
+                ready[rd] = ex + 3
+            else:
+                ready[rd] = ex + 2 if load else ex + 1
+            self.loaded[rd] = load and self.forwarding
+
+        if isinstance(instruction, InstructionSB):
+            taken = (next_pc is not None
+                     and next_pc != pc + instruction.length)
+            predicted = self.predictor.predict(pc)
+            self.predictor.update(pc, taken)
+            if predicted != taken:
+                self.penalty = self.branch_penalty
+                self.stalls["branch"] += self.penalty
+        elif isinstance(instruction, JalInstruction):
+            self.penalty = 1
+            self.stalls["jump"] += 1
+        elif isinstance(instruction, JalrInstruction):
+            self.penalty = self.branch_penalty
+            self.stalls["jump"] += self.penalty
+
+        self.ex = ex
+        self.instructions += 1
+
+    @property
+    def cycles(self):
+        """Cycles until the last instruction leaves WB."""
+        if not self.instructions:
+            return 0
+        return self.ex + 2
+
+    @property
+    def cpi(self):
+        return self.cycles / self.instructions if self.instructions else 0.0
+
+    def as_dict(self):
+        return {
+            "instructions": self.instructions,
+            "cycles": self.cycles,
+            "cpi": self.cpi,
+            "stalls": dict(self.stalls),
+        }
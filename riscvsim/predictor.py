@@ -0,0 +1,303 @@
+""" Branch predictors
+
+A predictor has `predict(pc)`, returning whether the conditional
+branch at `pc` is guessed taken, and `update(pc, taken)` with the real
+outcome, called right after `predict` for the same branch. Predictors
+drive the branch penalties of `riscvsim.pipeline.Pipeline`, and
+`BranchPredictors` compares several of them on one branch stream: set
+`Simulator.branches` to it, or feed it a recorded trace with
+`riscvsim.trace.replay`.
+
+Tables are flat `bytearray` or `array` of small counters indexed by
+bits of the pc, the global history or both, so a predictor with 4096
+entries takes about 4 KiB.
+"""
+
+import json
+from array import array
+
+from .instructions import InstructionSB
+
+
+def fold(history, length, bits):
+    """XOR the last `length` bits of `history` into `bits` bits."""
+    history &= (1 << length) - 1
+    mask = (1 << bits) - 1
+    folded = 0
+    while history:
+        folded ^= history & mask
+        history >>= bits
+    return folded
+
+
+class StaticPredictor:
+    """Always predict `taken`."""
+
+    def __init__(self, taken=False):
+        self.taken = taken
+
+    def __repr__(self):
+        return f"<{__class__.__name__} taken={self.taken}>"
+
+    def predict(self, pc):
+        return self.taken
+
+    def update(self, pc, taken):
+        pass
+
+
+class BimodalPredictor:
+    """2-bit saturating counters indexed by the pc.
+
+    Parameters
+    ----------
+    bits : int, default 12
+        log2 of the number of counters.
+    """
+
+    def __init__(self, bits=12):
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+        # 0 and 1 predict not taken, 2 and 3 taken; start weakly taken
+        self.counters = bytearray([2]) * (1 << bits)
+
+    def __repr__(self):
+        return f"<{__class__.__name__} {1 << self.bits} counters>"
+
+    def predict(self, pc):
+        return self.counters[(pc >> 2) & self.mask] >= 2
+
+    def update(self, pc, taken):
+        i = (pc >> 2) & self.mask
+        counter = self.counters[i]
+        if taken:
+            if counter < 3:
+                self.counters[i] = counter + 1
+        elif counter > 0:
+            self.counters[i] = counter - 1
+
+
+class GsharePredictor(BimodalPredictor):
+    """2-bit counters indexed by the pc XOR the global history.
+
+    Parameters
+    ----------
+    bits : int, default 12
+        log2 of the number of counters.
+    history : int, optional
+        Outcomes of the last branches used, default `bits`.
+    """
+
+    def __init__(self, bits=12, history=None):
+        super().__init__(bits)
+        self.history_mask = (1 << (bits if history is None else history)) - 1
+        self.history = 0
+
+    def predict(self, pc):
+        return self.counters[((pc >> 2) ^ self.history) & self.mask] >= 2
+
+    def update(self, pc, taken):
+        i = ((pc >> 2) ^ self.history) & self.mask
+        counter = self.counters[i]
+        if taken:
+            if counter < 3:
+                self.counters[i] = counter + 1
+        elif counter > 0:
+            self.counters[i] = counter - 1
+        self.history = ((self.history << 1) | taken) & self.history_mask
+
+
+class TagePredictor:
+    """A small TAGE: a bimodal base and tagged tables of longer histories.
+
+    The prediction comes from the tagged table with the longest history
+    whose entry matches the branch, or from the base. On a
+    misprediction an entry is allocated in a table with a longer
+    history, unless all candidates are still useful.
+
+    Parameters
+    ----------
+    bits : int, default 10
+        log2 of the number of entries of each tagged table.
+    history_lengths : tuple of int, default (4, 8, 16, 32, 64)
+        Global history used by each tagged table, increasing.
+    tag_bits : int, default 8
+    base_bits : int, default 12
+        log2 of the number of counters of the base.
+    """
+
+    def __init__(self, bits=10, history_lengths=(4, 8, 16, 32, 64),
+                 tag_bits=8, base_bits=12):
+        if not 1 < tag_bits < 16:
+            raise ValueError(f"The 'tag_bits' should be in [2, 15], "
+                             f"got {tag_bits}.")
+        self.base = BimodalPredictor(base_bits)
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+        self.tag_bits = tag_bits
+        self.tag_mask = (1 << tag_bits) - 1
+        self.history_lengths = tuple(history_lengths)
+        self.history_mask = (1 << max(self.history_lengths)) - 1
+        self.history = 0
+        size = 1 << bits
+        n = len(self.history_lengths)
+        # -1 marks an empty entry; counters are signed 3-bit, >= 0 taken
+        self.tags = [array("h", [-1]) * size for _ in range(n)]
+        self.counters = [array("b", [0]) * size for _ in range(n)]
+        self.useful = [bytearray(size) for _ in range(n)]
+        self.lookup = None
+
+    def __repr__(self):
+        return (f"<{__class__.__name__} {len(self.tags)} tables of "
+                f"{1 << self.bits} history {self.history_lengths}>")
+
+    def __lookup(self, pc):
+        indices = []
+        tags = []
+        provider = alternate = None
+        for table, length in enumerate(self.history_lengths):
+            history = self.history
+            i = ((pc >> 2) ^ (pc >> (2 + self.bits))
+                 ^ fold(history, length, self.bits)) & self.mask
+            tag = ((pc >> 2) ^ fold(history, length, self.tag_bits)
+                   ^ (fold(history, length, self.tag_bits - 1) << 1)
+                   ) & self.tag_mask
+            indices.append(i)
+            tags.append(tag)
+            if self.tags[table][i] == tag:
+                provider, alternate = table, provider
+        base = self.base.predict(pc)
+        if alternate is None:
+            alternate_prediction = base
+        else:
+            alternate_prediction = (
+                self.counters[alternate][indices[alternate]] >= 0)
+        if provider is None:
+            prediction = base
+        else:
+            prediction = self.counters[provider][indices[provider]] >= 0
+        self.lookup = (pc, indices, tags, provider, prediction,
+                       alternate_prediction)
+        return self.lookup
+
+    def predict(self, pc):
+        return self.__lookup(pc)[4]
+
+    def update(self, pc, taken):
+        lookup = self.lookup
+        if lookup is None or lookup[0] != pc:
+            lookup = self.__lookup(pc)
+        _, indices, tags, provider, prediction, alternate = lookup
+        self.lookup = None
+
+        if provider is None:
+            self.base.update(pc, taken)
+        else:
+            i = indices[provider]
+            counters = self.counters[provider]
+            if taken:
+                counters[i] = min(counters[i] + 1, 3)
+            else:
+                counters[i] = max(counters[i] - 1, -4)
+            if prediction != alternate:
+                useful = self.useful[provider]
+                if prediction == taken:
+                    useful[i] = min(useful[i] + 1, 3)
+                elif useful[i]:
+                    useful[i] -= 1
+
+        if prediction != taken:
+            first = 0 if provider is None else provider + 1
+            candidates = range(first, len(self.tags))
+            for table in candidates:
+                i = indices[table]
+                if not self.useful[table][i]:
+                    self.tags[table][i] = tags[table]
+                    self.counters[table][i] = 0 if taken else -1
+                    break
+            else:
+                for table in candidates:
+                    i = indices[table]
+                    self.useful[table][i] -= 1
+
+        self.history = ((self.history << 1) | taken) & self.history_mask
+
+
+def default_predictors():
+    return {
+        "not_taken": StaticPredictor(taken=False),
+        "taken": StaticPredictor(taken=True),
+        "bimodal": BimodalPredictor(),
+        "gshare": GsharePredictor(),
+        "tage": TagePredictor(),
+    }
+
+
+class BranchPredictors:
+    """Evaluate several predictors on the same conditional branches.
+
+    Parameters
+    ----------
+    predictors : dict, optional
+        Predictors by name, default one of each kind in this module.
+
+    Attributes
+    ----------
+    branches : int
+    stats : dict
+        For every branch pc, a list of its executions, the times it was
+        taken and the correct predictions of each predictor in order.
+    """
+
+    def __init__(self, predictors=None):
+        if predictors is None:
+            predictors = default_predictors()
+        self.predictors = dict(predictors)
+        self.clear()
+
+    def clear(self):
+        self.branches = 0
+        self.stats = {}
+
+    def retire(self, pc, instruction, next_pc):
+        """Predict `instruction` at `pc` if it is a conditional branch."""
+        if next_pc is None or not isinstance(instruction, InstructionSB):
+            return
+        taken = next_pc != pc + instruction.length
+        stats = self.stats.get(pc)
+        if stats is None:
+            stats = self.stats[pc] = [0] * (2 + len(self.predictors))
+        stats[0] += 1
+        stats[1] += taken
+        for i, predictor in enumerate(self.predictors.values(), 2):
+            stats[i] += predictor.predict(pc) == taken
+            predictor.update(pc, taken)
+        self.branches += 1
+
+    def accuracy(self):
+        """Return the ratio of correct predictions by predictor name."""
+        return {
+            name: (sum(stats[i] for stats in self.stats.values())
+                   / self.branches if self.branches else 0.0)
+            for i, name in enumerate(self.predictors, 2)
+        }
+
+    def as_dict(self):
+        """Return the accuracy of every predictor overall and per pc."""
+        return {
+            "branches": self.branches,
+            "accuracy": self.accuracy(),
+            "pcs": {
+                f"{pc:#x}": {
+                    "count": stats[0],
+                    "taken": stats[1],
+                    "accuracy": {name: stats[i] / stats[0] for i, name
+                                 in enumerate(self.predictors, 2)},
+                }
+                for pc, stats in sorted(self.stats.items())
+            },
+        }
+
+    def to_json(self, **kwargs):
+        """Return `as_dict()` as JSON, `kwargs` are passed to `json.dumps`."""
+        return json.dumps(self.as_dict(), **kwargs)
@@ -0,0 +1,86 @@
+""" Execution profile
+
+Set `Simulator.profile` to a `Profile` to count the executed
+instructions by class and the taken/not-taken outcomes of every kind of
+branch, optionally with the host time spent in each class. While a
+profile is set, `Simulator.run` goes instruction by instruction even
+with `translate=True`; with `profile = None` (the default) nothing is
+recorded and the run loops are unchanged.
+"""
+
+import json
+import time
+
+from .instructions import InstructionSB
+
+
+class Profile:
+    """Per instruction class execution counts.
+
+    Parameters
+    ----------
+    timing : bool, default False
+        Also measure the host wall-clock time of every instruction.
+
+    Attributes
+    ----------
+    counts : dict
+        Executed instructions by class.
+    taken, not_taken : dict
+        Branch outcomes by class.
+    time_ns : dict
+        Host nanoseconds by class, only filled when `timing`.
+    """
+
+    def __init__(self, timing=False):
+        self.timing = timing
+        self.counts = {}
+        self.taken = {}
+        self.not_taken = {}
+        self.time_ns = {}
+
+    def run(self, simulator, instruction):
+        """Execute `instruction` by `simulator` and record it."""
+        cls = type(instruction)
+        pc = simulator.pc
+        if self.timing:
+            start = time.perf_counter_ns()
+            instruction.run_by(simulator)
+            elapsed = time.perf_counter_ns() - start
+            self.time_ns[cls] = self.time_ns.get(cls, 0) + elapsed
+        else:
+            instruction.run_by(simulator)
+        self.counts[cls] = self.counts.get(cls, 0) + 1
+        if isinstance(instruction, InstructionSB):
+            fallthrough = simulator.pc == pc + instruction.length
+            outcomes = self.not_taken if fallthrough else self.taken
+            outcomes[cls] = outcomes.get(cls, 0) + 1
+
+    def clear(self):
+        self.counts.clear()
+        self.taken.clear()
+        self.not_taken.clear()
+        self.time_ns.clear()
+
+    def as_dict(self):
+        """Return the profile by class name, hottest classes first."""
+        def by_name(d):
+            items = sorted(d.items(), key=lambda _: _[1], reverse=True)
+            return {cls.__name__: n for cls, n in items}
+
+        profile = {
+            "instructions": sum(self.counts.values()),
+            "counts": by_name(self.counts),
+            "branches": {
+                cls.__name__: {"taken": self.taken.get(cls, 0),
+                               "not_taken": self.not_taken.get(cls, 0)}
+                for cls in self.counts if issubclass(cls, InstructionSB)
+            },
+        }
+        if self.timing:
+            profile["time_ns"] = by_name(self.time_ns)
+        return profile
+
+    def to_json(self, **kwargs):
+        """Return `as_dict()` as JSON, `kwargs` are passed to `json.dumps`."""
+        return json.dumps(self.as_dict(), **kwargs)
@@ -1,4 +1,18 @@
-from .config import REGISTERS_DIR, SIZE
+import hashlib
+
+from .config import (
+    MASK,
+    PAGE_SHIFT,
+    PAGE_SIZE,
+    REGISTERS_DIR,
+    REGISTERS_NUM,
+    SIGN_BIT,
+    SIZE,
+)
+from .elf import ElfFile
+from .instruction_factory import InstructionFactory
+from .syscalls import ProgramExit
+from .translator import translate_block
 
 
 class Register:
@@ -47,12 +61,39 @@ class Register:
         register = Register(bytes_num=self.bytes_num, value=self.value)
         return register
 
+class RegisterCell(Register):
+    # A view of one register in `Registers`, see `Registers.__getitem__`
+
+    def __init__(self, registers, index):
+        self.bytes_num = SIZE
+        self.registers = registers
+        self.index = index
+
+    @property
+    def value(self):
+        return self.registers.values[self.index]
+
+    @value.setter
+    def value(self, value):
+        self.registers.write(self.index, value)
+
+    def copy(self):
+        register = Register(bytes_num=self.bytes_num, value=self.value)
+        return register
+
+
 class Registers:
+    """The 32 integer registers, stored as unsigned ints in one list.
+
+    Instructions use `read_u`/`read_s`/`write` directly; `registers[i]`
+    gives a `Register`-like view for everything else. x0 is hard-wired
+    to zero: writes to it are dropped.
+    """
+
+    __slots__ = ("values",)
 
     def __init__(self, *args, **kwargs):
-        # TODO: fix the hardcode
-        object.__setattr__(self, "len_", 32)
-        object.__setattr__(self, "values", [Register(SIZE) for _ in range(self.len_)])
+        self.values = [0] * REGISTERS_NUM
         for i, arg in enumerate(args):
             x = self.__getitem__(i)
             x.set(SIZE, arg)
@@ -60,87 +101,397 @@ class Registers:
             x = self.__getitem__(REGISTERS_DIR[kw])
             x.set(SIZE, arg)
 
+    def read_u(self, index):
+        return self.values[index]
+
+    def read_s(self, index):
+        value = self.values[index]
+        if value & SIGN_BIT:
+            value -= 1 << (SIZE * 8)
+        return value
+
+    def write(self, index, value):
+        if index:
+            self.values[index] = value & MASK
+
     def __getitem__(self, register):
         if isinstance(register, int):
-            return self.values[register]
+            if not (0 <= register < len(self.values)):
+                raise IndexError(f"The 'register' should be "
+                                 f"0 <= register < {len(self.values)}, "
+                                 f"got {register}.")
+            return RegisterCell(self, register)
         elif isinstance(register, str):
-            return self.values[REGISTERS_DIR[register]]
+            return RegisterCell(self, REGISTERS_DIR[register])
         else:
             raise TypeError(f"The 'register' should be 'int' or 'str', "
                             f"got {type(register)}.")
 
     def __str__(self):
         s = [f"{'x'+str(i):>3} "
-             f"{v.get(SIZE, signed=False):=20} "
-             f"{v.get(SIZE, signed=False):0=#18x}"
+             f"{v:=20} "
+             f"{v:0=#18x}"
              for i, v in enumerate(self.values)]
         return f"{__class__.__name__}:\n" + "\n".join(s)
 
     def copy(self):
         registers = Registers()
-        registers.values = [_.copy() for _ in self.values]
+        registers.values = self.values.copy()
         return registers
 
 
+class MemoryCell(Register):
+    # A view of one byte in `Memory`, see `Memory.__getitem__`
+
+    def __init__(self, memory, addr):
+        self.bytes_num = 1
+        self.memory = memory
+        self.addr = addr
+
+    @property
+    def value(self):
+        return self.memory.read(self.addr, 1, signed=False)
+
+    @value.setter
+    def value(self, value):
+        self.memory.write(self.addr, 1, value)
+
+    def copy(self):
+        register = Register(bytes_num=self.bytes_num, value=self.value)
+        return register
+
+
 class Memory:
+    """Byte-addressed little-endian memory.
+
+    Data lives in `bytearray` pages of `PAGE_SIZE` bytes which are only
+    allocated on first write; reading an untouched address gives 0.
+    Pages are shared copy-on-write between a memory and its copies, so
+    `copy` costs O(pages) no matter how much data they hold.
+    """
 
     def __init__(self, addr_max=0xffffffff):
         self.addr_max = addr_max
-        self.values = {}
+        self.pages = {}
+        # numbers of the pages which may be shared with another memory
+        self.shared = set()
+        # decoded instructions by address, see `Simulator.fetch`
+        self.icache = {}
+        self.icache_pages = set()
+        # translated blocks by start address, see `Simulator.translate`
+        self.blocks = {}
+        self.blocks_pages = {}
+        # bumped whenever a cached instruction is overwritten
+        self.code_version = 0
 
     def __len__(self):
-        return size
+        return len(self.pages) * PAGE_SIZE
 
     def __getitem__(self, addr):
-        if addr not in self.values:
-            self.values[addr] = Register(1, 0x00)
-        return self.values[addr]
+        return MemoryCell(self, addr)
+
+    def check(self, addr, bytes_num):
+        if not (0 <= addr and addr + bytes_num - 1 <= self.addr_max):
+            raise IndexError(f"The 'addr' should be "
+                             f"0 <= addr <= {self.addr_max:#x}, "
+                             f"got {addr:#x} ({bytes_num} bytes).")
 
     def read(self, addr, bytes_num, *, signed):
-        # TODO: type check
-        value = 0
-        for i in reversed(range(bytes_num)):
-            value <<= 8
-            value += self.values[addr + i].get(1, signed=False)
-        if signed and value & (1 << (bytes_num*8 - 1)):
-            value -= 1 << (bytes_num * 8)
-        return value
+        offset = addr & (PAGE_SIZE - 1)
+        if offset + bytes_num > PAGE_SIZE:
+            return int.from_bytes(self.read_bytes(addr, bytes_num),
+                                  "little", signed=signed)
+        self.check(addr, bytes_num)
+        page = self.pages.get(addr >> PAGE_SHIFT)
+        if page is None:
+            return 0
+        return int.from_bytes(page[offset:offset+bytes_num],
+                              "little", signed=signed)
 
     def write(self, addr, bytes_num, value):
-        # TODO: type check
-        for i in range(bytes_num):
-            self.values[addr + i] = Register(1, value & 0xff)
-            value >>= 8
-
-    def __str__(self):
-        addrs_x8 = sorted(list(set(_ & ~0x07 for _ in self.values.keys())))
-        if addrs_x8:
-            s = []
-            last_addr_x8 = None
-
-            for addr_x8 in addrs_x8:
-                if last_addr_x8 and addr_x8 != last_addr_x8 + 8:
-                    s.append("...")
-                xs = []
-                for i in range(addr_x8, addr_x8 + 8):
-                    if i in self.values:
-                        xs.append(f"{self[i].get(1, signed=False):0=2x}")
-                    else:
-                        xs.append("..")
-                s.append(
-                    f"{addr_x8:0=#10x}  "
-                    f"{' '.join(xs[:4])}   {' '.join(xs[4:])}")
-                last_addr_x8 = addr_x8
-
+        data = (value & ((1 << (bytes_num * 8)) - 1)).to_bytes(bytes_num,
+                                                               "little")
+        offset = addr & (PAGE_SIZE - 1)
+        if offset + bytes_num > PAGE_SIZE:
+            self.write_bytes(addr, data)
+            return
+        self.check(addr, bytes_num)
+        page_number = addr >> PAGE_SHIFT
+        page = self.pages.get(page_number)
+        if page is None or page_number in self.shared:
+            page = self.writable_page(page_number)
+        page[offset:offset+bytes_num] = data
+        if ((addr - 3) >> PAGE_SHIFT in self.icache_pages
+                or addr >> PAGE_SHIFT in self.icache_pages):
+            self.invalidate(addr, bytes_num)
+
+    def read_bytes(self, addr, size):
+        """Read `size` bytes starting from `addr` as `bytes`."""
+        self.check(addr, size)
+        chunks = []
+        end = addr + size
+        while addr < end:
+            offset = addr & (PAGE_SIZE - 1)
+            n = min(PAGE_SIZE - offset, end - addr)
+            page = self.pages.get(addr >> PAGE_SHIFT)
+            if page is None:
+                chunks.append(bytes(n))
+            else:
+                chunks.append(bytes(page[offset:offset+n]))
+            addr += n
+        return b"".join(chunks)
+
+    def write_bytes(self, addr, data):
+        """Write the bytes-like `data` starting from `addr`."""
+        size = len(data)
+        self.check(addr, size)
+        data = memoryview(data).cast("B")
+        start, end = addr, addr + size
+        while addr < end:
+            offset = addr & (PAGE_SIZE - 1)
+            n = min(PAGE_SIZE - offset, end - addr)
+            page = self.writable_page(addr >> PAGE_SHIFT)
+            page[offset:offset+n] = data[addr-start:addr-start+n]
+            addr += n
+        if self.icache_pages:
+            self.invalidate(start, size)
+
+    def clear(self, addr, size):
+        """Zero `size` bytes from `addr`, dropping the pages fully covered."""
+        self.check(addr, size)
+        start, end = addr, addr + size
+        while addr < end:
+            offset = addr & (PAGE_SIZE - 1)
+            n = min(PAGE_SIZE - offset, end - addr)
+            page_number = addr >> PAGE_SHIFT
+            if n == PAGE_SIZE:
+                self.pages.pop(page_number, None)
+                self.shared.discard(page_number)
+            elif page_number in self.pages:
+                page = self.writable_page(page_number)
+                page[offset:offset+n] = bytes(n)
+            addr += n
+        if self.icache_pages:
+            self.invalidate(start, size)
+
+    def writable_page(self, page_number):
+        """Return the page, allocating it or un-sharing it as needed."""
+        page = self.pages.get(page_number)
+        if page is None:
+            page = self.pages[page_number] = bytearray(PAGE_SIZE)
+        elif page_number in self.shared:
+            page = self.pages[page_number] = bytearray(page)
+            self.shared.discard(page_number)
+        return page
+
+    def cache_instruction(self, addr, instruction):
+        self.icache[addr] = instruction
+        self.icache_pages.add(addr >> PAGE_SHIFT)
+
+    def cache_block(self, block):
+        self.blocks[block.start] = block
+        for page in range(block.start >> PAGE_SHIFT,
+                          ((block.end - 1) >> PAGE_SHIFT) + 1):
+            self.blocks_pages.setdefault(page, set()).add(block.start)
+
+    def invalidate(self, addr, bytes_num):
+        """Drop the cached instructions overlapping `[addr, addr+bytes_num)`
+        and the translated blocks containing them."""
+        first, last = addr - 3, addr + bytes_num
+        if bytes_num > PAGE_SIZE:
+            dropped = [_ for _ in self.icache if first <= _ < last]
+            for i in dropped:
+                del self.icache[i]
+        else:
+            dropped = [_ for _ in range(first, last)
+                       if self.icache.pop(_, None) is not None]
+        if not dropped:
+            return
+        self.code_version += 1
+        for page in range(first >> PAGE_SHIFT, ((last - 1) >> PAGE_SHIFT) + 1):
+            for start in list(self.blocks_pages.get(page, ())):
+                block = self.blocks[start]
+                if block.start < last and first < block.end:
+                    self.drop_block(block)
+
+    def drop_block(self, block):
+        del self.blocks[block.start]
+        for page in range(block.start >> PAGE_SHIFT,
+                          ((block.end - 1) >> PAGE_SHIFT) + 1):
+            self.blocks_pages[page].discard(block.start)
+
+    def rows(self, start=0, end=None):
+        """Yield `(addr, row)` for the 8-byte aligned rows overlapping
+        `[start, end)` which hold a non-zero byte, only visiting the
+        allocated pages in the range."""
+        if end is None:
+            end = self.addr_max + 1
+        if end <= start:
+            return
+        first, last = start >> PAGE_SHIFT, (end - 1) >> PAGE_SHIFT
+        if last - first < len(self.pages):
+            numbers = [_ for _ in range(first, last + 1) if _ in self.pages]
+        else:
+            numbers = sorted(_ for _ in self.pages if first <= _ <= last)
+        for page_number in numbers:
+            page = self.pages[page_number]
+            base = page_number << PAGE_SHIFT
+            for offset in range(max(start - base, 0) & ~7,
+                                min(end - base, PAGE_SIZE), 8):
+                row = page[offset:offset+8]
+                if any(row):
+                    yield base + offset, bytes(row)
+
+    def dump(self, start=0, end=None, limit=None):
+        """Format the non-zero rows in `[start, end)`, at most `limit`.
+
+        Rows are 8 bytes and consecutive runs of zero rows are shown as
+        "...". Pass the address after the last row as `start` to get
+        the next page of a dump cut by `limit`.
+        """
+        s = []
+        last_addr_x8 = None
+        for n, (addr_x8, row) in enumerate(self.rows(start, end)):
+            if n == limit:
+                s.append(f"... (next at {addr_x8:0=#10x})")
+                break
+            if last_addr_x8 is not None and addr_x8 != last_addr_x8 + 8:
+                s.append("...")
+            xs = [f"{_:0=2x}" for _ in row]
+            s.append(
+                f"{addr_x8:0=#10x}  "
+                f"{' '.join(xs[:4])}   {' '.join(xs[4:])}")
+            last_addr_x8 = addr_x8
+
+        if s:
             return f"{__class__.__name__}:\n" + "\n".join(s)
         else:
             return f"{__class__.__name__} is empty."
 
+    def __str__(self):
+        return self.dump()
+
+    def diff(self, since):
+        """Return the byte runs which differ from the memory `since`.
+
+        Pages still shared with `since` (see `copy`) are unchanged and
+        skipped, so this costs O(pages) plus O(bytes) of the pages
+        written since `since` was copied.
+
+        Returns
+        -------
+        list of (int, bytes, bytes)
+            `(addr, old, new)` in address order; runs less than 8 bytes
+            apart are merged.
+        """
+        zero = bytes(PAGE_SIZE)
+        changes = []
+        for page_number in sorted(set(self.pages) | set(since.pages)):
+            new = self.pages.get(page_number)
+            old = since.pages.get(page_number)
+            if new is old:
+                continue
+            new = zero if new is None else new
+            old = zero if old is None else old
+            if new == old:
+                continue
+            base = page_number << PAGE_SHIFT
+            for chunk in range(0, PAGE_SIZE, 64):
+                if new[chunk:chunk+64] == old[chunk:chunk+64]:
+                    continue
+                for offset in range(chunk, chunk + 64):
+                    if new[offset] == old[offset]:
+                        continue
+                    addr = base + offset
+                    if changes and addr - changes[-1][1] <= 8:
+                        changes[-1][1] = addr + 1
+                    else:
+                        changes.append([addr, addr + 1])
+        return [(start, since.read_bytes(start, end - start),
+                 self.read_bytes(start, end - start))
+                for start, end in changes]
+
+    def digest(self):
+        """Return a hex digest of the content, ignoring all-zero pages."""
+        zero = bytes(PAGE_SIZE)
+        h = hashlib.blake2b(digest_size=16)
+        for page_number in sorted(self.pages):
+            page = self.pages[page_number]
+            if page != zero:
+                h.update(page_number.to_bytes(8, "little"))
+                h.update(page)
+        return h.hexdigest()
+
+    def image(self):
+        """Return the pages with data as `{page number: bytes}`.
+
+        Unlike `copy` it only holds plain bytes, e.g. to pickle the
+        content for another process, see `riscvsim.batch.run_batch`.
+        """
+        zero = bytes(PAGE_SIZE)
+        image = {}
+        for page_number in self.pages:
+            page = bytes(self.pages[page_number])
+            if page != zero:
+                image[page_number] = page
+        return image
+
     def copy(self):
-        memory = Memory()
-        memory.values = {k: v.copy() for k, v in self.values.items()}
+        memory = Memory(addr_max=self.addr_max)
+        memory.pages = self.pages.copy()
+        memory.shared = set(self.pages)
+        self.shared = set(self.pages)
         return memory
 
+    def restore(self, memory):
+        """Make the content equal to `memory` by sharing its pages.
+
+        Cached instructions and blocks survive on the pages which are
+        still the same as in `memory`, e.g. untouched code pages.
+        """
+        for page_number in self.icache_pages:
+            if (self.pages.get(page_number)
+                    is not memory.pages.get(page_number)):
+                self.invalidate(page_number << PAGE_SHIFT, PAGE_SIZE)
+        self.addr_max = memory.addr_max
+        self.pages = memory.pages.copy()
+        self.shared = set(self.pages)
+        memory.shared = set(memory.pages)
+
+
+class Diff:
+    """The changes of a `Simulator` since a snapshot.
+
+    Attributes
+    ----------
+    pc : tuple of int or None
+        `(old, new)`, None if unchanged.
+    registers : dict
+        `(old, new)` unsigned values by register index.
+    memory : list of (int, bytes, bytes)
+        `(addr, old, new)` runs, see `Memory.diff`.
+    """
+
+    __slots__ = ("pc", "registers", "memory")
+
+    def __init__(self, pc, registers, memory):
+        self.pc = pc
+        self.registers = registers
+        self.memory = memory
+
+    def __bool__(self):
+        return bool(self.pc or self.registers or self.memory)
+
+    def __str__(self):
+        s = []
+        if self.pc:
+            s.append(f"pc   {self.pc[0]:#x} -> {self.pc[1]:#x}")
+        for i, (old, new) in self.registers.items():
+            s.append(f"x{i:<3} {old:#x} -> {new:#x}")
+        for addr, old, new in self.memory:
+            s.append(f"{addr:0=#10x}  {old.hex(' ')} -> {new.hex(' ')}")
+        return "\n".join(s) if s else "No changes."
+
 
 class Simulator:
 
@@ -148,6 +499,25 @@ class Simulator:
         object.__setattr__(self, "registers", Registers())
         object.__setattr__(self, "memory", Memory())
         object.__setattr__(self, "pc", 0)
+        # the `cycle` and `instret` counters; without a `timing` model
+        # every instruction takes one cycle
+        object.__setattr__(self, "cycle", 0)
+        object.__setattr__(self, "instret", 0)
+        # a `riscvsim.profile.Profile` recording the executed instructions
+        object.__setattr__(self, "profile", None)
+        # a `riscvsim.trace.TraceWriter` recording the executed instructions
+        object.__setattr__(self, "tracer", None)
+        # a `riscvsim.cache.CacheHierarchy` seeing the memory accesses
+        object.__setattr__(self, "caches", None)
+        # a `riscvsim.pipeline.Pipeline` giving the cycles of the retired
+        # instructions
+        object.__setattr__(self, "timing", None)
+        # a `riscvsim.predictor.BranchPredictors` seeing the branches
+        object.__setattr__(self, "branches", None)
+        # a `riscvsim.syscalls.Syscalls` running `ecall`, and the status
+        # of the exit system call once the program made it
+        object.__setattr__(self, "syscalls", None)
+        object.__setattr__(self, "exit_code", None)
 
         for kw, arg in kwargs.items():
             # TODO: add test for the code below
@@ -178,7 +548,7 @@ class Simulator:
 
     # shortcut for registers access
     def __setattr__(self, name, value):
-        if name in dir(self):
+        if name in self.__dict__ or hasattr(__class__, name):
             object.__setattr__(self, name, value)
         else:
             self.registers[name].set(SIZE, value)
@@ -186,7 +556,7 @@ class Simulator:
     # shortcut for registers access
     def __getattr__(self, name):
         try:
-            return self.registers[name].get(SIZE, signed=False)
+            return self.registers.read_u(REGISTERS_DIR[name])
         except KeyError:
             raise AttributeError(f"The attribute '{name}' was not found "
                             f"both in Simulator and Registers.")
@@ -195,12 +565,197 @@ class Simulator:
         for i, v in enumerate(values):
             self.memory[start+i].set(1, v)
 
+    def load(self, addr, instructions):
+        """Write encoded `instructions` (or words) to memory from `addr`."""
+        data = b"".join(int(_).to_bytes(4, "little") for _ in instructions)
+        self.memory.write_bytes(addr, data)
+
+    def assemble(self, text, base=None):
+        """Assemble `text` into memory, see `InstructionFactory.assemble`.
+
+        Parameters
+        ----------
+        text : str
+        base : int, optional
+            The address of the first instruction, default `pc`.
+
+        Returns
+        -------
+        dict
+            The address of each label.
+        """
+        if base is None:
+            base = self.pc
+        instructions, labels = InstructionFactory.assemble(text, base)
+        self.load(base, instructions)
+        return labels
+
+    def load_elf(self, path):
+        """Load an ELF64 RISC-V executable and set `pc` to its entry.
+
+        Returns
+        -------
+        riscvsim.elf.ElfFile
+            Its `symbols` give the address of functions and data.
+        """
+        elf = ElfFile.open(path)
+        try:
+            elf.load(self.memory)
+        finally:
+            elf.close()
+        self.pc = elf.entry
+        return elf
+
+    def fetch(self, addr):
+        """Return the instruction at `addr`, decoding it on first use.
+
+        Decoded instructions are cached in `memory.icache` and dropped
+        again by `Memory.write`, so self-modifying code still works.
+        """
+        try:
+            return self.memory.icache[addr]
+        except KeyError:
+            word = self.memory.read(addr, 2, signed=False)
+            if word & 0b11 == 0b11:
+                word = self.memory.read(addr, 4, signed=False)
+            instruction = InstructionFactory.get(word)
+            self.memory.cache_instruction(addr, instruction)
+            return instruction
+
     def step(self, instruction=None):
-        if isinstance == None:
-            # TODO
-            pass
+        if instruction is None:
+            instruction = self.fetch(self.pc)
+        if self.caches is not None:
+            self.caches.observe(self, instruction)
+        pc = self.pc
+        if self.tracer is not None:
+            self.tracer.run(self, instruction)
+        elif self.profile is not None:
+            self.profile.run(self, instruction)
         else:
             instruction.run_by(self)
+        if self.timing is None:
+            self.cycle += 1
+        else:
+            cycles = self.timing.cycles
+            self.timing.retire(pc, instruction, self.pc)
+            self.cycle += self.timing.cycles - cycles
+        if self.branches is not None:
+            self.branches.retire(pc, instruction, self.pc)
+        self.instret += 1
+
+    def translate(self, pc):
+        """Return the translated basic block starting at `pc`."""
+        try:
+            return self.memory.blocks[pc]
+        except KeyError:
+            block = translate_block(self, pc)
+            self.memory.cache_block(block)
+            return block
+
+    def run(self, max_steps=None, until_pc=None, *, translate=False):
+        """Fetch, decode and execute instructions starting from `pc`.
+
+        Parameters
+        ----------
+        max_steps : int, optional
+            Stop after this many instructions.
+        until_pc : int, optional
+            Stop as soon as `pc` equals this address.
+        translate : bool, default False
+            Run whole basic blocks compiled by `riscvsim.translator`
+            instead of one instruction at a time. Much faster on loops.
+            Ignored while `profile`, `tracer`, `caches`, `timing` or
+            `branches` is set.
+
+        Returns
+        -------
+        int
+            The number of executed instructions. An exit system call,
+            see `riscvsim.syscalls`, also returns, with `pc` at its
+            `ecall` which is counted and the status in `exit_code`;
+            after it `run` does nothing.
+        """
+        if self.exit_code is not None:
+            return 0
+        if (self.profile is not None or self.tracer is not None
+                or self.caches is not None or self.timing is not None
+                or self.branches is not None):
+            return self.__run_stepping(max_steps, until_pc)
+        if translate:
+            return self.__run_blocks(max_steps, until_pc)
+        fetch = self.fetch
+        steps = 0
+        try:
+            while max_steps is None or steps < max_steps:
+                pc = self.pc
+                if pc == until_pc:
+                    break
+                fetch(pc).run_by(self)
+                steps += 1
+        except ProgramExit:
+            steps += 1
+        finally:
+            self.cycle += steps
+            self.instret += steps
+        return steps
+
+    def __run_stepping(self, max_steps, until_pc):
+        # `step` reports to the hooks and counts itself
+        fetch = self.fetch
+        step = self.step
+        steps = 0
+        try:
+            while max_steps is None or steps < max_steps:
+                pc = self.pc
+                if pc == until_pc:
+                    break
+                step(fetch(pc))
+                steps += 1
+        except ProgramExit:
+            # not reported to the hooks
+            self.cycle += 1
+            self.instret += 1
+            steps += 1
+        return steps
+
+    def __run_blocks(self, max_steps, until_pc):
+        blocks = self.memory.blocks
+        values = self.registers.values
+        steps = 0
+        pc = self.pc
+        try:
+            while pc != until_pc:
+                block = blocks.get(pc) or self.translate(pc)
+                if (block.length == 0
+                        or max_steps is not None
+                        and steps + block.length > max_steps
+                        or until_pc is not None
+                        and block.start < until_pc < block.end):
+                    # finish instruction by instruction
+                    if max_steps is not None and steps >= max_steps:
+                        break
+                    self.pc = pc
+                    self.fetch(pc).run_by(self)
+                    pc = self.pc
+                    steps += 1
+                    continue
+                try:
+                    pc, n = block.function(self, values)
+                except BaseException:
+                    # the block left `pc` at the faulting instruction
+                    steps += block.retired(self.pc)
+                    raise
+                steps += n
+        except ProgramExit:
+            # `ecall` is never translated, so it ran by itself above
+            pc = self.pc
+            steps += 1
+        finally:
+            self.cycle += steps
+            self.instret += steps
+        self.pc = pc
+        return steps
 
     def __str__(self):
         return "\n".join([
@@ -214,7 +769,41 @@ class Simulator:
     def copy(self):
         sim = Simulator()
         sim.pc = self.pc
+        sim.cycle = self.cycle
+        sim.instret = self.instret
+        sim.exit_code = self.exit_code
+        # shared: the copy writes to the same host files
+        sim.syscalls = self.syscalls
         sim.registers = self.registers.copy()
         sim.memory = self.memory.copy()
         return sim
 
+    def snapshot(self):
+        """Return a copy of the current state to pass to `restore` later.
+
+        Memory pages are shared copy-on-write with the snapshot, so it
+        costs O(pages) and a page is only copied on its first write.
+        """
+        return self.copy()
+
+    def diff(self, since):
+        """Return what changed since the snapshot `since`, see `Diff`."""
+        registers = {
+            i: (old, new)
+            for i, (old, new) in enumerate(zip(since.registers.values,
+                                               self.registers.values))
+            if old != new
+        }
+        return Diff(pc=None if self.pc == since.pc else (since.pc, self.pc),
+                    registers=registers,
+                    memory=self.memory.diff(since.memory))
+
+    def restore(self, snapshot):
+        """Rewind to `snapshot`, which stays valid for further restores."""
+        self.pc = snapshot.pc
+        self.cycle = snapshot.cycle
+        self.instret = snapshot.instret
+        self.exit_code = snapshot.exit_code
+        self.registers.values[:] = snapshot.registers.values
+        self.memory.restore(snapshot.memory)
+
@@ -0,0 +1,248 @@
+""" Linux-like system calls
+
+Set `Simulator.syscalls` to a `Syscalls` to run `ecall`: the number is
+in a7, the arguments in a0-a5 and the result goes to a0, negative errno
+values on failure, as on RISC-V Linux. `table` maps numbers to handlers
+called as `handler(simulator, a0, a1, a2, a3, a4, a5)` and returning the
+result; add or replace entries to emulate more calls.
+
+`write` moves guest memory with one `Memory.read_bytes` per call into a
+per-descriptor buffer, written to the host file once it holds
+`buffer_size` bytes, before a `read`, and on `close`, `flush` or exit.
+Host errors, e.g. writing a file opened read-only, are returned to the
+guest as errno values; those of the final flush at exit are dropped.
+`exit` raises `ProgramExit`, which `Simulator.run` catches to return,
+leaving the pc at the ecall and the status in `Simulator.exit_code`.
+
+`openat` only opens files below `root`, and not at all by default.
+"""
+
+import errno
+import os
+import sys
+
+from .config import MASK, PAGE_SHIFT, SIGN_BIT
+
+SYS_OPENAT = 56
+SYS_CLOSE = 57
+SYS_READ = 63
+SYS_WRITE = 64
+SYS_EXIT = 93
+SYS_EXIT_GROUP = 94
+SYS_BRK = 214
+
+AT_FDCWD = -100
+# the guest's `open` flags, those of Linux on RISC-V
+O_ACCMODE = 0o3
+O_CREAT = 0o100
+O_EXCL = 0o200
+O_TRUNC = 0o1000
+O_APPEND = 0o2000
+
+PATH_MAX = 4096
+# the most bytes one `read` or `write` transfers, as on Linux
+MAX_RW_COUNT = 0x7ffff000
+
+
+class ProgramExit(Exception):
+    """Raised by the exit system call with the exit status."""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+def signed(value):
+    return value - (1 << 64) if value & SIGN_BIT else value
+
+
+class Syscalls:
+    """A system call table with buffered host I/O.
+
+    Parameters
+    ----------
+    stdin, stdout, stderr : binary file objects, optional
+        The host files of descriptors 0, 1 and 2, default those of
+        `sys`. They are flushed but never closed.
+    root : str, optional
+        The directory `openat` resolves paths in; None refuses to open
+        any file.
+    brk : int, optional
+        The initial program break, default the end of the highest page
+        in memory at the first `brk` call.
+    buffer_size : int, default 65536
+
+    Attributes
+    ----------
+    table : dict
+        Handlers by system call number.
+    files : dict
+        Host file objects by guest descriptor.
+    """
+
+    def __init__(self, stdin=None, stdout=None, stderr=None, *, root=None,
+                 brk=None, buffer_size=1 << 16):
+        self.table = {
+            SYS_OPENAT: self.openat,
+            SYS_CLOSE: self.close,
+            SYS_READ: self.read,
+            SYS_WRITE: self.write,
+            SYS_EXIT: self.exit,
+            SYS_EXIT_GROUP: self.exit,
+            SYS_BRK: self.brk,
+        }
+        self.files = {
+            0: stdin or sys.stdin.buffer,
+            1: stdout or sys.stdout.buffer,
+            2: stderr or sys.stderr.buffer,
+        }
+        # descriptors opened by `openat`, closed by `close`
+        self.owned = set()
+        self.buffers = {}
+        self.buffer_size = buffer_size
+        self.root = None if root is None else os.path.realpath(root)
+        self.program_break = brk
+
+    def handle(self, simulator):
+        """Run the system call requested by the registers of `simulator`."""
+        values = simulator.registers.values
+        handler = self.table.get(values[17])
+        if handler is None:
+            result = -errno.ENOSYS
+        else:
+            result = handler(simulator, *values[10:16])
+        simulator.registers.write(10, result)
+
+    def flush(self, fd=None):
+        """Write the buffered output of `fd`, default all, to the host.
+
+        Returns
+        -------
+        int
+            0, or the negative errno of the first failed write; the
+            output of a failed write is dropped.
+        """
+        result = 0
+        for i in list(self.buffers) if fd is None else [fd]:
+            buffer = self.buffers.pop(i, None)
+            if buffer:
+                file = self.files[i]
+                try:
+                    file.write(buffer)
+                    file.flush()
+                except OSError as e:
+                    result = result or -(e.errno or errno.EIO)
+        return result
+
+    def write(self, simulator, fd, buf, count, *_):
+        file = self.files.get(fd)
+        if file is None or not file.writable():
+            return -errno.EBADF
+        count = min(count, MAX_RW_COUNT)
+        try:
+            data = simulator.memory.read_bytes(buf, count)
+        except (IndexError, ValueError):
+            return -errno.EFAULT
+        buffer = self.buffers.setdefault(fd, bytearray())
+        buffer += data
+        if len(buffer) >= self.buffer_size:
+            return self.flush(fd) or count
+        return count
+
+    def read(self, simulator, fd, buf, count, *_):
+        file = self.files.get(fd)
+        if file is None or not file.readable():
+            return -errno.EBADF
+        # e.g. a prompt written to stdout before reading stdin
+        self.flush()
+        try:
+            data = getattr(file, "read1", file.read)(min(count, MAX_RW_COUNT))
+        except OSError as e:
+            return -(e.errno or errno.EIO)
+        try:
+            simulator.memory.write_bytes(buf, data)
+        except (IndexError, ValueError):
+            return -errno.EFAULT
+        return len(data)
+
+    def exit(self, simulator, code, *_):
+        self.flush()
+        raise ProgramExit(signed(code) & 0xff)
+
+    def brk(self, simulator, addr, *_):
+        if self.program_break is None:
+            pages = simulator.memory.pages
+            self.program_break = (max(pages) + 1 << PAGE_SHIFT
+                                  if pages else 0)
+        if self.program_break <= addr <= simulator.memory.addr_max:
+            self.program_break = addr
+        return self.program_break
+
+    def openat(self, simulator, dirfd, pathname, flags, mode, *_):
+        if self.root is None:
+            return -errno.EACCES
+        if signed(dirfd) != AT_FDCWD:
+            return -errno.EINVAL
+        path = self.read_string(simulator, pathname)
+        if path is None:
+            return -errno.EFAULT
+        host_path = os.path.realpath(
+            os.path.join(self.root, os.fsdecode(path).lstrip("/")))
+        if os.path.commonpath([self.root, host_path]) != self.root:
+            return -errno.EACCES
+
+        access = flags & O_ACCMODE
+        host_flags = (os.O_RDONLY, os.O_WRONLY, os.O_RDWR, os.O_RDWR)[access]
+        for guest, host in ((O_CREAT, os.O_CREAT), (O_EXCL, os.O_EXCL),
+                            (O_TRUNC, os.O_TRUNC), (O_APPEND, os.O_APPEND)):
+            if flags & guest:
+                host_flags |= host
+        file_mode = ("rb", "wb", "r+b", "r+b")[access]
+        try:
+            host_fd = os.open(host_path, host_flags, mode & 0o777)
+        except OSError as e:
+            return -e.errno
+        try:
+            # e.g. IsADirectoryError for a directory
+            file = open(host_fd, file_mode, buffering=0)
+        except OSError as e:
+            os.close(host_fd)
+            return -e.errno
+        fd = 3
+        while fd in self.files:
+            fd += 1
+        self.files[fd] = file
+        self.owned.add(fd)
+        return fd
+
+    def close(self, simulator, fd, *_):
+        if fd not in self.files:
+            return -errno.EBADF
+        result = self.flush(fd)
+        file = self.files.pop(fd)
+        if fd in self.owned:
+            self.owned.discard(fd)
+            try:
+                file.close()
+            except OSError as e:
+                result = result or -(e.errno or errno.EIO)
+        return result
+
+    @staticmethod
+    def read_string(simulator, addr):
+        """Return the NUL-terminated bytes at `addr`, None if unreadable."""
+        data = bytearray()
+        while len(data) < PATH_MAX:
+            chunk_size = min(256, simulator.memory.addr_max + 1 - addr)
+            if chunk_size <= 0:
+                return None
+            try:
+                chunk = simulator.memory.read_bytes(addr, chunk_size)
+            except (IndexError, ValueError):
+                return None
+            end = chunk.find(0)
+            if end >= 0:
+                return bytes(data + chunk[:end])
+            data += chunk
+            addr = (addr + chunk_size) & MASK
+        return None
@@ -0,0 +1,198 @@
+""" Binary execution trace
+
+Set `Simulator.tracer` to a `TraceWriter` to record every retired
+instruction as one fixed-size little-endian record:
+
+    pc        u64
+    word      u32   the encoded instruction, `int(instruction)`
+    rd        u8    0 if the instruction writes no register
+    access    u8    0, `LOAD` or `STORE`
+    size      u16   bytes of the memory access
+    value     u64   the new value of rd
+    addr      u64   address of the memory access
+    data      u64   data loaded or stored, zero-extended
+
+Records are packed straight into a preallocated buffer which is written
+out when full, optionally through gzip, so tracing allocates nothing per
+instruction beyond the integers themselves. A trace file starts with
+`MAGIC` and is read back lazily by `read_trace`, also from a pipe or a
+socket, and `replay` feeds it
+to a timing model such as `riscvsim.pipeline.Pipeline`. While a tracer
+is set, `Simulator.run` goes instruction by instruction.
+"""
+
+import gzip
+import struct
+
+from .config import MASK
+from .instruction_factory import InstructionFactory
+from .instructions import LOAD, STORE, memory_accesses
+
+MAGIC = b"RVTRACE\x01"
+RECORD = struct.Struct("<QIBBHQQQ")
+FIELDS = ("pc", "word", "rd", "access", "size", "value", "addr", "data")
+
+
+class TraceWriter:
+    """Write the trace of a `Simulator` to `file`.
+
+    Parameters
+    ----------
+    file : str or binary file object
+        A path is opened (and closed by `close`), a file object is only
+        flushed.
+    compress : bool or int, default False
+        Compress with gzip, an int is the compression level (default 1).
+    buffer_records : int, default 4096
+        Records kept in memory between two writes.
+    """
+
+    def __init__(self, file, *, compress=False, buffer_records=4096):
+        self.owned = isinstance(file, str)
+        if self.owned:
+            file = open(file, "wb")
+        self.raw = file
+        if compress:
+            level = 1 if compress is True else compress
+            file = gzip.GzipFile(fileobj=file, mode="wb", compresslevel=level)
+        self.file = file
+        self.file.write(MAGIC)
+        self.buffer = bytearray(RECORD.size * buffer_records)
+        self.offset = 0
+        self.records = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def run(self, simulator, instruction):
+        """Execute `instruction` by `simulator` and record it."""
+        values = simulator.registers.values
+        pc = simulator.pc
+        access, size = memory_accesses.get(type(instruction), (0, 0))
+        addr = data = 0
+        if access == LOAD:
+            addr = (values[instruction.rs] + instruction.imm) & MASK
+        elif access == STORE:
+            addr = (values[instruction.rs1] + instruction.imm) & MASK
+            data = values[instruction.rs2] & ((1 << (size * 8)) - 1)
+
+        if simulator.profile is None:
+            instruction.run_by(simulator)
+        else:
+            simulator.profile.run(simulator, instruction)
+
+        if access == LOAD:
+            data = simulator.memory.read(addr, size, signed=False)
+        rd = getattr(instruction, "rd", 0)
+        if self.offset == len(self.buffer):
+            self.write_buffer()
+        RECORD.pack_into(self.buffer, self.offset, pc, int(instruction), rd,
+                         access, size, values[rd], addr, data)
+        self.offset += RECORD.size
+        self.records += 1
+
+    def write_buffer(self):
+        with memoryview(self.buffer)[:self.offset] as view:
+            self.file.write(view)
+        self.offset = 0
+
+    def flush(self):
+        self.write_buffer()
+        self.file.flush()
+
+    def close(self):
+        self.write_buffer()
+        if self.file is not self.raw:
+            self.file.close()
+        if self.owned:
+            self.raw.close()
+        else:
+            self.raw.flush()
+
+
+def read_full(stream, size):
+    """Read `size` bytes from `stream`, fewer only at its end."""
+    data = stream.read(size)
+    if len(data) == size or not data:
+        return data
+    data = bytearray(data)
+    while len(data) < size:
+        more = stream.read(size - len(data))
+        if not more:
+            break
+        data += more
+    return bytes(data)
+
+
+class Prefixed:
+    # `head` followed by the rest of `file`, to hand the bytes already
+    # read to gzip without seeking back
+    def __init__(self, head, file):
+        self.head = head
+        self.file = file
+
+    def read(self, size=-1):
+        if not self.head:
+            return self.file.read(size)
+        if size is None or size < 0:
+            data = self.head + self.file.read()
+            self.head = b""
+        else:
+            data, self.head = self.head[:size], self.head[size:]
+        return data
+
+
+def read_trace(file, chunk_records=4096):
+    """Yield the records of a trace as tuples in the order of `FIELDS`.
+
+    Parameters
+    ----------
+    file : str or binary file object
+        gzip compressed traces are recognized by their header. A file
+        object need not be seekable and may return short reads.
+    chunk_records : int, default 4096
+        Records read from the file at once.
+    """
+    owned = isinstance(file, str)
+    if owned:
+        file = open(file, "rb")
+    try:
+        head = read_full(file, len(MAGIC))
+        if head[:2] == b"\x1f\x8b":
+            stream = gzip.GzipFile(fileobj=Prefixed(head, file), mode="rb")
+            head = read_full(stream, len(MAGIC))
+        else:
+            stream = file
+        if head != MAGIC:
+            raise ValueError("The file is not a trace.")
+        while chunk := read_full(stream, RECORD.size * chunk_records):
+            if len(chunk) % RECORD.size:
+                raise ValueError("The trace ends with a truncated record.")
+            yield from RECORD.iter_unpack(chunk)
+    finally:
+        if owned:
+            file.close()
+
+
+def replay(records, model):
+    """Call `model.retire(pc, instruction, next_pc)` for every record.
+
+    `records` are tuples as yielded by `read_trace`, consumed one at a
+    time. `next_pc` is the pc of the following record, None for the last.
+    Return the number of records.
+    """
+    decode = InstructionFactory.decode
+    count = 0
+    previous = None
+    for record in records:
+        pc = record[0]
+        if previous is not None:
+            model.retire(previous[0], decode(previous[1]), pc)
+        previous = record
+        count += 1
+    if previous is not None:
+        model.retire(previous[0], decode(previous[1]), None)
+    return count
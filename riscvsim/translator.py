@@ -0,0 +1,139 @@
+""" Basic-block translation
+
+A basic block here is a straight-line run of instructions which ends at
+the first branch or jump (`Instruction.ends_block`). `translate_block`
+joins the `Instruction.translate` source of every instruction in the
+block into one Python function:
+
+    def block(sim, values):
+        x1 = values[1]              # registers used by the block
+        pc = 4096
+        try:
+            x1 = (x1 + -1) & M      # AddiInstruction.translate()
+            pc = 4096 if ((x1 ^ S) - S) != 0 else 4104
+        except BaseException:
+            values[1] = x1
+            sim.pc = pc
+            raise
+        values[1] = x1              # registers written by the block
+        return pc, 2                # next pc, executed instructions
+
+so registers live in locals while the block runs and are written back
+once at its exit. A block which raises leaves `sim.pc` at the faulting
+instruction, so `Block.retired` gives the instructions it completed
+before. The generated source can use `M` (XLEN mask), `S` (XLEN sign
+bit), `read`/`write` (of the memory), `pc`, and the `sign_extend` and
+division helpers of `riscvsim.instructions`.
+"""
+
+from .config import BLOCK_LENGTH_MAX, MASK, SIGN_BIT
+from .instructions import (
+    InstructionS,
+    divide,
+    divide_unsigned,
+    remainder,
+    remainder_unsigned,
+    sign_extend,
+)
+
+
+class Block:
+
+    __slots__ = ("start", "end", "length", "function", "offsets")
+
+    def __init__(self, start, end, length, function, offsets=None):
+        self.start = start
+        self.end = end
+        self.length = length
+        self.function = function
+        # the index of the instruction at each address
+        self.offsets = offsets or {}
+
+    def __repr__(self):
+        return (f"<{__class__.__name__} {self.start:#x}-{self.end:#x} "
+                f"{self.length} instructions>")
+
+    def retired(self, pc):
+        """Return the instructions completed before a raise at `pc`."""
+        return self.offsets.get(pc, 0)
+
+
+def translate_block(simulator, pc):
+    """Translate the basic block starting at `pc`.
+
+    Instructions are fetched through `simulator.fetch`, so they are in
+    `memory.icache` and overwriting any of them invalidates the block.
+    The block stops early before an instruction that can not be fetched
+    or translated; if that is the first one, the returned block has
+    `length == 0` and must be run by `Simulator.step` instead.
+    """
+    memory = simulator.memory
+    translated = []
+    addr = pc
+    while len(translated) < BLOCK_LENGTH_MAX:
+        try:
+            instruction = simulator.fetch(addr)
+            lines = instruction.translate(addr)
+        except (NotImplementedError, ValueError, IndexError):
+            break
+        translated.append((addr, instruction, lines))
+        addr += instruction.length
+        if instruction.ends_block:
+            break
+    if not translated:
+        return Block(pc, pc + 4, 0, None)
+
+    used = set()
+    written = set()
+    for _, instruction, _ in translated:
+        for field in ("rd", "rs", "rs1", "rs2"):
+            used.add(getattr(instruction, field, 0))
+        written.add(getattr(instruction, "rd", 0))
+    used.discard(0)
+    written.discard(0)
+    writeback = [f"values[{i}] = x{i}" for i in sorted(written)]
+    has_store = any(isinstance(instruction, InstructionS)
+                    for _, instruction, _ in translated)
+
+    body = []
+    for i, (addr, instruction, lines) in enumerate(translated):
+        body.extend(lines)
+        if isinstance(instruction, InstructionS):
+            # the store may have overwritten code of this very block
+            body.append("if memory.code_version != version:")
+            body.extend(f"    {_}" for _ in writeback)
+            body.append(f"    return {addr + instruction.length}, {i + 1}")
+    if not instruction.ends_block:
+        body.append(f"pc = {addr + instruction.length}")
+
+    source = ["def block(sim, values):"]
+    source.extend(f"    x{i} = values[{i}]" for i in sorted(used))
+    if has_store:
+        source.append("    version = memory.code_version")
+    # only memory accesses may raise, and each of them stores its pc first
+    source.append(f"    pc = {pc}")
+    source.append("    try:")
+    source.extend(f"        {_}" for _ in body)
+    source.append("    except BaseException:")
+    source.extend(f"        {_}" for _ in writeback)
+    source.append("        sim.pc = pc")
+    source.append("        raise")
+    source.extend(f"    {_}" for _ in writeback)
+    source.append(f"    return pc, {len(translated)}")
+
+    namespace = {
+        "M": MASK,
+        "S": SIGN_BIT,
+        "memory": memory,
+        "read": memory.read,
+        "write": memory.write,
+        "sign_extend": sign_extend,
+        "divide": divide,
+        "divide_unsigned": divide_unsigned,
+        "remainder": remainder,
+        "remainder_unsigned": remainder_unsigned,
+    }
+    exec(compile("\n".join(source), f"<block {pc:#x}>", "exec"), namespace)
+    end = addr + instruction.length
+    offsets = {addr: i for i, (addr, _, _) in enumerate(translated)}
+    return Block(pc, end, len(translated), namespace["block"], offsets)
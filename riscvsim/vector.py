@@ -0,0 +1,276 @@
+""" Vectorized lockstep execution
+
+`VectorSimulator` runs one program on N lanes, keeping their registers
+in an (N, 32) uint64 NumPy array so each ALU instruction is a single
+array operation over all lanes. Lanes may diverge on branches: every
+step executes the instruction at the lowest pc of the running lanes,
+masked to the lanes which are at that pc, so diverged lanes wait and
+then reconverge. Loads and stores go lane by lane to a private
+copy-on-write `Memory` of each lane.
+
+Requires NumPy, which is not needed by the rest of the package.
+"""
+
+import numpy as np
+
+from . import instructions
+from .config import MASK, REGISTERS_DIR
+from .instructions import sign_extend
+from .simulator import Simulator
+
+
+def uint64(value):
+    return np.uint64(value & MASK)
+
+
+def int64_shamt(values, bits=0b111111):
+    return (values & np.uint64(bits)).view(np.int64)
+
+
+def word_signed(values):
+    return values.astype(np.uint32).view(np.int32).astype(np.int64)
+
+
+class VectorSimulator:
+    """Run `program` on `lanes` register states in lockstep.
+
+    Parameters
+    ----------
+    program : Simulator
+        Its pc, registers and memory are the initial state of every
+        lane; instructions are always fetched from its memory.
+    lanes : int
+
+    Attributes
+    ----------
+    registers : numpy.ndarray
+        (lanes, 32) uint64, e.g. `registers[:, 10]` is a0 of all lanes.
+    pcs : numpy.ndarray
+        (lanes,) uint64.
+    memories : list of Memory
+    """
+
+    def __init__(self, program, lanes):
+        self.program = program
+        self.registers = np.tile(
+            np.array(program.registers.values, dtype=np.uint64), (lanes, 1))
+        self.pcs = np.full(lanes, program.pc, dtype=np.uint64)
+        self.memories = [program.memory.copy() for _ in range(lanes)]
+
+    def __len__(self):
+        return len(self.pcs)
+
+    # shortcut for the register of all lanes, e.g. `vsim["a0"] = range(n)`
+    def __getitem__(self, name):
+        return self.registers[:, REGISTERS_DIR[name]]
+
+    def __setitem__(self, name, values):
+        index = REGISTERS_DIR[name]
+        if index:
+            values = np.asarray(values)
+            if values.dtype != np.uint64:
+                values = np.asarray(values, dtype=np.int64).view(np.uint64)
+            self.registers[:, index] = values
+
+    def write(self, index, values, mask):
+        if index:
+            values = np.asarray(values)
+            if values.dtype == np.int64:
+                values = values.view(np.uint64)
+            np.copyto(self.registers[:, index], values, where=mask)
+
+    def lane(self, i):
+        """Return lane `i` as a `Simulator` sharing the lane's memory."""
+        sim = Simulator(pc=int(self.pcs[i]))
+        sim.registers.values[:] = [int(_) for _ in self.registers[i]]
+        sim.memory = self.memories[i]
+        return sim
+
+    def step(self, active=None):
+        """Execute the instruction at the lowest pc of the `active` lanes.
+
+        Returns the mask of the lanes which executed it.
+        """
+        pcs = self.pcs
+        if active is None:
+            active = np.ones(len(pcs), dtype=bool)
+        pc = int(pcs[active].min())
+        mask = active & (pcs == pc)
+        instruction = self.program.fetch(pc)
+        try:
+            operation = operations[type(instruction)]
+        except KeyError:
+            raise NotImplementedError(
+                f"The instruction '{type(instruction).__name__}' is not "
+                f"supported by {__class__.__name__}.") from None
+        operation(self, instruction, pc, mask)
+        return mask
+
+    def run(self, max_steps=None, until_pc=None):
+        """Step until every lane reaches `until_pc` or after `max_steps`.
+
+        Returns
+        -------
+        int
+            The number of executed steps, each one instruction on a
+            group of lanes.
+        """
+        steps = 0
+        while max_steps is None or steps < max_steps:
+            if until_pc is None:
+                active = None
+            else:
+                active = self.pcs != np.uint64(until_pc)
+                if not active.any():
+                    break
+            self.step(active)
+            steps += 1
+        return steps
+
+
+def register_register(function, signed=False):
+    def operation(vsim, instruction, pc, mask):
+        v_rs1 = vsim.registers[:, instruction.rs1]
+        if signed:
+            v_rs1 = v_rs1.view(np.int64)
+        v_rs2 = vsim.registers[:, instruction.rs2]
+        vsim.write(instruction.rd, function(v_rs1, v_rs2), mask)
+        vsim.pcs[mask] = pc + 4
+    return operation
+
+
+def register_immediate(function, signed=False):
+    def operation(vsim, instruction, pc, mask):
+        v = vsim.registers[:, instruction.rs]
+        if signed:
+            v = v.view(np.int64)
+        vsim.write(instruction.rd, function(v, instruction.imm), mask)
+        vsim.pcs[mask] = pc + 4
+    return operation
+
+
+def load(bytes_num, signed):
+    def operation(vsim, instruction, pc, mask):
+        addrs = vsim.registers[:, instruction.rs] + uint64(instruction.imm)
+        for i in np.flatnonzero(mask):
+            v = vsim.memories[i].read(int(addrs[i]), bytes_num, signed=signed)
+            if instruction.rd:
+                vsim.registers[i, instruction.rd] = v & MASK
+        vsim.pcs[mask] = pc + 4
+    return operation
+
+
+def store(bytes_num):
+    def operation(vsim, instruction, pc, mask):
+        addrs = vsim.registers[:, instruction.rs1] + uint64(instruction.imm)
+        values = vsim.registers[:, instruction.rs2]
+        for i in np.flatnonzero(mask):
+            vsim.memories[i].write(int(addrs[i]), bytes_num, int(values[i]))
+        vsim.pcs[mask] = pc + 4
+    return operation
+
+
+def branch(function, signed):
+    def operation(vsim, instruction, pc, mask):
+        v1 = vsim.registers[:, instruction.rs1]
+        v2 = vsim.registers[:, instruction.rs2]
+        if signed:
+            v1, v2 = v1.view(np.int64), v2.view(np.int64)
+        pcs = np.where(function(v1, v2),
+                       uint64(pc + instruction.imm * 2), uint64(pc + 4))
+        vsim.pcs[mask] = pcs[mask]
+    return operation
+
+
+def jal(vsim, instruction, pc, mask):
+    vsim.write(instruction.rd, uint64(pc + 4), mask)
+    vsim.pcs[mask] = uint64(pc + instruction.imm * 2)
+
+
+def jalr(vsim, instruction, pc, mask):
+    pcs = ((vsim.registers[:, instruction.rs] + uint64(instruction.imm))
+           & uint64(~1))
+    vsim.write(instruction.rd, uint64(pc + 4), mask)
+    vsim.pcs[mask] = pcs[mask]
+
+
+def lui(vsim, instruction, pc, mask):
+    vsim.write(instruction.rd, uint64(sign_extend(instruction.imm << 12, 32)),
+               mask)
+    vsim.pcs[mask] = pc + 4
+
+
+def auipc(vsim, instruction, pc, mask):
+    vsim.write(instruction.rd,
+               uint64(pc + sign_extend(instruction.imm << 12, 32)), mask)
+    vsim.pcs[mask] = pc + 4
+
+
+operations = {
+    instructions.AddInstruction:  register_register(lambda a, b: a + b),
+    instructions.SubInstruction:  register_register(lambda a, b: a - b),
+    instructions.SllInstruction:  register_register(
+        lambda a, b: a << (b & np.uint64(0b111111))),
+    instructions.SrlInstruction:  register_register(
+        lambda a, b: a >> (b & np.uint64(0b111111))),
+    instructions.SraInstruction:  register_register(
+        lambda a, b: a >> int64_shamt(b), signed=True),
+    instructions.XorInstruction:  register_register(lambda a, b: a ^ b),
+    instructions.OrInstruction:   register_register(lambda a, b: a | b),
+    instructions.AndInstruction:  register_register(lambda a, b: a & b),
+    instructions.AddwInstruction: register_register(
+        lambda a, b: word_signed(a + b)),
+    instructions.SubwInstruction: register_register(
+        lambda a, b: word_signed(a - b)),
+    instructions.SllwInstruction: register_register(
+        lambda a, b: word_signed(a << (b & np.uint64(0b11111)))),
+    instructions.SrlwInstruction: register_register(
+        lambda a, b: word_signed((a & np.uint64(0xffffffff))
+                                 >> (b & np.uint64(0b11111)))),
+    instructions.SrawInstruction: register_register(
+        lambda a, b: word_signed(a) >> int64_shamt(b, 0b11111)),
+    instructions.LbInstruction:   load(1, signed=True),
+    instructions.LhInstruction:   load(2, signed=True),
+    instructions.LwInstruction:   load(4, signed=True),
+    instructions.LdInstruction:   load(8, signed=True),
+    instructions.LbuInstruction:  load(1, signed=False),
+    instructions.LhuInstruction:  load(2, signed=False),
+    instructions.LwuInstruction:  load(4, signed=False),
+    instructions.AddiInstruction: register_immediate(
+        lambda a, imm: a + uint64(imm)),
+    instructions.SlliInstruction: register_immediate(
+        lambda a, imm: a << np.uint64(imm)),
+    instructions.SrliInstruction: register_immediate(
+        lambda a, imm: a >> np.uint64(imm)),
+    instructions.SraiInstruction: register_immediate(
+        lambda a, imm: a >> np.int64(imm), signed=True),
+    instructions.XoriInstruction: register_immediate(
+        lambda a, imm: a ^ uint64(imm)),
+    instructions.OriInstruction:  register_immediate(
+        lambda a, imm: a | uint64(imm)),
+    instructions.AndiInstruction: register_immediate(
+        lambda a, imm: a & uint64(imm)),
+    instructions.AddiwInstruction: register_immediate(
+        lambda a, imm: word_signed(a + uint64(imm))),
+    instructions.SlliwInstruction: register_immediate(
+        lambda a, imm: word_signed(a << np.uint64(imm))),
+    instructions.SrliwInstruction: register_immediate(
+        lambda a, imm: word_signed((a & np.uint64(0xffffffff))
+                                   >> np.uint64(imm))),
+    instructions.SraiwInstruction: register_immediate(
+        lambda a, imm: word_signed(a) >> np.int64(imm)),
+    instructions.JalrInstruction: jalr,
+    instructions.SbInstruction:   store(1),
+    instructions.ShInstruction:   store(2),
+    instructions.SwInstruction:   store(4),
+    instructions.SdInstruction:   store(8),
+    instructions.BeqInstruction:  branch(np.equal, signed=True),
+    instructions.BneInstruction:  branch(np.not_equal, signed=True),
+    instructions.BltInstruction:  branch(np.less, signed=True),
+    instructions.BgeInstruction:  branch(np.greater_equal, signed=True),
+    instructions.BltuInstruction: branch(np.less, signed=False),
+    instructions.BgeuInstruction: branch(np.greater_equal, signed=False),
+    instructions.LuiInstruction:  lui,
+    instructions.AuipcInstruction: auipc,
+    instructions.JalInstruction:  jal,
+}
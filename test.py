@@ -7,7 +7,22 @@ Initial test cases are based on Wuhan University course
 homework
 """
 
+import errno
+import io
+import json
+import mmap
+import os
+import pickle
+import random
+import struct
+import tempfile
 import unittest
+from unittest import mock
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from riscvsim import (
     InstructionFactory,
@@ -15,8 +30,26 @@ from riscvsim import (
     Register,
     Simulator,
     Memory,
+    MappedMemory,
+    Profile,
+    TraceWriter,
+    read_trace,
+    Cache,
+    CacheHierarchy,
+    StaticPredictor,
+    BimodalPredictor,
+    GsharePredictor,
+    TagePredictor,
+    BranchPredictors,
+    Pipeline,
+    replay,
+    Machine,
+    Syscalls,
+    ProgramExit,
+    run_batch,
 )
 from riscvsim.config import *
+from riscvsim.compressed import expand
 
 
 class TestInstructionFactory(unittest.TestCase):
@@ -29,7 +62,7 @@ class TestInstructionFactory(unittest.TestCase):
             ["slli x2, x1, 12",     0x00c09113],
             ["jalr x2, -100(x1)",   0xf9c08167],
             ["sw x2, 100(x1)",      0x0620a223],
-            ["beq x1, x2, -100",    0xf2208ce7],
+            ["beq x1, x2, -100",    0xf2208ce3],
             ["lui x1, 1234",        0x004d20b7],
             ["jal x1, -200",        0xe71ff0ef],
             # TODO: more and more
@@ -41,9 +74,141 @@ class TestInstructionFactory(unittest.TestCase):
             i = InstructionFactory.get(i)
             self.assertEqual(int(i), v, f"{i=}\n{int(i):0=#32b}\n{v:0=#32b}")
 
-        # TODO: exceptions should be tested
+        # ABI names, case and spacing
+        self.assertEqual(int(InstructionFactory.get("ADD\tgp,sp , ra")),
+                         0x001101b3)
+        self.assertEqual(int(InstructionFactory.get("lw sp, -100(ra)")),
+                         0xf9c0a103)
+        i = InstructionFactory.get("ld s0, 8(fp)")
+        self.assertEqual((i.rd, i.rs), (8, 8))
+        i = InstructionFactory.get("sd a0, 0(t6)")
+        self.assertEqual((i.rs2, i.rs1), (10, 31))
+
+        for text, error in [
+                ["", ValueError],
+                ["nop", ValueError],
+                ["add x1, x2", ValueError],
+                ["lw x1, x2, 0", ValueError],
+                ["addi x1, x2, one", ValueError],
+                ["add x1, x2, x32", TypeError],
+                ["jal x1, nowhere", ValueError]]:
+            with self.assertRaises(error, msg=text):
+                InstructionFactory.get(text)
+        with self.assertRaises(TypeError):
+            InstructionFactory.get(1.0)
+
+        # immediates out of the range of their format
+        for text in ["addi x5, x0, 0x1010", "addi x5, x0, -2049",
+                     "sd x1, 2048(x2)", "slli x1, x1, 64", "slliw x1, x1, 32",
+                     "lui x1, 0x100000", "beq x1, x2, 2048",
+                     "jal x1, -0x80001"]:
+            with self.assertRaises(ValueError) as cm:
+                InstructionFactory.get(text)
+            self.assertIn(f"`{text}`", str(cm.exception))
+        for text in ["addi x5, x0, -2048", "slli x1, x1, 63", "lui x1, -1",
+                     "beq x1, x2, 2047", "jal x1, -0x80000"]:
+            InstructionFactory.get(text)
+
+    def test_get_cache(self):
+        InstructionFactory.cache_clear()
+        first = InstructionFactory.get("addi a0, a0, 1")
+        self.assertIs(InstructionFactory.get("addi a0, a0, 1"), first)
+        info = InstructionFactory.cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 1))
+
+    def test_get_int(self):
+        cases = [
+            "add x3, x2, x1",
+            "sra x3, x2, x1",
+            "mulhsu x3, x2, x1",
+            "divw x3, x2, x1",
+            "remuw x3, x2, x1",
+            "addi x2, x1, -100",
+            "lw x2, -100(x1)",
+            "lbu x2, 7(x1)",
+            "slli x2, x1, 12",
+            "srai x2, x1, 63",
+            "jalr x2, -100(x1)",
+            "sw x2, 100(x1)",
+            "sd x2, -8(x1)",
+            "beq x1, x2, -100",
+            "bltu x1, x2, 100",
+            "lui x1, 1234",
+            "auipc x1, 1234",
+            "lui x1, -1",
+            "addw x3, x2, x1",
+            "sraw x3, x2, x1",
+            "addiw x2, x1, -100",
+            "slliw x2, x1, 31",
+            "sraiw x2, x1, 31",
+            "jal x1, -200",
+        ]
+        for text in cases:
+            expected = InstructionFactory.get(text)
+            i = InstructionFactory.get(int(expected))
+            self.assertIs(type(i), type(expected), text)
+            self.assertEqual(i.fields(), expected.fields(), text)
+            self.assertEqual(int(i), int(expected), text)
+            self.assertEqual(i, expected, text)
+        self.assertEqual(int(InstructionFactory.get("mul a0, a0, a1")),
+                         0x02b50533)
+        self.assertEqual(int(InstructionFactory.get("remuw a0, a0, a1")),
+                         0x02b5753b)
+        self.assertEqual(int(InstructionFactory.get("sraiw a0, a0, 3")),
+                         0x4035551b)
+        self.assertEqual(int(InstructionFactory.get("auipc a0, 0x12345")),
+                         0x12345517)
+
+        with self.assertRaises(ValueError):
+            InstructionFactory.get(0x00000000)
+        with self.assertRaises(ValueError):
+            InstructionFactory.get(0x1001101b3)
+
+    def test_init(self):
+        from riscvsim import instructions as i
+
+        # fields which do not fit the encoding would not match `word`
+        for cls, fields in [
+                [i.AddiInstruction, dict(rd=1, rs=0, imm=5000)],
+                [i.AddInstruction, dict(rd=32, rs1=0, rs2=0)],
+                [i.SlliInstruction, dict(rd=1, rs=1, imm=64)],
+                [i.SrliwInstruction, dict(rd=1, rs=1, imm=-1)],
+                [i.SdInstruction, dict(rs1=-1, rs2=0, imm=0)],
+                [i.BeqInstruction, dict(rs1=0, rs2=0, imm=2048)],
+                [i.LuiInstruction, dict(rd=1, imm=1 << 20)],
+                [i.JalInstruction, dict(rd=1, imm=1 << 19)]]:
+            with self.assertRaises(ValueError, msg=cls.__name__):
+                cls(**fields)
+        lui = i.LuiInstruction(rd=1, imm=-1)
+        self.assertEqual(lui.imm, 0xfffff)
+        self.assertEqual(lui, InstructionFactory.decode(int(lui)))
+
+    def test_decode_many(self):
+        cases = ["lui x1, 16", "add x2, x2, x1", "bge x2, x1, -8", "jal x0, 0"]
+        expected = [InstructionFactory.get(_) for _ in cases]
+        buffer = b"".join(int(_).to_bytes(4, "little") for _ in expected)
+
+        decoded = InstructionFactory.decode_many(buffer)
+        self.assertEqual([int(_) for _ in decoded], [int(_) for _ in expected])
+        self.assertEqual([type(_) for _ in decoded],
+                         [type(_) for _ in expected])
+        self.assertEqual(InstructionFactory.decode_many(b""), [])
+
+        with self.assertRaises(ValueError):
+            InstructionFactory.decode_many(buffer[:-1])
+        with self.assertRaises(ValueError):
+            InstructionFactory.decode_many(buffer + bytes(4))
+
+        # compressed parcels take 2 bytes
+        mixed = (buffer[:4] + (0x4515).to_bytes(2, "little")
+                 + buffer[4:8] + (0x8082).to_bytes(2, "little"))
+        decoded = InstructionFactory.decode_many(mixed)
+        self.assertEqual([int(_) for _ in decoded],
+                         [int(expected[0]), 0x4515, int(expected[1]), 0x8082])
+        self.assertEqual([_.length for _ in decoded], [4, 2, 4, 2])
+        with self.assertRaises(ValueError):
+            InstructionFactory.decode_many(mixed[:-1])
 
-    @unittest.skip("to implement")
     def test_get_text(self):
         text = r"""
             add x0, x0, x0      ; Instruction0
@@ -63,9 +228,117 @@ class TestInstructionFactory(unittest.TestCase):
         )
         self.assertEqual(
             hex(InstructionFactory.get_text(text)[3]),
-            "0x00208667"
+            "0x208663"
         )
 
+    def test_assemble(self):
+        text = r"""
+        start:  addi x10, x0, 0x10      # comments with '#' work too
+        loop:   addi x10, x10, -1
+                bne x10, x0, loop
+        end:
+        """
+        instructions, labels = InstructionFactory.assemble(text, base=0x400)
+        self.assertEqual(labels, {"start": 0x400, "loop": 0x404, "end": 0x40c})
+        self.assertEqual([int(_) for _ in instructions], [
+            int(InstructionFactory.get("addi x10, x0, 16")),
+            int(InstructionFactory.get("addi x10, x10, -1")),
+            int(InstructionFactory.get("bne x10, x0, -2")),
+        ])
+
+        with self.assertRaisesRegex(ValueError, "not defined"):
+            InstructionFactory.assemble("jal x1, nowhere")
+        with self.assertRaisesRegex(ValueError, "defined twice"):
+            InstructionFactory.assemble("a:\na: add x0, x0, x0")
+
+        # a branch reaches 4 KiB - 2 forward
+        nops = "addi x0, x0, 0\n"
+        instructions, _ = InstructionFactory.assemble(
+            "beq x0, x0, far\n" + nops * 1022 + "far:")
+        self.assertEqual(instructions[0].imm, 2046)
+        with self.assertRaisesRegex(ValueError, "`far`.*`beq x0, x0, far`"):
+            InstructionFactory.assemble(
+                "beq x0, x0, far\n" + nops * 1023 + "far:")
+
+
+class TestCompressed(unittest.TestCase):
+
+    def test_expand(self):
+        cases = [
+            [0x4515, "addi a0, x0, 5"],     # c.li
+            [0x0505, "addi a0, a0, 1"],     # c.addi
+            [0x1141, "addi sp, sp, -16"],
+            [0x7139, "addi sp, sp, -64"],   # c.addi16sp
+            [0x0808, "addi a0, sp, 16"],    # c.addi4spn
+            [0x2505, "addiw a0, a0, 1"],
+            [0x6505, "lui a0, 1"],
+            [0x1502, "slli a0, a0, 32"],
+            [0x9101, "srli a0, a0, 32"],
+            [0x87aa, "add a5, x0, a0"],     # c.mv
+            [0x97aa, "add a5, a5, a0"],
+            [0x8d89, "sub a1, a1, a0"],
+            [0x4108, "lw a0, 0(a0)"],
+            [0x6398, "ld a4, 0(a5)"],
+            [0x60a2, "ld ra, 8(sp)"],       # c.ldsp
+            [0xe406, "sd ra, 8(sp)"],       # c.sdsp
+            [0xc119, "beq a0, x0, 3"],      # c.beqz +6
+            [0xfd75, "bne a0, x0, -2"],     # c.bnez -4
+            [0xa011, "jal x0, 2"],          # c.j +4
+            [0xbff5, "jal x0, -2"],         # c.j -4
+            [0x8082, "jalr x0, 0(ra)"],     # c.jr ra
+            [0x9782, "jalr ra, 0(a5)"],     # c.jalr a5
+        ]
+        for parcel, text in cases:
+            expected = InstructionFactory.get(text)
+            instruction = InstructionFactory.decode(parcel)
+            self.assertIsInstance(instruction, type(expected), text)
+            self.assertEqual(instruction.fields(), expected.fields(), text)
+            self.assertEqual(instruction.length, 2)
+            self.assertEqual(int(instruction), parcel)
+            self.assertEqual(instruction.encode(), int(expected))
+            self.assertIs(InstructionFactory.decode(parcel), instruction)
+            self.assertEqual(pickle.loads(pickle.dumps(instruction)),
+                             instruction)
+        self.assertIn("CompressedAddiInstruction", repr(expand(0x0505)))
+
+        # illegal, c.ebreak, c.fldsp, c.lui with 0, c.addiw x0, too long
+        for parcel in (0x0000, 0x9002, 0x2002, 0x6001, 0x2001, 0x10001):
+            with self.assertRaises(ValueError, msg=hex(parcel)):
+                InstructionFactory.decode(parcel)
+
+    def test_run(self):
+        code = [
+            (0x4515, 2),                            # c.li a0, 5
+            (int(InstructionFactory.get("addi a1, x0, 0")), 4),
+            (0x95aa, 2),                            # c.add a1, a1, a0
+            (0x157d, 2),                            # c.addi a0, -1
+            (0xfd75, 2),                            # c.bnez a0, -4
+            (0x8082, 2),                            # c.jr ra
+        ]
+        data = b"".join(word.to_bytes(size, "little") for word, size in code)
+        for mode in ("step", "translate", "profile"):
+            sim = Simulator(pc=0x1000, ra=0x2000)
+            sim.memory.write_bytes(0x1000, data)
+            if mode == "profile":
+                sim.profile = Profile()
+            steps = sim.run(until_pc=0x2000, translate=mode == "translate")
+            self.assertEqual((sim.a0, sim.a1), (0, 15), mode)
+            self.assertEqual(steps, 2 + 5 * 3 + 1, mode)
+        branches = sim.profile.as_dict()["branches"]
+        self.assertEqual(branches, {"CompressedBneInstruction":
+                                    {"taken": 4, "not_taken": 1}})
+
+        sim = Simulator(pc=0x1000)
+        sim.memory.write_bytes(0x1000, data[:2])
+        sim.caches = CacheHierarchy()
+        sim.step()
+        self.assertEqual(sim.pc, 0x1002)
+        # c.jalr links pc + 2
+        sim.memory.write_bytes(0x1002, (0x9782).to_bytes(2, "little"))
+        sim.a5 = 0x3000
+        sim.step()
+        self.assertEqual((sim.pc, sim.ra), (0x3000, 0x1004))
+
 
 class TestRegister(unittest.TestCase):
 
@@ -134,16 +407,33 @@ class TestRegisters(unittest.TestCase):
 
         registers = Registers()
         for r, i in registers_dir.items():
-            magic_1 = 0x00114514
-            magic_2 = 0x01919810
-            registers[i].set(SIZE, magic_1)
+            magic_1 = 0x00114514 if i else 0
+            magic_2 = 0x01919810 if i else 0
+            registers[i].set(SIZE, 0x00114514)
             self.assertEqual(registers[r].get(SIZE, signed=False), magic_1,
                              f"{r=}, {i=}, {registers[r]=}")
-            registers[r].set(SIZE, magic_2)
+            registers[r].set(SIZE, 0x01919810)
             self.assertEqual(registers[i].get(SIZE, signed=False), magic_2,
                              f"{r=}, {i=}, {registers[i]=}")
         # TODO: exceptions should be tested
 
+    def test_read_write(self):
+        registers = Registers()
+        registers.write(1, -1)
+        self.assertEqual(registers.read_u(1), 0xffffffffffffffff)
+        self.assertEqual(registers.read_s(1), -1)
+        registers.write(2, 1 << 64 | 0x7f)
+        self.assertEqual(registers.read_u(2), 0x7f)
+        self.assertEqual(registers.read_s(2), 0x7f)
+        registers.write(0, 0x1234)
+        self.assertEqual(registers.read_u(0), 0)
+        self.assertEqual(registers["zero"].get(SIZE, signed=False), 0)
+
+        with self.assertRaises(IndexError):
+            registers[32]
+        with self.assertRaises(AttributeError):
+            registers.x1 = 1
+
 
 class TestMemory(unittest.TestCase):
 
@@ -180,6 +470,133 @@ class TestMemory(unittest.TestCase):
                 r"takes \d+ positional arguments but \d+ were given"):
             memory.read(0x00000000, 1, True)
 
+    def test_pages(self):
+        memory = Memory(addr_max=0xffff)
+        self.assertEqual(memory.read(0x1234, 8, signed=False), 0)
+        self.assertEqual(len(memory), 0)
+
+        memory.write(0x0ffc, 8, 0x1122334455667788)
+        self.assertEqual(len(memory.pages), 2)
+        self.assertEqual(memory.read(0x0ffc, 8, signed=False),
+                         0x1122334455667788)
+        self.assertEqual(memory.read(0x1000, 4, signed=False), 0x11223344)
+        self.assertEqual(memory.read(0x0ffe, 4, signed=False), 0x33445566)
+        self.assertEqual(memory[0x0fff].get(1, signed=False), 0x55)
+
+        memory.write_bytes(0x1ffe, bytes(range(1, 9)))
+        self.assertEqual(memory.read_bytes(0x1ffd, 10),
+                         bytes([0, *range(1, 9), 0]))
+        memory.write(0x3000, 2, -2)
+        self.assertEqual(memory.read(0x3000, 2, signed=True), -2)
+
+        with self.assertRaises(IndexError):
+            memory.write(0xfffe, 4, 0)
+        with self.assertRaises(IndexError):
+            memory.read(-1, 1, signed=False)
+        with self.assertRaises(IndexError):
+            memory.read_bytes(0xff00, 0x101)
+
+    def test_str(self):
+        memory = Memory()
+        self.assertEqual(str(memory), "Memory is empty.")
+        memory.write(0x1001, 2, 0xbeef)
+        memory.write(0x1010, 1, 0x01)
+        self.assertEqual(str(memory), "\n".join([
+            "Memory:",
+            "0x00001000  00 ef be 00   00 00 00 00",
+            "...",
+            "0x00001010  01 00 00 00   00 00 00 00",
+        ]))
+        memory.write(0x3000, 1, 0x02)
+        self.assertEqual(memory.dump(0x1008, 0x2000), "\n".join([
+            "Memory:",
+            "0x00001010  01 00 00 00   00 00 00 00",
+        ]))
+        self.assertEqual(memory.dump(limit=1), "\n".join([
+            "Memory:",
+            "0x00001000  00 ef be 00   00 00 00 00",
+            "... (next at 0x00001010)",
+        ]))
+        self.assertEqual(memory.dump(0x1011, 0x3001), memory.dump(0x1010))
+        self.assertEqual(memory.dump(0x2000, 0x3000), "Memory is empty.")
+
+
+class TestMappedMemory(unittest.TestCase):
+
+    def test_read_write(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "ram")
+            memory = MappedMemory(path, addr_max=0x3fffff)
+            self.assertEqual(os.path.getsize(path), 0x400000)
+            self.assertEqual(len(memory), 0)
+            memory.write(0x1ffe, 4, 0x12345678)
+            memory.write_bytes(0x200000, b"\xff" * 8)
+            self.assertEqual(memory.read(0x1ffe, 4, signed=False), 0x12345678)
+            self.assertEqual(memory.read(0x200000, 8, signed=True), -1)
+            self.assertEqual(memory.read(0x300000, 8, signed=False), 0)
+            with self.assertRaises(IndexError):
+                memory.read(0x3ffffe, 4, signed=False)
+            self.assertEqual(str(memory), str(memory.copy()))
+            self.assertEqual(memory.digest(), memory.copy().digest())
+
+            sim = Simulator(pc=0x1000, memory=memory)
+            snapshot = sim.snapshot()
+            sim.assemble("addi x1, x0, 5\nsd x1, 0(x0)")
+            sim.run(max_steps=2)
+            self.assertEqual(memory.read(0, 8, signed=False), 5)
+            sim.restore(snapshot)
+            self.assertEqual(memory.read(0, 8, signed=False), 0)
+            self.assertEqual(memory.read(0x1000, 4, signed=False), 0)
+            self.assertEqual(memory.digest(), snapshot.memory.digest())
+
+            memory.write_bytes(0x123456, b"dataset")
+            memory.flush()
+            private = MappedMemory(path, private=True)
+            self.assertEqual(private.addr_max, 0x3fffff)
+            self.assertEqual(private.read_bytes(0x123456, 7), b"dataset")
+            private.write_bytes(0x123456, b"DATASET")
+            self.assertEqual(memory.read_bytes(0x123456, 7), b"dataset")
+            private.close()
+            memory.close()
+
+    def test_run_batch(self):
+        with tempfile.TemporaryDirectory() as directory:
+            memory = MappedMemory(os.path.join(directory, "ram"),
+                                  addr_max=0xffff)
+            program = Simulator(pc=0x1000, memory=memory)
+            program.assemble("add x12, x10, x11\nsd x12, 0(x0)")
+            memory.write_bytes(0x8000, b"data")
+            self.assertEqual(memory.image(), memory.copy().image())
+            self.assertEqual(set(memory.image()), {0x1, 0x8})
+
+            states = [dict(a0=i, a1=2 * i) for i in range(4)]
+            results = list(run_batch(program, states, workers=2,
+                                     until_pc=0x1008))
+            for result, state in zip(results, states):
+                sim = Simulator(pc=0x1000, **state)
+                sim.memory = memory.copy()
+                sim.run(until_pc=0x1008)
+                self.assertEqual(result.reason, "until_pc")
+                self.assertEqual(result.registers[12], 3 * state["a0"])
+                self.assertEqual(result.memory_digest, sim.memory.digest())
+            memory.close()
+
+
+class Trickle(io.RawIOBase):
+    # a non-seekable stream giving at most 3 bytes per read
+
+    def __init__(self, data):
+        self.data = data
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = min(len(buffer), 3, len(self.data))
+        buffer[:n] = self.data[:n]
+        self.data = self.data[n:]
+        return n
+
 
 class TestSimulator(unittest.TestCase):
 
@@ -234,13 +651,24 @@ class TestSimulator(unittest.TestCase):
             ["lui x1, 1234",        "x1",   5054464   ],
             ["andi x2, x1, 100",    "x2",   64        ],
             ["sra x3, x2, x1",      "x3",   -1        ],
+            ["sraw x3, x2, x1",     "x3",   -1        ],
+            ["addiw x3, x2, 1",     "x3",   -4320     ],
+            ["add x3, x2, x1",      "x3",   -3087     ],
+            ["sub x3, x1, x2",      "x3",   5555      ],
+            ["sll x3, x1, x1",      "x3",   323485696 ],
+            ["xori x3, x2, -1",     "x3",   4320      ],
+            ["lb x3, -3(x1)",       "x3",   20        ],
+            ["lb x3, -2(x1)",       "x3",   -30       ],
+            ["lbu x3, -2(x1)",      "x3",   226       ],
+            ["add x0, x1, x1",      "x0",   0         ],
             ["blt x2, x1, -100",    "pc",   7800      ],
             ["bltu x2, x1, 100",    "pc",   8004      ],
             ["jal x1, -200",        "x1",   8004      ],
             ["jal x1, -200",        "pc",   7600      ],
             ["jalr x2, -100(x1)",   "x2",   8004      ],
             ["jalr x2, -100(x1)",   "pc",   1134      ],
-    # TODO: ["auipc x1, 100",       "x1",   417600    ],
+            ["auipc x1, 100",       "x1",   417600    ],
+            ["auipc x1, -1",        "x1",   3904      ],
     # TODO: ["slti x2, x1, -123",   "x2",   0         ],
     # TODO: ["sltiu x2, x1, -123",  "x2",   1         ],
             ["beq x2, x1, 100",     "pc",   8004      ],
@@ -256,11 +684,339 @@ class TestSimulator(unittest.TestCase):
             self.assertEqual(read, v, f"{i=} {r=} {read=:#x} {v=:#x}")
         # TODO: exceptions should be tested
 
-    @unittest.skip("to implement")
+    def test_word_ops(self):
+        cases = [
+            ["addw x3, x1, x2",   0x7fffffff,  1,          -1 << 31    ],
+            ["addw x3, x1, x2",   1 << 32,     5,          5           ],
+            ["subw x3, x1, x2",   0,           1,          -1          ],
+            ["sllw x3, x1, x2",   1,           33,         2           ],
+            ["sllw x3, x1, x2",   1,           31,         -1 << 31    ],
+            ["srlw x3, x1, x2",   -1,          4,          0x0fffffff  ],
+            ["srlw x3, x1, x2",   -16,         0,          -16         ],
+            ["sraw x3, x1, x2",   0x80000000,  4,          -1 << 27    ],
+            ["sraw x3, x1, x2",   -1 << 33,    36,         0           ],
+            ["addiw x3, x1, -1",  0,           0,          -1          ],
+            ["addiw x3, x1, 1",   0x7fffffff,  0,          -1 << 31    ],
+            ["addiw x3, x1, 0",   0x1_80000000, 0,         -1 << 31    ],
+            ["slliw x3, x1, 31",  3,           0,          -1 << 31    ],
+            ["srliw x3, x1, 1",   -2,          0,          0x7fffffff  ],
+            ["sraiw x3, x1, 31",  0x80000000,  0,          -1          ],
+        ]
+        for text, a, b, expected in cases:
+            for translate in (False, True):
+                sim = Simulator(pc=0x1000, x1=a, x2=b)
+                sim.assemble(text)
+                sim.run(max_steps=1, translate=translate)
+                self.assertEqual(sim.registers[3].get(SIZE, signed=True),
+                                 expected, (text, a, b, translate))
+
+        sim = Simulator(pc=0x1000)
+        sim.assemble("auipc x1, 0xfffff")     # pc - 0x1000
+        sim.run(max_steps=1, translate=True)
+        self.assertEqual(sim.x1, 0)
+
+    def test_multiply_divide(self):
+        big = 0x7fffffffffffffff
+        small = -big - 1
+        cases = [
+            ["mul",    -7,     3,      -21                 ],
+            ["mul",    big,    2,      -2                  ],
+            ["mulh",   -1,     -1,     0                   ],
+            ["mulh",   small,  small,  1 << 62             ],
+            ["mulhsu", -1,     -1,     -1                  ],
+            ["mulhu",  -1,     -1,     -2                  ],
+            ["div",    -7,     2,      -3                  ],
+            ["div",    7,      0,      -1                  ],
+            ["div",    small,  -1,     small               ],
+            ["divu",   -7,     2,      big - 3             ],
+            ["divu",   7,      0,      -1                  ],
+            ["rem",    -7,     2,      -1                  ],
+            ["rem",    7,      -2,     1                   ],
+            ["rem",    -7,     0,      -7                  ],
+            ["rem",    small,  -1,     0                   ],
+            ["remu",   -7,     0,      -7                  ],
+            ["remu",   10,     4,      2                   ],
+            ["mulw",   0x10000, 0x10000, 0                 ],
+            ["mulw",   0x7fffffff, 2,  -2                  ],
+            ["divw",   0x1_fffffff9, 2, -3                 ],
+            ["divw",   -1 << 31, -1,   -1 << 31            ],
+            ["divw",   5,      0x1_00000000, -1            ],
+            ["divuw",  -1,     2,      0x7fffffff          ],
+            ["divuw",  5,      0,      -1                  ],
+            ["remw",   -7,     0x1_00000002, -1            ],
+            ["remw",   -1 << 31, -1,   0                   ],
+            ["remuw",  0xf_fffffff9, 0, -7                 ],
+            ["remuw",  -1,     0x10,   15                  ],
+        ]
+        for mnemonic, a, b, expected in cases:
+            for translate in (False, True):
+                sim = Simulator(pc=0x1000, x1=a, x2=b)
+                sim.assemble(f"{mnemonic} x3, x1, x2")
+                sim.run(max_steps=1, translate=translate)
+                self.assertEqual(sim.registers[3].get(SIZE, signed=True),
+                                 expected, (mnemonic, a, b, translate))
+
+    def test_run_loop(self):
+        sim = Simulator(pc=0x1000, x1=10)
+        program = [
+            "addi x2, x2, 3",       # 0x1000
+            "addi x1, x1, -1",      # 0x1004
+            "bne x1, x0, -4",       # 0x1008
+            "sw x2, 0(x3)",         # 0x100c
+        ]
+        for i, text in enumerate(program):
+            sim.memory.write(0x1000 + 4*i, 4, int(InstructionFactory.get(text)))
+
+        self.assertEqual(sim.run(until_pc=0x1010), 31)
+        self.assertEqual(sim.x1, 0)
+        self.assertEqual(sim.x2, 30)
+        self.assertEqual(sim.memory.read(0x0000, 4, signed=False), 30)
+        self.assertEqual(len(sim.memory.icache), 4)
+
+        sim.pc = 0x1000
+        self.assertEqual(sim.run(max_steps=2), 2)
+        self.assertEqual(sim.pc, 0x1008)
+
+    def test_run_self_modifying(self):
+        sim = Simulator(pc=0x1000, x5=0x1004)
+        program = [
+            "sw x6, 0(x5)",         # 0x1000
+            "addi x7, x7, 1",       # 0x1004
+        ]
+        for i, text in enumerate(program):
+            sim.memory.write(0x1000 + 4*i, 4, int(InstructionFactory.get(text)))
+        sim.x6 = int(InstructionFactory.get("addi x7, x7, 100"))
+
+        sim.fetch(0x1004)
+        sim.run(max_steps=1)
+        self.assertNotIn(0x1004, sim.memory.icache)
+        sim.run(max_steps=1)
+        self.assertEqual(sim.x7, 100)
+
+        sim.fetch(0x1004)
+        sim.memory.write(0x1006, 1, 0)
+        self.assertNotIn(0x1004, sim.memory.icache)
+
+    def test_run_translate(self):
+        program = [
+            "addi x1, x0, 20",      # 0x1000
+            "addi x5, x0, 256",     # 0x1004
+            "add x2, x2, x1",       # 0x1008  loop:
+            "sd x2, 0(x5)",         # 0x100c
+            "ld x3, 0(x5)",         # 0x1010
+            "srai x4, x3, 1",       # 0x1014
+            "sub x6, x6, x4",       # 0x1018
+            "addi x5, x5, 8",       # 0x101c
+            "addi x1, x1, -1",      # 0x1020
+            "blt x0, x1, -14",      # 0x1024  to loop
+            "jal x7, 4",            # 0x1028  to 0x1030
+            "addi x8, x0, -1",      # 0x102c  skipped
+            "jalr x0, 4(x7)",       # 0x1030  to 0x1030
+        ]
+        sim = Simulator(pc=0x1000)
+        for i, text in enumerate(program):
+            sim.memory.write(0x1000 + 4*i, 4, int(InstructionFactory.get(text)))
+
+        for kwargs in [dict(until_pc=0x1030), dict(max_steps=150),
+                       dict(max_steps=3), dict(until_pc=0x1020)]:
+            expected = sim.copy()
+            steps = expected.run(**kwargs)
+            translated = sim.copy()
+            self.assertEqual(translated.run(**kwargs, translate=True), steps)
+            self.assertEqual(str(translated), str(expected), kwargs)
+
+        sim.run(until_pc=0x1030, translate=True)
+        self.assertEqual(sim.x6, (-sum(sum(range(i, 21)) >> 1
+                                       for i in range(1, 21))) % (1 << 64))
+        self.assertIn(0x1008, sim.memory.blocks)
+        self.assertEqual(sim.memory.blocks[0x1008].length, 8)
+
+    def test_run_translate_self_modifying(self):
+        sim = Simulator(pc=0x1000, x5=0x1008)
+        program = [
+            "addi x7, x7, 1",       # 0x1000
+            "sw x6, 0(x5)",         # 0x1004
+            "addi x7, x7, 1",       # 0x1008
+            "jal x0, -4",           # 0x100c  to 0x1004
+        ]
+        for i, text in enumerate(program):
+            sim.memory.write(0x1000 + 4*i, 4, int(InstructionFactory.get(text)))
+        sim.x6 = int(InstructionFactory.get("addi x7, x7, 100"))
+
+        self.assertEqual(sim.run(max_steps=6, translate=True), 6)
+        self.assertEqual(sim.x7, 1 + 100 + 100)
+        self.assertNotIn(0x1000, sim.memory.blocks)
+
+    def test_run_translate_exception(self):
+        sim = Simulator(pc=0x1000, x5=0xfffffff0)
+        program = [
+            "addi x6, x0, 7",       # 0x1000
+            "addi x5, x5, 16",      # 0x1004
+            "sw x6, 0(x5)",         # 0x1008  out of memory
+            "jal x0, 0",            # 0x100c
+        ]
+        for i, text in enumerate(program):
+            sim.memory.write(0x1000 + 4*i, 4, int(InstructionFactory.get(text)))
+
+        snapshot = sim.snapshot()
+        with self.assertRaises(IndexError):
+            sim.run(translate=True)
+        self.assertEqual(sim.pc, 0x1008)
+        self.assertEqual(sim.x5, 0x100000000)
+        self.assertEqual(sim.x6, 7)
+        # the instructions before the fault are counted as in step mode
+        self.assertEqual((sim.cycle, sim.instret), (2, 2))
+        sim.restore(snapshot)
+        with self.assertRaises(IndexError):
+            sim.run()
+        self.assertEqual((sim.cycle, sim.instret), (2, 2))
+
+    def test_snapshot_restore(self):
+        sim = Simulator(pc=0x1000, x1=3)
+        program = [
+            "sd x1, 0(x2)",         # 0x1000
+            "addi x1, x1, -1",      # 0x1004
+            "addi x2, x2, 2040",    # 0x1008
+            "bne x1, x0, -6",       # 0x100c  to 0x1000
+        ]
+        for i, text in enumerate(program):
+            sim.memory.write(0x1000 + 4*i, 4, int(InstructionFactory.get(text)))
+        sim.memory.write(0x4000, 8, 0x1122334455667788)
+        sim.memory.write(0x0ff0, 8, 0x99)
+
+        snapshot = sim.snapshot()
+        for page_number, page in sim.memory.pages.items():
+            self.assertIs(snapshot.memory.pages[page_number], page)
+
+        sim.run(until_pc=0x1010, translate=True)
+        self.assertEqual(sim.memory.read(0x07f8, 8, signed=False), 2)
+        self.assertIs(sim.memory.pages[0x4], snapshot.memory.pages[0x4])
+        self.assertIs(sim.memory.pages[0x1], snapshot.memory.pages[0x1])
+        self.assertIsNot(sim.memory.pages[0x0], snapshot.memory.pages[0x0])
+        self.assertEqual(snapshot.memory.read(0x07f8, 8, signed=False), 0)
+        self.assertEqual(snapshot.memory.read(0x0ff0, 8, signed=False), 0x99)
+        blocks = dict(sim.memory.blocks)
+
+        for _ in range(2):
+            sim.restore(snapshot)
+            self.assertEqual(str(sim), str(snapshot))
+            self.assertEqual(sim.memory.blocks, blocks)
+            sim.run(until_pc=0x1010, translate=True)
+            self.assertEqual(sim.memory.read(0x0ff0, 8, signed=False), 1)
+
+        snapshot.memory.write(0x1004, 4, int(InstructionFactory.get("addi x1, x1, -3")))
+        sim.restore(snapshot)
+        self.assertEqual(sim.memory.blocks, {})
+        sim.run(until_pc=0x1010, translate=True)
+        self.assertEqual(sim.x2, 0x7f8)
+
+    def test_profile(self):
+        text = r"""
+            addi x1, x0, 3
+            loop:
+            addi x1, x1, -1
+            bne x1, x0, loop
+            end:
+        """
+        sim = Simulator(pc=0x1000)
+        labels = sim.assemble(text)
+        snapshot = sim.snapshot()
+        self.assertEqual(sim.run(until_pc=labels["end"], translate=True), 7)
+        self.assertEqual((sim.cycle, sim.instret), (7, 7))
+
+        sim.restore(snapshot)
+        self.assertEqual(sim.instret, 0)
+        sim.profile = Profile(timing=True)
+        sim.run(until_pc=labels["end"], translate=True)
+        sim.step(sim.fetch(0x1000))
+        self.assertEqual(sim.instret, 8)
+        profile = sim.profile.as_dict()
+        self.assertEqual(profile["instructions"], 8)
+        self.assertEqual(profile["counts"],
+                         {"AddiInstruction": 5, "BneInstruction": 3})
+        self.assertEqual(profile["branches"],
+                         {"BneInstruction": {"taken": 2, "not_taken": 1}})
+        self.assertEqual(set(profile["time_ns"]), set(profile["counts"]))
+        self.assertEqual(json.loads(sim.profile.to_json()), profile)
+
+    def test_trace(self):
+        text = r"""
+            addi x1, x0, 0x100
+            addi x2, x0, -2
+            sh x2, 6(x1)
+            lbu x1, 7(x1)
+            beq x0, x0, end
+            end:
+        """
+        for compress in (False, True):
+            sim = Simulator(pc=0x1000)
+            labels = sim.assemble(text)
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "trace")
+                with TraceWriter(path, compress=compress,
+                                 buffer_records=2) as tracer:
+                    sim.tracer = tracer
+                    sim.profile = Profile()
+                    sim.run(until_pc=labels["end"], translate=True)
+                records = list(read_trace(path))
+                # a pipe: short reads and no seek
+                with open(path, "rb") as f:
+                    pipe = Trickle(f.read())
+                self.assertEqual(list(read_trace(pipe, 2)), records)
+            self.assertEqual(sim.profile.as_dict()["instructions"], 5)
+            self.assertEqual(len(records), 5)
+            pc, word, rd, access, size, value, addr, data = records[0]
+            self.assertEqual((pc, rd, value, access), (0x1000, 1, 0x100, 0))
+            self.assertEqual(word, int(sim.fetch(0x1000)))
+            self.assertEqual(records[2][1:], (int(sim.fetch(0x1008)), 0,
+                                              2, 2, 0, 0x106, 0xfffe))
+            self.assertEqual(records[3][2:], (1, 1, 1, 0xff, 0x107, 0xff))
+            self.assertEqual(records[4][0], 0x1010)
+
+    def test_diff(self):
+        sim = Simulator(pc=0x1000, x3=7)
+        sim.memory.write_bytes(0x2ff8, bytes(range(1, 17)))
+        labels = sim.assemble("""
+            addi x1, x0, -1
+            addi x2, x0, 0x300
+            slli x2, x2, 4
+            sd x1, -4(x2)
+            sb x0, 6(x2)
+            sb x0, 0x100(x2)
+            addi x3, x0, 7
+            end:
+        """)
+        snapshot = sim.snapshot()
+        self.assertFalse(sim.diff(snapshot))
+        self.assertEqual(str(sim.diff(snapshot)), "No changes.")
+        sim.run(until_pc=labels["end"])
+        diff = sim.diff(snapshot)
+        self.assertEqual(diff.pc, (0x1000, labels["end"]))
+        self.assertEqual(diff.registers, {1: (0, MASK), 2: (0, 0x3000)})
+        self.assertEqual(diff.memory, [
+            (0x2ffc, bytes(range(5, 16)), b"\xff" * 8 + b"\x0d\x0e\0"),
+        ])
+        self.assertEqual(str(diff).splitlines()[-1],
+                         "0x00002ffc  05 06 07 08 09 0a 0b 0c 0d 0e 0f -> "
+                         "ff ff ff ff ff ff ff ff 0d 0e 00")
+        sim.restore(snapshot)
+        self.assertFalse(sim.diff(snapshot))
+
     def test_load(self):
-        pass
+        sim = Simulator(pc=0x8000)
+        program = [InstructionFactory.get(_) for _ in (
+            "addi x1, x0, 5",
+            "addi x1, x1, 1",
+        )]
+        sim.load(0x8000, program)
+        sim.load(0x8008, [0x00108093])      # addi x1, x1, 1 as a word
+        self.assertEqual(sim.pc, 0x8000)
+        for i, instruction in enumerate(program):
+            self.assertEqual(sim.memory.read(0x8000 + 4*i, 4, signed=False),
+                             int(instruction))
+        self.assertEqual(sim.run(until_pc=0x800c), 3)
+        self.assertEqual(sim.x1, 7)
 
-    @unittest.skip("to implement")
     def test_run(self):
         pc_orig = 0x8000
         x2_orig = 0x114514
@@ -274,8 +1030,8 @@ class TestSimulator(unittest.TestCase):
         """
         sim_copy = sim.copy()
         text = InstructionFactory.get_text(text)
-        sim_copy.load(0x00000000, text)
-        sim_copy.run(steps=3)
+        sim_copy.load(pc_orig, text)
+        sim_copy.run(max_steps=3)
         self.assertEqual(sim_copy.x2, x2_orig + x2_change)
 
         text = r"""
@@ -285,8 +1041,8 @@ class TestSimulator(unittest.TestCase):
         """
         text = InstructionFactory.get_text(text)
         sim_copy = sim.copy()
-        sim_copy.load(0x00000000, text)
-        sim_copy.run(steps=3)
+        sim_copy.load(pc_orig, text)
+        sim_copy.run(max_steps=3)
         self.assertEqual(sim_copy.x2, x2_orig + x2_change)
 
         text = r"""
@@ -296,10 +1052,628 @@ class TestSimulator(unittest.TestCase):
             add x2, x2, x1
         """
         sim_copy = sim.copy()
-        sim_copy.load(0x00000000, text)
-        sim_copy.run(steps=3)
+        labels = sim_copy.assemble(text + "end:")
+        sim_copy.run(until_pc=labels["end"])
         self.assertEqual(sim_copy.x2, x2_orig + x2_change)
 
+    def test_load_elf(self):
+        text = r"""
+            addi x1, x0, 42
+            lui x2, 0x11
+            sd x1, 8(x2)
+            end:
+        """
+        code = b"".join(struct.pack("<I", int(_))
+                        for _ in InstructionFactory.assemble(text, 0x10080)[0])
+        long_name = "_ZN" + "x" * 300 + "E"
+        strtab = (b"\0_start\0buf\0" + long_name.encode() + b"\0"
+                  + b"\xff\0")
+        symtab = (bytes(24)
+                  + struct.pack("<IBBHQQ", 1, 0x12, 0, 1, 0x10080, len(code))
+                  + struct.pack("<IBBHQQ", 8, 0x11, 0, 1, 0x11000, 16)
+                  + struct.pack("<IBBHQQ", 12, 0x12, 0, 1, 0x10084, 4)
+                  + struct.pack("<IBBHQQ", 13 + len(long_name), 0x12, 0, 1,
+                                0x10088, 4))
+        code_offset = 0x80
+        strtab_offset = code_offset + len(code)
+        symtab_offset = strtab_offset + len(strtab)
+        shoff = symtab_offset + len(symtab)
+        data = struct.pack("<16sHHIQQQIHHHHHH",
+                           b"\x7fELF\x02\x01\x01", 2, 0xf3, 1, 0x10080, 64,
+                           shoff, 0, 64, 56, 1, 64, 3, 0)
+        # one segment from the start of the file, with 0x1000 of .bss
+        data += struct.pack("<IIQQQQQQ", 1, 7, 0, 0x10000, 0x10000,
+                            strtab_offset, 0x2000, 0x1000)
+        data = data.ljust(code_offset, b"\0") + code + strtab + symtab
+        data += bytes(64)
+        data += struct.pack("<IIQQQQIIQQ", 0, 2, 0, 0, symtab_offset,
+                            len(symtab), 2, 1, 8, 24)
+        data += struct.pack("<IIQQQQIIQQ", 0, 3, 0, 0, strtab_offset,
+                            len(strtab), 0, 0, 1, 0)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "a.out")
+            with open(path, "wb") as f:
+                f.write(data)
+            sim = Simulator()
+            sim.memory.write(0x11000, 8, -1)
+            elf = sim.load_elf(path)
+
+        self.assertEqual(sim.pc, 0x10080)
+        self.assertEqual(sim.memory.read(0x11000, 8, signed=False), 0)
+        self.assertEqual(elf.symbols["_start"].value, 0x10080)
+        self.assertEqual(elf.symbols["buf"].size, 16)
+        self.assertEqual(elf.symbols[long_name].value, 0x10084)
+        self.assertEqual(elf.symbols["\ufffd"].value, 0x10088)
+        sim.run(until_pc=0x10080 + len(code))
+        self.assertEqual(sim.memory.read(elf.symbols["buf"].value + 8, 8,
+                                         signed=False), 42)
+
+        with self.assertRaises(ValueError):
+            from riscvsim.elf import ElfFile
+            ElfFile(b"\x7fELF" + bytes(60))
+
+        # the mapping of a file which fails to parse is closed
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "a.out")
+            with open(path, "wb") as f:
+                f.write(data[:4] + bytes(60))
+            mappings = []
+            real_mmap = mmap.mmap
+
+            def mapping(*args, **kwargs):
+                mappings.append(real_mmap(*args, **kwargs))
+                return mappings[-1]
+
+            with mock.patch("mmap.mmap", mapping):
+                with self.assertRaises(ValueError):
+                    ElfFile.open(path)
+            self.assertTrue(mappings[0].closed)
+
+
+class TestCache(unittest.TestCase):
+
+    def test_policies(self):
+        # one set of 2 ways: A B A C A
+        a, b, c = 0x000, 0x100, 0x200
+        for policy, hits in [["lru", [False, False, True, False, True]],
+                             ["fifo", [False, False, True, False, False]]]:
+            cache = Cache(32, 2, 16, policy)
+            self.assertEqual([cache.access(_) for _ in (a, b, a, c, a)], hits)
+            self.assertEqual(cache.misses, hits.count(False))
+        cache = Cache(32, 2, 16, "random")
+        for addr in (a, b, a, c, a, b, c):
+            cache.access(addr)
+        self.assertEqual(cache.hits + cache.misses, 7)
+        self.assertEqual(cache.evictions, cache.misses - 2)
+
+    def test_hierarchy(self):
+        l2 = Cache(1024, 2, 16, name="L2")
+        l1 = Cache(64, 1, 16, name="L1", next_level=l2)
+        self.assertFalse(l1.access(0x0f, 2, write=True))   # 2 lines
+        self.assertEqual((l1.misses, l2.misses), (2, 2))
+        self.assertTrue(l1.access(0x04, 4))
+        l1.access(0x40)                     # evicts the dirty line 0x00
+        self.assertEqual((l1.evictions, l1.writebacks), (1, 1))
+        self.assertEqual(l2.hits, 1)        # the write-back
+        self.assertEqual(l1.as_dict()["miss_rate"], 3 / 4)
+
+        with self.assertRaises(ValueError):
+            Cache(1000, 2, 16)
+        with self.assertRaises(ValueError):
+            Cache(1024, 2, 24)
+        with self.assertRaises(ValueError):
+            Cache(1024, 2, 16, "plru")
+
+    def test_simulator(self):
+        text = r"""
+            addi x1, x0, 64
+            loop:
+            ld x2, 0x100(x1)
+            sd x2, 0x200(x1)
+            addi x1, x1, -8
+            bne x1, x0, loop
+            end:
+        """
+        sim = Simulator(pc=0x1000)
+        labels = sim.assemble(text)
+        sim.caches = CacheHierarchy()
+        steps = sim.run(until_pc=labels["end"], translate=True)
+        stats = sim.caches.as_dict()
+        self.assertEqual(stats["L1I"]["hits"] + stats["L1I"]["misses"], steps)
+        self.assertEqual(stats["L1I"]["misses"], 1)
+        # 0x108-0x140 and 0x208-0x240 span 2 lines each
+        self.assertEqual(stats["L1D"]["misses"], 4)
+        self.assertEqual(stats["L1D"]["hits"], 16 - 4)
+        self.assertEqual(stats["L2"]["misses"], 5)
+
+
+class TestPipeline(unittest.TestCase):
+
+    text = r"""
+        addi x1, x0, 0x100
+        ld x2, 0(x1)
+        addi x3, x2, 1
+        addi x4, x0, 2
+        loop:
+        addi x4, x4, -1
+        bne x4, x0, loop
+        end:
+    """
+
+    def test_simulator(self):
+        sim = Simulator(pc=0x1000)
+        labels = sim.assemble(self.text)
+        sim.timing = Pipeline()
+        steps = sim.run(until_pc=labels["end"], translate=True)
+        self.assertEqual((steps, sim.instret), (8, 8))
+        # 4 to fill, 1 load-use, the first bne is mispredicted
+        self.assertEqual(sim.cycle, 8 + 4 + 1 + 2)
+        self.assertEqual(sim.timing.as_dict(), {
+            "instructions": 8,
+            "cycles": 15,
+            "cpi": 15 / 8,
+            "stalls": {"data": 0, "load_use": 1, "branch": 2, "jump": 0},
+        })
+
+        sim = Simulator(pc=0x1000)
+        sim.assemble(self.text + "jal x0, 8")
+        sim.timing = Pipeline(predictor=StaticPredictor(taken=True))
+        sim.run(max_steps=9)
+        self.assertEqual(sim.timing.stalls["branch"], 2)
+        self.assertEqual(sim.timing.stalls["jump"], 1)
+
+    def test_replay(self):
+        sim = Simulator(pc=0x1000)
+        labels = sim.assemble(self.text)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "trace")
+            with TraceWriter(path) as tracer:
+                sim.tracer = tracer
+                sim.run(until_pc=labels["end"])
+            pipeline = Pipeline(forwarding=False)
+            self.assertEqual(replay(read_trace(path), pipeline), 8)
+        # every dependency on the previous 2 instructions waits for WB
+        self.assertEqual(pipeline.stalls,
+                         {"data": 10, "load_use": 0, "branch": 2, "jump": 0})
+        self.assertEqual(pipeline.cycles, 8 + 4 + 10 + 2)
+
+
+class TestPredictor(unittest.TestCase):
+
+    def test_patterns(self):
+        def accuracy(predictor, pattern, n=1000):
+            correct = 0
+            for i in range(n):
+                taken = pattern[i % len(pattern)]
+                correct += predictor.predict(0x1000) == taken
+                predictor.update(0x1000, taken)
+            return correct / n
+
+        self.assertEqual(accuracy(StaticPredictor(), [True, False]), 0.5)
+        self.assertEqual(accuracy(BimodalPredictor(4), [True] * 9 + [False]),
+                         0.9)
+        for pattern in ([True, False], [True, True, False, False, True]):
+            self.assertGreater(accuracy(GsharePredictor(8), pattern), 0.95)
+            self.assertGreater(accuracy(TagePredictor(), pattern), 0.95)
+        with self.assertRaises(ValueError):
+            TagePredictor(tag_bits=16)
+
+    def test_branches(self):
+        text = r"""
+            addi x1, x0, 20
+            outer:
+            addi x2, x0, 3
+            inner:
+            addi x2, x2, -1
+            bne x2, x0, inner
+            addi x1, x1, -1
+            bne x1, x0, outer
+            end:
+        """
+        sim = Simulator(pc=0x1000)
+        labels = sim.assemble(text)
+        sim.branches = BranchPredictors()
+        sim.timing = Pipeline(predictor=GsharePredictor())
+        sim.run(until_pc=labels["end"], translate=True)
+        stats = sim.branches.as_dict()
+        self.assertEqual(stats["branches"], 80)
+        inner = stats["pcs"]["0x100c"]
+        self.assertEqual((inner["count"], inner["taken"]), (60, 40))
+        self.assertEqual(inner["accuracy"]["taken"], 40 / 60)
+        self.assertEqual(stats["pcs"]["0x1014"]["accuracy"]["not_taken"],
+                         1 / 20)
+        accuracy = stats["accuracy"]
+        self.assertEqual(accuracy["taken"], 59 / 80)
+        self.assertGreater(accuracy["gshare"], accuracy["bimodal"])
+        self.assertGreater(accuracy["tage"], accuracy["bimodal"])
+        self.assertEqual(json.loads(sim.branches.to_json()), stats)
+        # the same gshare timed by the pipeline
+        self.assertEqual(sim.timing.stalls["branch"],
+                         round(80 * (1 - accuracy["gshare"])) * 2)
+
+        sim = Simulator(pc=0x1000)
+        sim.assemble(text)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "trace")
+            with TraceWriter(path) as tracer:
+                sim.tracer = tracer
+                sim.run(until_pc=labels["end"])
+            branches = BranchPredictors({"bimodal": BimodalPredictor()})
+            replay(read_trace(path), branches)
+        # the outcome of the last branch of a trace is unknown
+        self.assertEqual(branches.branches, 79)
+        self.assertEqual(branches.as_dict()["pcs"]["0x100c"]["accuracy"],
+                         {"bimodal": inner["accuracy"]["bimodal"]})
+
+
+class TestMachine(unittest.TestCase):
+
+    def test_run(self):
+        machine = Machine(2, pc=0x1000, quantum=1)
+        labels = machine.assemble(r"""
+            bne a0, x0, wait
+            addi x1, x0, 1
+            sd x1, 0x400(x0)
+            jal x0, end
+            wait:
+            ld x2, 0x400(x0)
+            beq x2, x0, wait
+            end:
+        """, 0x1000)
+        steps = machine.run(until_pc=labels["end"], translate=True)
+        hart0, hart1 = machine.harts
+        self.assertEqual((hart0.pc, hart1.pc), (labels["end"],) * 2)
+        self.assertEqual(hart1.x2, 1)
+        self.assertEqual(hart0.instret, 4)
+        self.assertEqual(hart0.instret + hart1.instret, steps)
+        # hart 1 waited while hart 0 stored the flag
+        self.assertGreater(hart1.instret, 3)
+        stats = machine.as_dict()
+        self.assertEqual([_["instret"] for _ in stats["harts"]],
+                         [hart0.instret, hart1.instret])
+        self.assertGreater(stats["run_ns"], 0)
+        self.assertGreater(stats["scheduler_ns"], 0)
+
+        self.assertEqual(machine.run(until_pc=labels["end"]), 0)
+        machine = Machine(2, pc=0x1000)
+        machine.assemble("beq x0, x0, 0", 0x1000)
+        self.assertEqual(machine.run(max_steps=5, quantum=2), 5)
+        self.assertEqual([_.instret for _ in machine.harts], [3, 2])
+        with self.assertRaises(ValueError):
+            Machine(0)
+
+    def test_run_parallel(self):
+        # every hart stores the sum 1..10 plus its index next to the others
+        text = r"""
+            slli x5, a0, 3
+            addi x6, x0, 10
+            addi x7, x0, 0
+            loop:
+            add x7, x7, x6
+            addi x6, x6, -1
+            bne x6, x0, loop
+            add x7, x7, a0
+            sd x7, 0x400(x5)
+            end:
+        """
+        for executor in ("thread", "process"):
+            with self.subTest(executor):
+                machine = Machine(4)
+                labels = machine.assemble(text)
+                steps = machine.run_parallel(until_pc=labels["end"],
+                                             executor=executor, workers=2)
+                self.assertEqual(steps, 4 * 35)
+                self.assertEqual([_.instret for _ in machine.harts],
+                                 [35] * 4)
+                self.assertEqual(
+                    [machine.memory.read(0x400 + 8 * i, 8, signed=False)
+                     for i in range(4)], [55, 56, 57, 58])
+                self.assertEqual(machine.harts[3].x7, 58)
+        with self.assertRaises(ValueError):
+            machine.run_parallel(executor="fiber")
+
+
+class TestSyscalls(unittest.TestCase):
+
+    def test_write_exit(self):
+        text = r"""
+            addi a0, x0, 1
+            lui a1, 2
+            addi a2, x0, 6
+            addi a7, x0, 64     # write(1, 0x2000, 6)
+            ecall
+            addi a0, x0, 3
+            addi a7, x0, 93     # exit(3)
+            exit:
+            ecall
+            addi a0, x0, 9
+        """
+        for mode in ("step", "translate", "profile"):
+            sim = Simulator(pc=0x1000)
+            labels = sim.assemble(text)
+            sim.memory.write_bytes(0x2000, b"hello\n")
+            stdout = io.BytesIO()
+            sim.syscalls = Syscalls(stdout=stdout)
+            if mode == "profile":
+                sim.profile = Profile()
+            translate = mode == "translate"
+            self.assertEqual(sim.run(5, translate=translate), 5, mode)
+            self.assertEqual(sim.a0, 6, mode)
+            # buffered until the exit
+            self.assertEqual(stdout.getvalue(), b"", mode)
+            self.assertEqual(sim.run(translate=translate), 3, mode)
+            self.assertEqual(stdout.getvalue(), b"hello\n", mode)
+            self.assertEqual(sim.exit_code, 3, mode)
+            self.assertEqual(sim.pc, labels["exit"], mode)
+            self.assertEqual(sim.instret, 8, mode)
+            # an exited program does not run again
+            self.assertEqual(sim.run(translate=translate), 0, mode)
+
+        sim = Simulator(pc=0x1000)
+        sim.assemble(text)
+        with self.assertRaises(RuntimeError):
+            sim.run()
+        self.assertEqual(sim.pc, 0x1010)
+
+    def test_exit(self):
+        from riscvsim.batch import run_state
+
+        text = r"""
+            addi a0, a0, 1      # exit(hart + 1)
+            addi a7, x0, 93
+            ecall
+        """
+        machine = Machine(2, pc=0x1000, quantum=2)
+        machine.assemble(text, 0x1000)
+        syscalls = Syscalls(io.BytesIO(), io.BytesIO())
+        for hart in machine.harts:
+            hart.syscalls = syscalls
+        snapshot = machine.harts[0].snapshot()
+        self.assertEqual(machine.run(), 6)
+        self.assertEqual([_.exit_code for _ in machine.harts], [1, 2])
+        self.assertEqual([_.pc for _ in machine.harts], [0x1008, 0x1008])
+        self.assertEqual(machine.run(), 0)
+
+        # the copies run by threads share the handler
+        parallel = Machine(2, pc=0x1000)
+        parallel.assemble(text, 0x1000)
+        for hart in parallel.harts:
+            hart.syscalls = syscalls
+        with self.assertRaisesRegex(ValueError, "'thread'"):
+            parallel.run_parallel(executor="process")
+        self.assertEqual(parallel.run_parallel(), 6)
+        self.assertEqual([_.exit_code for _ in parallel.harts], [1, 2])
+        self.assertEqual(parallel.run_parallel(), 0)
+
+        sim = machine.harts[0]
+        sim.restore(snapshot)
+        self.assertIsNone(sim.exit_code)
+        self.assertIsNone(sim.copy().exit_code)
+        result = run_state(sim, 0, {"a0": 41}, max_steps=None,
+                           until_pc=None, translate=True)
+        self.assertEqual((result.reason, result.steps), ("exit", 3))
+        self.assertEqual(sim.exit_code, 42)
+        self.assertEqual(sim.copy().exit_code, 42)
+
+    def test_calls(self):
+        ecall = InstructionFactory.get("ecall")
+        self.assertEqual(int(ecall), 0x73)
+        self.assertEqual(InstructionFactory.decode(0x73), ecall)
+
+        def call(number, *args):
+            sim.a7 = number
+            for i, arg in enumerate(args):
+                sim.registers.write(10 + i, arg)
+            sim.step(ecall)
+            return sim.registers.read_s(10)
+
+        with tempfile.TemporaryDirectory() as root:
+            sim = Simulator(pc=0x1000)
+            sim.memory.write_bytes(0x1ffc, b"\0" * 4)
+            stdin = io.BufferedReader(io.BytesIO(b"abc"))
+            stdout = io.BytesIO()
+            sim.syscalls = Syscalls(stdin, stdout, root=root, buffer_size=4)
+
+            # read flushes the output first, and is short at the end
+            self.assertEqual(call(64, 1, 0x1ffc, 2), 2)
+            self.assertEqual(stdout.getvalue(), b"")
+            self.assertEqual(call(63, 0, 0x3000, 8), 3)
+            self.assertEqual(stdout.getvalue(), b"\0\0")
+            self.assertEqual(sim.memory.read_bytes(0x3000, 3), b"abc")
+            # a huge count is clamped, stdin is not writable
+            self.assertEqual(call(63, 0, 0x3000, -1), 0)
+            self.assertEqual(call(64, 0, 0x3000, 1), -errno.EBADF)
+            self.assertEqual(call(64, 1, 0x3000, 3), 3)
+            self.assertEqual(call(64, 1, 0x3000, 1), 1)
+            # flushed at `buffer_size`
+            self.assertEqual(stdout.getvalue(), b"\0\0abca")
+
+            # the break starts after the highest page
+            self.assertEqual(call(214, 0), 0x4000)
+            self.assertEqual(call(214, 0x5000), 0x5000)
+            self.assertEqual(call(214, 0x100), 0x5000)
+
+            sim.memory.write_bytes(0x2000, b"out.txt\0../x\0")
+            fd = call(56, -100, 0x2000, 0o101, 0o644)    # O_WRONLY|O_CREAT
+            self.assertEqual(fd, 3)
+            self.assertEqual(call(64, fd, 0x3000, 3), 3)
+            self.assertEqual(call(63, fd, 0x3100, 3), -errno.EBADF)
+            self.assertEqual(call(57, fd), 0)
+            with open(os.path.join(root, "out.txt"), "rb") as f:
+                self.assertEqual(f.read(), b"abc")
+            fd = call(56, -100, 0x2000, 0, 0)
+            self.assertEqual(fd, 3)
+            self.assertEqual(call(63, fd, 0x3100, 16), 3)
+            self.assertEqual(sim.memory.read_bytes(0x3100, 3), b"abc")
+            self.assertEqual(call(64, fd, 0x3000, 3), -errno.EBADF)
+            self.assertEqual(call(57, fd), 0)
+
+            self.assertEqual(call(56, -100, 0x2008, 0, 0), -errno.EACCES)
+            sim.memory.write_bytes(0x2010, b".\0")
+            self.assertEqual(call(56, -100, 0x2010, 0, 0), -errno.EISDIR)
+            self.assertEqual(call(57, fd), -errno.EBADF)
+            self.assertEqual(call(64, 7, 0x3000, 1), -errno.EBADF)
+            self.assertEqual(call(1000), -errno.ENOSYS)
+            self.assertEqual(sim.pc, 0x1000 + 4 * 22)
+
+        # no files without a root, custom calls in the table
+        sim = Simulator()
+        sim.syscalls = Syscalls(io.BytesIO(), io.BytesIO())
+        self.assertEqual(call(56, -100, 0, 0, 0), -errno.EACCES)
+        sim.syscalls.table[1000] = lambda sim, a0, *_: a0 + 1
+        self.assertEqual(call(1000, 41), 42)
+
+        # host write errors go to the guest, and do not stop an exit
+        class Full(io.BytesIO):
+            def write(self, data):
+                raise OSError(errno.ENOSPC, "No space left on device")
+
+        sim = Simulator()
+        sim.syscalls = Syscalls(io.BytesIO(), Full(), buffer_size=2)
+        self.assertEqual(call(64, 1, 0, 1), 1)
+        self.assertEqual(call(64, 1, 0, 1), -errno.ENOSPC)
+        self.assertEqual(call(64, 1, 0, 1), 1)
+        with self.assertRaises(ProgramExit):
+            call(93, 5)
+        self.assertEqual(sim.exit_code, 5)
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_kernels(self):
+        from benchmarks.kernels import kernels
+        for name, cls in kernels.items():
+            for translate in (False, True):
+                with self.subTest(name, translate=translate):
+                    kernel = cls()
+                    sim, end = kernel.prepare(8)
+                    sim.run(until_pc=end, max_steps=10000,
+                            translate=translate)
+                    self.assertEqual(sim.pc, end)
+                    self.assertTrue(kernel.verify(sim, 8))
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_run_batch(self):
+        program = Simulator(pc=0x1000, x5=0x2000)
+        text = [
+            "add x12, x12, x10",    # 0x1000  loop:
+            "addi x11, x11, -1",    # 0x1004
+            "blt x0, x11, -4",      # 0x1008  to loop
+            "sd x12, 0(x5)",        # 0x100c
+            "ld x13, 8(x5)",        # 0x1010
+        ]
+        for i, t in enumerate(text):
+            program.memory.write(0x1000 + 4*i, 4, int(InstructionFactory.get(t)))
+        states = [dict(a0=i, a1=i % 5 + 1, memory={0x2008: bytes([i])})
+                  for i in range(40)]
+        states.append(dict(a1=-1 % (1 << 64), pc=0x100c, x5=-8 % (1 << 64)))
+        states.append(dict(pc=0x1008, x5=-8 % (1 << 64)))
+        states.append(dict(foo=1))
+        states.append(dict(memory={0x100000000: b"x"}))
+
+        results = list(run_batch(program, states, workers=2, until_pc=0x1014,
+                                 max_steps=100))
+        self.assertEqual([_.index for _ in results], list(range(44)))
+        for result, state in zip(results[:40], states):
+            sim = program.copy()
+            for k, v in state.items():
+                if k == "memory":
+                    sim.memory.write_bytes(0x2008, v[0x2008])
+                else:
+                    sim[k] = v
+            steps = sim.run(until_pc=0x1014)
+            self.assertEqual(result.reason, "until_pc")
+            self.assertEqual(result.steps, steps)
+            self.assertEqual(result.registers, tuple(sim.registers.values))
+            self.assertEqual(result.registers[12], state["a0"] * state["a1"])
+            self.assertEqual(result.registers[13], state["a0"])
+            self.assertEqual(result.memory_digest, sim.memory.digest())
+        self.assertTrue(results[-4].reason.startswith("IndexError"))
+        self.assertEqual((results[-4].pc, results[-4].steps), (0x100c, 0))
+        # the branch before the fault is counted
+        self.assertTrue(results[-3].reason.startswith("IndexError"))
+        self.assertEqual((results[-3].pc, results[-3].steps), (0x100c, 1))
+        # malformed states fail alone
+        self.assertTrue(results[-2].reason.startswith("KeyError"))
+        self.assertTrue(results[-1].reason.startswith("IndexError"))
+        self.assertEqual([_.steps for _ in results[-2:]], [0, 0])
+
+
+@unittest.skipUnless(numpy, "numpy is not installed")
+class TestVectorSimulator(unittest.TestCase):
+
+    def test_run(self):
+        from riscvsim.vector import VectorSimulator
+
+        program = Simulator(pc=0x1000, x5=0x2000)
+        text = [
+            "andi x11, x10, 7",     # 0x1000
+            "addi x13, x0, -3",     # 0x1004
+            "beq x11, x0, 14",      # 0x1008  loop: to done
+            "add x12, x12, x10",    # 0x100c
+            "sra x14, x13, x11",    # 0x1010
+            "xori x13, x14, 1234",  # 0x1014
+            "sw x12, 0(x5)",        # 0x1018
+            "addi x11, x11, -1",    # 0x101c
+            "jal x0, -12",          # 0x1020  to loop
+            "lw x15, 0(x5)",        # 0x1024  done:
+            "srli x16, x10, 61",    # 0x1028
+            "bltu x16, x15, 4",     # 0x102c  to 0x1034
+            "slli x17, x10, 3",     # 0x1030
+            "jalr x1, 0(x1)",       # 0x1034
+        ]
+        for i, t in enumerate(text):
+            program.memory.write(0x1000 + 4*i, 4, int(InstructionFactory.get(t)))
+        program.x1 = 0x1038
+
+        rng = random.Random(0)
+        a0 = [rng.getrandbits(64) for _ in range(64)]
+        vsim = VectorSimulator(program, len(a0))
+        vsim["a0"] = numpy.array(a0, dtype=numpy.uint64)
+        steps = vsim.run(until_pc=0x1038)
+        self.assertLessEqual(steps, 3 + 7 * 7 + 7)
+
+        for i, v in enumerate(a0):
+            sim = program.copy()
+            sim.a0 = v
+            sim.run(until_pc=0x1038)
+            lane = vsim.lane(i)
+            self.assertEqual(str(lane), str(sim), f"{i=}")
+
+    def test_word_ops(self):
+        from riscvsim.vector import VectorSimulator
+
+        program = Simulator(pc=0x1000)
+        labels = program.assemble(r"""
+            addw x11, x10, x12
+            subw x13, x12, x10
+            sllw x14, x10, x12
+            srlw x15, x10, x12
+            sraw x16, x10, x12
+            addiw x17, x10, -2000
+            slliw x18, x10, 17
+            srliw x19, x10, 3
+            sraiw x20, x10, 31
+            auipc x21, 0x80000
+            end:
+        """)
+        rng = random.Random(0)
+        a0 = [rng.getrandbits(64) for _ in range(64)]
+        a2 = [rng.getrandbits(64) for _ in range(64)]
+        vsim = VectorSimulator(program, len(a0))
+        vsim["a0"] = numpy.array(a0, dtype=numpy.uint64)
+        vsim["a2"] = numpy.array(a2, dtype=numpy.uint64)
+        vsim.run(until_pc=labels["end"])
+        for i in range(len(a0)):
+            sim = program.copy()
+            sim.a0 = a0[i]
+            sim.a2 = a2[i]
+            sim.run(until_pc=labels["end"])
+            self.assertEqual(str(vsim.lane(i)), str(sim), f"{i=}")
+
 
 if __name__ == "__main__":
     unittest.main(failfast=True)